@@ -1,25 +1,48 @@
 # app/api.py
-from fastapi import FastAPI
+import time
+_T_IMPORT0 = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List, Literal
-import requests, re, json, unicodedata
+from typing import Optional, Dict, List, Literal, NamedTuple, Tuple
+import requests, re, json, csv, io, queue, threading, hashlib
 
 # === Config ===
 from settings import get_settings
 S = get_settings()
 
+# === Métricas / trazas por etapa ===
+import metrics
+from metrics import stage, start_trace, current_trace, note_error, ABSTENTIONS, ANSWERS, LLM_FAILURES, REQUEST_SECONDS
+
 # === Milvus helpers (tus utilidades) ===
-from retrieve import retrieve, list_by_filter, aggregate_prices
+# Importar retrieve es liviano: torch/modelo y pymilvus se cargan en el primer uso o en la precarga
+from retrieve import (
+    retrieve, retrieve_many, list_by_filter, list_page, iter_by_filter, aggregate_prices, check_fields, has_field,
+    rank_by_price, warm_embedder, warm_search_backend, warm_lexical, refresh_lexical,
+    data_version, revalidate_retrieval, cache_stats, SIM_TH,
+)
+import lexical
+from caches import TTLCache
+from warm import CacheWarmer
+from lifecycle import Warmup
+from llm_sched import LLMScheduler, LLMOverloaded, request_class
+from llm_pool import OllamaPool, NoBackendAvailable, get_pool, prefix_key
+import deadline
+from deadline import DeadlineExceeded
+from textnorm import fold
+import profiler
+
+IMPORT_S = round(time.perf_counter() - _T_IMPORT0, 3)
 
 # -----------------------------------------------------------------------------
 # Utilidades de normalización y alias (tildes/mayúsculas → canónico)
 # -----------------------------------------------------------------------------
-def _norm(s: str) -> str:
-    # minúsculas + sin tildes/diacríticos
-    return "".join(c for c in unicodedata.normalize("NFD", s.lower())
-                   if unicodedata.category(c) != "Mn")
+# minúsculas + sin tildes/diacríticos (misma función que genera <campo>_norm en ingesta)
+_norm = fold
 
 COUNTRY_ALIASES = {
     "MX": ["mx", "mexico", "méxico"],
@@ -112,11 +135,57 @@ def sanitize_filters(f: Dict | None) -> Dict:
             out[k] = f[k]
     return out
 
+# -----------------------------------------------------------------------------
+# Serialización JSON rápida (orjson si está instalado)
+# -----------------------------------------------------------------------------
+try:
+    import orjson
+    FastJSONResponse = ORJSONResponse
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+except ImportError:  # fallback: encoder estándar
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+def _json(payload: dict):
+    """
+    Respuesta ya serializada: devolver la instancia evita el paso por
+    jsonable_encoder de FastAPI (recorre fila por fila en Python).
+    """
+    return FastJSONResponse(payload)
+
+def _columnar(rows: List[Dict], fields: List[str]) -> Dict[str, list]:
+    """Formato columnar: un arreglo paralelo por campo en vez de una lista de dicts."""
+    return {f: [r.get(f) for r in rows] for f in fields}
+
+# -----------------------------------------------------------------------------
+# Ciclo de vida: precarga en background (PRELOAD=true) + /ready
+# -----------------------------------------------------------------------------
+warmup = Warmup()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    print(f"[startup] import api en {IMPORT_S}s | preload={S.preload}")
+    if S.preload:
+        warmup.start()  # no bloquea: /health responde mientras se calienta
+    if cache_warmer is not None:
+        # con PRELOAD la primera pasada es el paso "cache_warm" del warmup; sin él la hace este hilo
+        cache_warmer.start(initial=not S.preload)
+    yield
+    warmup.stop()
+    if cache_warmer is not None:
+        cache_warmer.stop()
+
 # -----------------------------------------------------------------------------
 # CORS
 # -----------------------------------------------------------------------------
 
-app = FastAPI(title="RAG Pricing API", version="1.3.0")
+app = FastAPI(title="RAG Pricing API", version="1.3.0", default_response_class=FastJSONResponse,
+              lifespan=lifespan)
 
 # Ahora S.cors_origins ya es lista (gracias a settings.py)
 app.add_middleware(
@@ -127,10 +196,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latencia total por endpoint (solo rutas conocidas, para acotar cardinalidad)
+_ROUTE_PATHS: set = set()
+
+# Log de requests (mismo formato que consume loadgen.py --replay)
+LOGGED_PATHS = {"/ask", "/ask/stream", "/chat", "/chat/stream", "/list", "/aggregate", "/search"}
+DEADLINE_PATHS = LOGGED_PATHS | {"/rank"}
+_log_queue: "queue.SimpleQueue[Tuple[float, str, bytes, int, float]]" = queue.SimpleQueue()
+
+# Requests lentos con su traza por etapa (solo con rutas admin, ver profiler.py)
+slow_log = profiler.SlowLog(S.slow_request_buffer, S.slow_request_ms) if S.enable_admin_routes else None
+
+def _log_line(ts: float, path: str, body: bytes, status: int, latency_s: float) -> Optional[str]:
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return None
+    return json.dumps({"ts": ts, "endpoint": path, "payload": payload,
+                       "status": status, "latency_ms": round(latency_s * 1000.0, 1)}, ensure_ascii=False)
+
+def _log_writer() -> None:
+    # un solo hilo escribe: el event loop solo encola, sin open()/write() bloqueantes
+    with open(S.request_log_path, "a", encoding="utf-8") as f:
+        while True:
+            line = _log_line(*_log_queue.get())
+            if line is not None:
+                f.write(line + "\n")
+            if _log_queue.empty():
+                f.flush()
+
+if S.request_log_path:
+    threading.Thread(target=_log_writer, name="request-log", daemon=True).start()
+
+def _log_request(path: str, body: bytes, status: int, latency_s: float) -> None:
+    _log_queue.put((time.time(), path, body, status, latency_s))
+
+@app.middleware("http")
+async def _request_timer(request: Request, call_next):
+    t0 = time.perf_counter()
+    path = request.url.path
+    # prioridad en la cola del LLM: interactive (default) | batch
+    request_class.set("batch" if request.headers.get("x-request-class", "").lower() == "batch" else "interactive")
+    # deadline: header explícito en cualquier ruta; default solo en las interactivas (no en exportaciones)
+    try:
+        hdr_s = float(request.headers.get("x-request-deadline-ms", "")) / 1000.0
+    except ValueError:
+        hdr_s = 0.0
+    if hdr_s > 0:
+        deadline.start(hdr_s, explicit=True)
+    elif path in DEADLINE_PATHS:
+        deadline.start(S.request_deadline_s or None)
+    trace = start_trace()  # las etapas de cualquier endpoint (sync o streaming) caen en este dict
+    body = await request.body() if S.request_log_path and path in LOGGED_PATHS else None
+    response = await call_next(request)
+
+    def _finish() -> None:
+        latency = time.perf_counter() - t0
+        if slow_log is not None and not path.startswith("/admin"):
+            slow_log.maybe_add(latency * 1000.0, {
+                "ts": time.time(), "path": path, "method": request.method, "status": response.status_code,
+                "request_class": request_class.get(), "stages_ms": trace["stages_ms"], "errors": trace["errors"],
+                **({"body": body[:512].decode("utf-8", "replace")} if body else {}),
+            })
+        if not _ROUTE_PATHS:
+            _ROUTE_PATHS.update(getattr(r, "path", "") for r in app.routes)
+        REQUEST_SECONDS.observe(latency, endpoint=path if path in _ROUTE_PATHS else "other")
+        if body is not None:
+            _log_request(path, body, response.status_code, latency)
+
+    # la latencia se mide al enviar el último chunk: en /chat/stream y /ask/stream el planner,
+    # la búsqueda y el LLM corren dentro del body, después de los headers
+    chunks = response.body_iterator
+
+    async def _timed_body():
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            _finish()
+
+    response.body_iterator = _timed_body()
+    return response
+
+@app.exception_handler(DeadlineExceeded)
+async def _deadline_exceeded(_request: Request, exc: DeadlineExceeded):
+    # vencido antes de tener nada que devolver (p.ej. durante la búsqueda)
+    return FastJSONResponse({"detail": "deadline exceeded", "stage": exc.stage}, status_code=504)
+
 # -----------------------------------------------------------------------------
 # Cliente LLM (Ollama)
 # -----------------------------------------------------------------------------
 class OllamaLLM:
+    """Cliente de generación sobre un OllamaPool (uno o varios backends, ver llm_pool.py)."""
+
     def __init__(
         self,
         model: str,
@@ -139,63 +297,179 @@ class OllamaLLM:
         num_ctx: int = 2048,
         num_predict: int = 256,
         timeout: int = 120,
+        pool: Optional[OllamaPool] = None,
+        tokens_per_s: float = 10.0,
+        ttft_s: float = 1.0,
+        min_tokens: int = 24,
+        cache: Optional[TTLCache] = None,
     ):
         self.model = model
         self.base_url = base_url.rstrip("/")
+        self.pool = pool or OllamaPool([(self.base_url, None)])
         self.temperature = temperature
         self.num_ctx = num_ctx
         self.num_predict = num_predict
         self.timeout = timeout
+        # velocidad estimada (EWMA con lo que reporta Ollama): cuántos tokens caben en el deadline.
+        # La primera medición (warm() o una llamada real) reemplaza la estimación a priori.
+        self.tokens_per_s = tokens_per_s
+        self.ttft_s = ttft_s
+        self.min_tokens = min_tokens
+        self.observed = False
+        # respuestas por prompt: el prompt ya trae la evidencia (precios/ids), un cambio de datos es otra clave
+        self.cache = cache if cache is not None and cache.enabled else None
+
+    def _limits(self, stage_name: str, max_s: Optional[float] = None) -> Tuple[float, int]:
+        """(timeout HTTP, num_predict) según lo que queda del deadline del request."""
+        left = deadline.remaining()
+        if left is None and max_s is None:
+            return self.timeout, self.num_predict
+        left = min(x for x in (left, max_s, self.timeout) if x is not None)
+        if left <= 0:
+            raise deadline.exceeded(stage_name)
+        n = int((left - self.ttft_s) * self.tokens_per_s)
+        if not self.observed:  # estimación a priori: recorta, pero no descarta sin haber medido nunca
+            return left, min(self.num_predict, max(n, self.min_tokens))
+        if n < self.min_tokens:  # no alcanza ni para una respuesta corta
+            raise deadline.exceeded(stage_name)
+        return left, min(self.num_predict, n)
+
+    def _observe(self, data: Dict) -> None:
+        n, dur = data.get("eval_count"), data.get("eval_duration")
+        if n and dur:
+            tps = n / (dur / 1e9)
+            self.tokens_per_s = 0.8 * self.tokens_per_s + 0.2 * tps if self.observed else tps
+        # load_duration no entra: cargar el modelo es una vez por backend (warm()), no por request
+        pre = data.get("prompt_eval_duration")
+        if pre:
+            self.ttft_s = 0.8 * self.ttft_s + 0.2 * pre / 1e9 if self.observed else pre / 1e9
+        self.observed = self.observed or bool(n and dur)
+
+    def _payload(self, prompt: str, stream: bool, temperature: Optional[float] = None,
+                 num_predict: Optional[int] = None) -> Dict:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": self.temperature if temperature is None else temperature,
+                "num_ctx": self.num_ctx,
+                "num_predict": num_predict or self.num_predict,
+            },
+        }
 
-    def generate(self, prompt: str) -> str:
+    def _cache_key(self, prompt: str, kind: str, temperature: Optional[float]) -> Tuple:
+        t = self.temperature if temperature is None else temperature
+        return (self.model, kind, t, hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).hexdigest())
+
+    def generate(self, prompt: str, kind: str = "answer", temperature: Optional[float] = None,
+                 max_s: Optional[float] = None) -> str:
+        """
+        kind: planner | answer (prioridad en llm_scheduler). max_s acota esta llamada además del deadline.
+        LLMOverloaded y DeadlineExceeded suben al caller (ruta degradada / resultado parcial).
+        """
+        key = self._cache_key(prompt, kind, temperature) if self.cache is not None else None
+        if key is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+        # el planner repite el mismo prefijo largo: afinidad al backend con ese KV cache
+        sticky = prefix_key(prompt) if kind == "planner" else None
+        stage_name = f"llm_{kind}"
         try:
-            r = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": self.temperature,
-                        "num_ctx": self.num_ctx,
-                        "num_predict": self.num_predict,
-                    },
-                },
-                timeout=self.timeout,
-            )
-            r.raise_for_status()
-            return (r.json().get("response") or "").strip()
-        except Exception:
+            with llm_scheduler.slot(kind):
+                timeout, num_predict = self._limits(stage_name, max_s)
+                with deadline.guard(stage_name):
+                    data = self.pool.post_json("/api/generate",
+                                               self._payload(prompt, False, temperature, num_predict),
+                                               model=self.model, sticky_key=sticky, timeout=timeout)
+            self._observe(data)
+            txt = (data.get("response") or "").strip()
+        except (LLMOverloaded, DeadlineExceeded):
+            raise
+        except Exception as e:
+            reason = _llm_failure_reason(e)
+            LLM_FAILURES.inc(reason=reason)
+            note_error(f"llm:{reason}")
+            print(f"[llm] fallo en generate ({reason}): {e!r}")
             return ""  # activa abstención
+        if not txt:
+            LLM_FAILURES.inc(reason="empty")
+            note_error("llm:empty")
+        elif key is not None and num_predict >= self.num_predict:  # recortada por el deadline: no se guarda
+            self.cache.put(key, txt)
+        return txt
 
-    def stream(self, prompt: str):
-        r = requests.post(
-            f"{self.base_url}/api/generate",
-            json={
-                "model": self.model,
-                "prompt": prompt,
-                "stream": True,
-                "options": {
-                    "temperature": self.temperature,
-                    "num_ctx": self.num_ctx,
-                    "num_predict": self.num_predict,
-                },
-            },
-            stream=True,
-            timeout=self.timeout,
-        )
-        r.raise_for_status()
-        for line in r.iter_lines():
-            if not line:
-                continue
-            try:
-                chunk = json.loads(line.decode("utf-8"))
-                if "response" in chunk:
-                    yield f"data: {chunk['response']}\n\n"
+    def tokens(self, prompt: str, kind: str = "answer"):
+        """
+        Fragmentos de texto tal cual los emite Ollama. El slot se mantiene mientras dura el streaming;
+        si el deadline vence a mitad de camino se corta y el caller se queda con lo generado.
+        """
+        key = self._cache_key(prompt, kind, None) if self.cache is not None else None
+        if key is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                yield hit
+                return
+        parts: List[str] = []
+        done = False
+        with llm_scheduler.slot(kind):
+            timeout, num_predict = self._limits(f"llm_{kind}")
+            for chunk in self.pool.stream_lines("/api/generate", self._payload(prompt, True, None, num_predict),
+                                                model=self.model, timeout=timeout):
+                if chunk.get("response"):
+                    parts.append(chunk["response"])
+                    yield chunk["response"]
                 if chunk.get("done"):
+                    self._observe(chunk)
+                    done = True
+                if deadline.expired():
+                    deadline.exceeded(f"llm_{kind}")  # solo contabiliza: lo generado se entrega igual
                     break
-            except Exception:
-                continue
+        txt = "".join(parts).strip()
+        if key is not None and done and txt and num_predict >= self.num_predict:
+            self.cache.put(key, txt)
+
+    def stream(self, prompt: str):
+        for tok in self.tokens(prompt):
+            yield f"data: {tok}\n\n"
+
+    def warm(self) -> None:
+        """
+        Carga el modelo en cada backend que lo sirve: la primera request no paga el load.
+        Genera unos pocos tokens para sembrar la velocidad estimada con una medición real.
+        """
+        for b in self.pool.each(self.model):
+            r = requests.post(f"{b.url}/api/generate",
+                              json={"model": self.model, "prompt": "Hola", "stream": False,
+                                    "options": {"num_predict": 8, "num_ctx": self.num_ctx}},
+                              timeout=self.timeout)
+            r.raise_for_status()
+            self._observe(r.json())
+
+def _llm_failure_reason(e: Exception) -> str:
+    if isinstance(e, NoBackendAvailable):
+        return "no_backend"
+    if isinstance(e, requests.Timeout):
+        return "timeout"
+    if isinstance(e, requests.ConnectionError):
+        return "connection"
+    if isinstance(e, requests.HTTPError):
+        return "http"
+    return "error"
+
+# Backends Ollama (OLLAMA_HOSTS; si vacío, solo OLLAMA_HOST)
+ollama_pool = get_pool(S.ollama_hosts, S.ollama_host)
+
+# Cola con prioridades + admisión delante de Ollama (compartida por planner y answer).
+# LLM_MAX_CONCURRENCY es por backend: más cajas de inferencia => más slots.
+llm_scheduler = LLMScheduler(
+    max_concurrency=S.llm_max_concurrency * len(ollama_pool.backends),
+    budgets={"interactive": S.llm_queue_budget_s, "batch": S.llm_batch_queue_budget_s},
+)
+
+# Caché de respuestas del LLM (planner y redacción), ver caches.py
+answer_cache = TTLCache("answer", S.answer_cache_size, S.answer_cache_ttl_s)
 
 # LLM para respuesta (redacción)
 llm = OllamaLLM(
@@ -204,16 +478,39 @@ llm = OllamaLLM(
     temperature=0.1,
     num_ctx=1024,
     num_predict=128,
+    pool=ollama_pool,
+    tokens_per_s=S.llm_tokens_per_s,
+    ttft_s=S.llm_ttft_s,
+    min_tokens=S.llm_min_tokens,
+    cache=answer_cache,
 )
 
+def _backend_series(key: str):
+    return lambda: [({"backend": b["url"]}, b[key] if b[key] is not None else 0) for b in ollama_pool.stats()]
+
+metrics.Callback("rag_llm_backend_outstanding", "Requests en curso por backend Ollama",
+                 _backend_series("outstanding"), labels=("backend",))
+metrics.Callback("rag_llm_backend_healthy", "1 si el backend no está expulsado",
+                 lambda: [({"backend": b["url"]}, int(b["healthy"])) for b in ollama_pool.stats()], labels=("backend",))
+metrics.Callback("rag_llm_backend_requests_total", "Requests por backend Ollama",
+                 _backend_series("requests"), labels=("backend",), kind="counter")
+metrics.Callback("rag_llm_backend_errors_total", "Errores por backend Ollama",
+                 _backend_series("errors"), labels=("backend",), kind="counter")
+metrics.Callback("rag_llm_backend_latency_ewma_seconds", "Latencia EWMA por backend Ollama",
+                 _backend_series("latency_ewma_s"), labels=("backend",))
+
+warmup.add("embedder", warm_embedder)
+warmup.add("search_backend", warm_search_backend)
+warmup.add("ollama", llm.warm)
+if S.lexical_search:
+    warmup.add("lexical", warm_lexical)
+
 # Helper: llamada al LLM con temp=0 para *planner*
 def _llm_json(prompt: str) -> str:
-    old = llm.temperature
-    try:
-        llm.temperature = 0.0
-        return llm.generate(prompt)
-    finally:
-        llm.temperature = old
+    # el planner no puede gastar más de la mitad de lo que queda: Milvus y la respuesta van después
+    left = deadline.remaining()
+    # temperatura por llamada: mutar llm.temperature compartido es una carrera entre hilos
+    return llm.generate(prompt, kind="planner", temperature=0.0, max_s=None if left is None else left / 2)
 
 # -----------------------------------------------------------------------------
 # Raíz / salud
@@ -226,6 +523,22 @@ def root():
 def health():
     return {"ok": True}
 
+@app.get("/ready", tags=["health"])
+def ready():
+    """
+    200 cuando los recursos están calientes; 503 mientras tanto.
+    Sin PRELOAD nada se carga al arrancar: la primera sonda dispara la misma precarga en background
+    (si no, un orquestador que espera /ready antes de mandar tráfico nunca calentaría el nodo).
+    """
+    if not S.preload:
+        warmup.start()
+    body = {"preload": S.preload, "import_s": IMPORT_S, **warmup.report()}
+    return _json(body) if warmup.ready else FastJSONResponse(body, status_code=503)
+
+@app.get("/metrics", tags=["health"], response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/runtime", tags=["health"])
 def runtime():
     return {
@@ -233,8 +546,55 @@ def runtime():
         "ollama_host": S.ollama_host,
         "embed_backend": S.embed_backend,
         "embed_model": S.embed_model,
+        "llm_scheduler": llm_scheduler.snapshot(),
+        "llm_backends": ollama_pool.stats(),
+        "lexical": lexical.current().stats() if lexical.current() is not None else None,
+        "caches": {**cache_stats(), "answer": answer_cache.stats()},
+        "cache_warm": cache_warmer.last_report if cache_warmer is not None else None,
     }
 
+# -----------------------------------------------------------------------------
+# /admin  (diagnóstico en caliente; solo con ENABLE_ADMIN_ROUTES=true)
+# -----------------------------------------------------------------------------
+if S.enable_admin_routes:
+    @app.get("/admin/profile", tags=["admin"], response_class=PlainTextResponse)
+    def admin_profile(seconds: float = 5.0, interval_ms: float = 5.0, idle: bool = False, by_thread: bool = False):
+        """Perfil por muestreo de todos los hilos; collapsed stacks para flamegraph."""
+        if not 0 < seconds <= 60 or not 1 <= interval_ms <= 1000:
+            raise HTTPException(status_code=400, detail="seconds en (0, 60] e interval_ms en [1, 1000]")
+        try:
+            out = profiler.sample(seconds, interval_ms / 1000.0, idle=idle, by_thread=by_thread)
+        except profiler.ProfilerBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return PlainTextResponse(out)
+
+    @app.get("/admin/slow", tags=["admin"])
+    def admin_slow(path: Optional[str] = None, min_ms: float = 0.0, since: Optional[float] = None, limit: int = 50):
+        items = slow_log.query(path=path, min_ms=min_ms, since=since, limit=max(1, min(limit, 1000)))
+        return _json({"threshold_ms": slow_log.threshold_ms, "captured_total": slow_log.seen,
+                      "count": len(items), "items": items})
+
+    @app.delete("/admin/slow", tags=["admin"])
+    def admin_slow_clear():
+        slow_log.clear()
+        return {"ok": True}
+
+    @app.post("/admin/lexical/refresh", tags=["admin"])
+    def admin_lexical_refresh(full: bool = False):
+        """Índice léxico: incremental por last_seen (tras una ingesta) o completo (full=true, recoge bajas)."""
+        if not S.lexical_search:
+            raise HTTPException(status_code=409, detail="LEXICAL_SEARCH desactivado")
+        t0 = time.perf_counter()
+        stats = refresh_lexical(full=full)
+        return {"ok": True, "full": full, "seconds": round(time.perf_counter() - t0, 3), **stats}
+
+    @app.post("/admin/warm", tags=["admin"])
+    def admin_warm():
+        """Revalida y recalienta las cachés desde el log ya mismo (p.ej. al terminar una ingesta)."""
+        if cache_warmer is None:
+            raise HTTPException(status_code=409, detail="sin log para calentar (WARM_LOG_PATH/REQUEST_LOG_PATH)")
+        return _json(cache_warmer.run_once())
+
 # -----------------------------------------------------------------------------
 # /ask  (QA con RAG, read-only)
 # -----------------------------------------------------------------------------
@@ -243,6 +603,7 @@ class AskReq(BaseModel):
     filters: Optional[Dict] = None
     top_k: Optional[int] = None
     abstain_threshold: Optional[float] = None  # por si lo quieres tunear por request
+    deadline_ms: Optional[int] = Field(None, gt=0)  # presupuesto total del request (ver deadline.py)
 
 def _build_ctx(hits: List[Dict], k: int) -> str:
     return "\n".join(
@@ -263,22 +624,100 @@ def _prompt_answer(question: str, ctx: str) -> str:
         "RESPUESTA:"
     )
 
+NO_INFO = "No tengo esa información en la base"
+# Deadline vencido antes de redactar: se devuelve la evidencia sin prosa
+PARTIAL_REPLY = "No alcancé a redactar la respuesta a tiempo; esta es la evidencia encontrada."
+
+# -----------------------------------------------------------------------------
+# Respuestas por plantilla: top-1 inequívoco => precio/tienda/[product_id] sin LLM
+# -----------------------------------------------------------------------------
+def _fmt_price(p: float) -> str:
+    # 23500.0 -> "23.500" ; 3.49 -> "3,49" (formato es-LA)
+    txt = f"{p:,.0f}" if float(p).is_integer() else f"{p:,.2f}"
+    return txt.replace(",", "_").replace(".", ",").replace("_", ".")
+
+def _decisive(hits: List[Dict], question: str) -> Optional[Dict]:
+    """
+    Top-1 si: plantillas activas, score >= TEMPLATE_MIN_SCORE, margen sobre el segundo (o sobre
+    SIM_TH si es el único hit) >= TEMPLATE_MARGIN y los filtros que menciona la pregunta (país/categoría/tienda)
+    coinciden con el hit. Si no, None => redacta el LLM.
+    Hits "match": "lexical" (product_id o nombre exacto, score BM25 y no coseno): inequívoco solo si
+    es la única coincidencia exacta.
+    """
+    if not S.template_answers or not hits:
+        return None
+    top = hits[0]
+    if top.get("match") == "lexical":
+        if len(hits) > 1:
+            return None
+    else:
+        # sin segundo hit el rival es el umbral de retrieval (lo que quedó debajo), no 0.0
+        second = hits[1]["score"] if len(hits) > 1 else SIM_TH
+        if top.get("score", 0.0) < S.template_min_score or top["score"] - second < S.template_margin:
+            return None
+    for k, v in _guess_filters(question).items():
+        if k in top and str(top[k]) != str(v):
+            return None
+    return top
+
+def _describe(h: Dict) -> str:
+    size = f"{h['size']:g}{h['unit']}" if h.get("size") else ""
+    if size and size.lower() in h["name"].lower().replace(" ", ""):
+        size = ""  # el nombre ya trae la presentación ("Atún Van Camps 160g")
+    extra = ", ".join(x for x in (size, h.get("brand")) if x)
+    return f"{h['name']}" + (f" ({extra})" if extra else "")
+
+def _template_answer(h: Dict) -> str:
+    return (f"{_describe(h)} cuesta {_fmt_price(h['price'])} {h['currency']} "
+            f"en {h['store']} ({h['country']}) [{h['product_id']}].")
+
+def _template_compare(a: Dict, b: Dict) -> str:
+    txt = (f"{_describe(a)}: {_fmt_price(a['price'])} {a['currency']} en {a['store']} [{a['product_id']}]. "
+           f"{_describe(b)}: {_fmt_price(b['price'])} {b['currency']} en {b['store']} [{b['product_id']}].")
+    if a["currency"] == b["currency"] and a["price"] != b["price"]:
+        cheap, dear = (a, b) if a["price"] < b["price"] else (b, a)
+        txt += (f" Más barato: {cheap['name']} por {_fmt_price(dear['price'] - cheap['price'])} "
+                f"{cheap['currency']} [{cheap['product_id']}].")
+    return txt
+
 @app.post("/ask", tags=["rag"])
 def ask(req: AskReq):
+    deadline.override(req.deadline_ms / 1000.0 if req.deadline_ms else None)
+    out = _ask(req)
+    if out["answer"] == NO_INFO:
+        ABSTENTIONS.inc(endpoint="/ask")
+    return out
+
+def _ask(req: AskReq) -> dict:
     top_k = req.top_k or getattr(S, "top_k", 5)
 
     # Normaliza filtros por si vienen desde el front con mayúsculas/tildes
     flt = sanitize_filters(req.filters)
 
     # Recupera evidencia (tu retrieve usa Milvus)
-    hits: List[Dict] = retrieve(req.question, flt)
-    if not hits:
+    hits: List[Dict] = retrieve(req.question, flt, topk=top_k)
+    if not hits:  # abstención: ni hits vectoriales sobre SIM_TH ni coincidencia léxica exacta
         return {"answer": "No tengo esa información en la base", "evidence": []}
 
+    top = _decisive(hits, req.question)  # trata aparte los hits "match": "lexical" (score BM25)
+    if top is not None:
+        ANSWERS.inc(endpoint="/ask", path="template")
+        with stage("answer_template"):
+            return {"answer": _template_answer(top), "evidence": [top], "top_k_used": top_k}
+
     ctx = _build_ctx(hits, top_k)
     prompt = _prompt_answer(req.question, ctx)
 
-    txt = llm.generate(prompt)
+    try:
+        with stage("answer_llm"):
+            txt = llm.generate(prompt)
+    except LLMOverloaded:
+        ANSWERS.inc(endpoint="/ask", path="degraded")
+        return {"answer": _template_answer(hits[0]), "evidence": [hits[0]], "top_k_used": top_k, "degraded": True}
+    except DeadlineExceeded:
+        ANSWERS.inc(endpoint="/ask", path="partial")
+        return {"answer": PARTIAL_REPLY, "evidence": hits[:top_k], "top_k_used": top_k, "partial": True}
+    ANSWERS.inc(endpoint="/ask", path="llm")
     ids = re.findall(r"\[(.*?)\]", txt)  # exige citar product_id
     if not txt or not ids:
         return {"answer": "No tengo esa información en la base", "evidence": []}
@@ -294,17 +733,67 @@ def ask(req: AskReq):
 # Streaming (SSE) para UX de chat
 @app.post("/ask/stream", tags=["rag"])
 def ask_stream(req: AskReq):
+    deadline.override(req.deadline_ms / 1000.0 if req.deadline_ms else None)
     top_k = req.top_k or getattr(S, "top_k", 5)
     flt = sanitize_filters(req.filters)
-    hits: List[Dict] = retrieve(req.question, flt)
+    hits: List[Dict] = retrieve(req.question, flt, topk=top_k)
     if not hits:
         def gen_no_data():
             yield "data: No tengo esa información en la base\n\n"
         return StreamingResponse(gen_no_data(), media_type="text/event-stream")
 
+    top = _decisive(hits, req.question)
+    if top is not None:
+        ANSWERS.inc(endpoint="/ask/stream", path="template")
+        answer = _template_answer(top)
+        def gen_template():
+            yield f"data: {answer}\n\n"
+        return StreamingResponse(gen_template(), media_type="text/event-stream")
+
+    fallback = f"data: {_template_answer(hits[0])}\n\n"
+    if llm_scheduler.would_reject("answer"):
+        ANSWERS.inc(endpoint="/ask/stream", path="degraded")
+        return StreamingResponse(iter([fallback]), media_type="text/event-stream")
+
     ctx = _build_ctx(hits, top_k)
     prompt = _prompt_answer(req.question, ctx)
-    return StreamingResponse(llm.stream(prompt), media_type="text/event-stream")
+    ANSWERS.inc(endpoint="/ask/stream", path="llm")
+
+    def gen_llm():
+        try:
+            yield from llm.stream(prompt)
+        except (LLMOverloaded, DeadlineExceeded):  # sin slot o sin tiempo para generar
+            yield fallback
+    return StreamingResponse(gen_llm(), media_type="text/event-stream")
+
+# -----------------------------------------------------------------------------
+# /search  (búsqueda semántica por lotes, sin LLM)
+# -----------------------------------------------------------------------------
+def _fields_or_400(fields: Optional[List[str]]) -> List[str]:
+    try:
+        return check_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class SearchReq(BaseModel):
+    queries: List[str]
+    filters: Optional[Dict] = None
+    top_k: Optional[int] = None
+    fields: Optional[List[str]] = None
+    format: Literal["rows", "columnar"] = "rows"
+
+@app.post("/search", tags=["rag"])
+def search(req: SearchReq):
+    top_k = req.top_k or getattr(S, "top_k", 5)
+    fields = _fields_or_400(req.fields)
+    results = retrieve_many(req.queries, sanitize_filters(req.filters), topk=top_k, fields=fields)
+    if req.format == "columnar":
+        cols = ["score"] + fields
+        return _json({"fields": cols, "results": [
+            {"query": q, "count": len(hits), "columns": _columnar(hits, cols)}
+            for q, hits in zip(req.queries, results)
+        ]})
+    return _json({"results": [{"query": q, "hits": hits} for q, hits in zip(req.queries, results)]})
 
 # -----------------------------------------------------------------------------
 # /list  (consulta directa sin LLM)
@@ -312,12 +801,51 @@ def ask_stream(req: AskReq):
 class ListReq(BaseModel):
     filters: Optional[Dict] = None
     limit: Optional[int] = 100
+    cursor: Optional[str] = None  # next_cursor de la página anterior
+    fields: Optional[List[str]] = None  # proyección, p.ej. ["product_id","price","store"]
+    format: Literal["rows", "columnar"] = "rows"
 
 @app.post("/list", tags=["products"])
 def list_products(req: ListReq):
     lim = max(1, min(req.limit or 100, 1000))
-    rows = list_by_filter(sanitize_filters(req.filters), limit=lim)
-    return {"count": len(rows), "items": rows}
+    fields = _fields_or_400(req.fields)
+    rows, next_cursor = list_page(sanitize_filters(req.filters), limit=lim, cursor=req.cursor, fields=fields)
+    if req.format == "columnar":
+        return _json({"count": len(rows), "fields": fields, "columns": _columnar(rows, fields),
+                      "next_cursor": next_cursor})
+    return _json({"count": len(rows), "items": rows, "next_cursor": next_cursor})
+
+# Exportación completa en streaming (NDJSON/CSV), memoria constante en el servidor
+class ExportReq(BaseModel):
+    filters: Optional[Dict] = None
+    format: Literal["ndjson", "csv"] = "ndjson"
+    output_fields: Optional[List[str]] = None
+    batch_size: Optional[int] = 1000
+
+@app.post("/list/export", tags=["products"])
+def export_products(req: ExportReq):
+    fields = _fields_or_400(req.output_fields)
+    flt = sanitize_filters(req.filters)
+    batches = iter_by_filter(flt, fields=fields, batch_size=req.batch_size or 1000)
+
+    if req.format == "csv":
+        def gen_csv():
+            buf = io.StringIO()
+            w = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+            w.writeheader()
+            for batch in batches:
+                w.writerows(batch)
+                yield buf.getvalue()
+                buf.seek(0); buf.truncate(0)
+            if buf.tell():
+                yield buf.getvalue()  # solo cabecera (resultado vacío)
+        return StreamingResponse(gen_csv(), media_type="text/csv",
+                                 headers={"Content-Disposition": "attachment; filename=products.csv"})
+
+    def gen_ndjson():
+        for batch in batches:
+            yield "".join(_dumps(r) + "\n" for r in batch)
+    return StreamingResponse(gen_ndjson(), media_type="application/x-ndjson")
 
 # -----------------------------------------------------------------------------
 # /aggregate  (min/máx/promedio) — solo lectura
@@ -336,18 +864,41 @@ def aggregate(req: AggregateReq):
             for m in ["min", "max", "avg"]:
                 if m != k and m in g:
                     del g[m]
-    return result
+    return _json(result)
+
+# Top-N más baratos / más caros (sin límite de 1000 filas: heap de N sobre todo el filtro)
+class RankReq(BaseModel):
+    filters: Optional[Dict] = None
+    n: int = 10
+    order: Literal["asc", "desc"] = "asc"          # asc = más baratos
+    by: Literal["price", "unit_price"] = "price"   # unit_price = por kg / L / unidad
+    fields: Optional[List[str]] = None
+    format: Literal["rows", "columnar"] = "rows"
+
+@app.post("/rank", tags=["products"])
+def rank(req: RankReq):
+    fields = _fields_or_400(req.fields)
+    try:
+        rows = rank_by_price(sanitize_filters(req.filters), n=max(1, min(req.n, 1000)),
+                             order=req.order, by=req.by, fields=fields)
+    except ValueError as e:  # unit_price en una colección sin derivados
+        raise HTTPException(status_code=400, detail=str(e))
+    if req.format == "columnar":
+        return _json({"count": len(rows), "order": req.order, "by": req.by, "fields": fields,
+                      "columns": _columnar(rows, fields)})
+    return _json({"count": len(rows), "order": req.order, "by": req.by, "items": rows})
 
 # -----------------------------------------------------------------------------
 # /chat  (Planner → Executor → Answerer). LLM-First + normalización + fallback.
 # -----------------------------------------------------------------------------
 class Plan(BaseModel):
-    intent: Literal["lookup","list","aggregate","compare","count"]
+    intent: Literal["lookup","list","aggregate","compare","count","cheapest","priciest"]
     filters: Optional[Dict] = Field(default_factory=dict)
     product_name: Optional[str] = None
     product_name_b: Optional[str] = None
     group_by: Optional[Literal["store","category","country"]] = None
     operation: Optional[Literal["min","max","avg"]] = None
+    rank_by: Optional[Literal["price","unit_price"]] = None  # cheapest/priciest
     top_k: Optional[int] = 5
     limit: Optional[int] = 100
 
@@ -361,6 +912,21 @@ def _contains_any(nt: str, patterns: List[str]) -> bool:
                 return True
     return False
 
+_RANK_CHEAP  = re.compile(r"\bmas (barat|economic)[oa]s?\b|\b(menor precio|precio mas bajo)\b")
+_RANK_PRICEY = re.compile(r"\bmas car[oa]s?\b|\b(mayor precio|precio mas alto)\b")
+_RANK_N      = re.compile(r"\btop\s*(\d{1,3})\b|\b(\d{1,3})\s+(?:\w+\s+){0,2}mas\s+(?:barat|car|econom)")
+_PER_UNIT    = re.compile(r"\bpor (kilo|kg|litro|lt|unidad)\b|\bprecio unitario\b")
+
+def _rank_params(text: str) -> Tuple[int, str]:
+    """(N, campo) para cheapest/priciest: "los 10 más baratos" -> 10; "por kilo" -> unit_price."""
+    nt = _norm(text)
+    m = _RANK_N.search(nt)
+    if m:
+        n = int(m.group(1) or m.group(2))
+    else:
+        n = 10 if re.search(r"\bmas (barat|car|economic)[oa]s\b", nt) else 1  # plural => varios
+    return max(1, min(n, 1000)), ("unit_price" if _PER_UNIT.search(nt) else "price")
+
 def _classify_intent_heuristic(text: str) -> str:
     nt = _norm(text)
     LIST_SYNS = [
@@ -376,6 +942,8 @@ def _classify_intent_heuristic(text: str) -> str:
     COMPARE_SYNS = ["comparar", "compara", "comparacion", "vs", "contra", "frente a"]
 
     if _contains_any(nt, COMPARE_SYNS): return "compare"
+    if _RANK_CHEAP.search(nt):          return "cheapest"
+    if _RANK_PRICEY.search(nt):         return "priciest"
     if _contains_any(nt, AGG_SYNS):     return "aggregate"
     if _contains_any(nt, LIST_SYNS):    return "list"
     if _contains_any(nt, COUNT_SYNS):   return "count"
@@ -396,7 +964,7 @@ def _guess_filters(text: str) -> Dict:
     return f
 
 def _plan_from_llm(message: str) -> Optional[Plan]:
-    allowed_intents   = ["lookup","list","aggregate","compare","count"]
+    allowed_intents   = ["lookup","list","aggregate","compare","count","cheapest","priciest"]
     allowed_group_by  = ["store","category","country", None]
     allowed_operation = ["min","max","avg", None]
 
@@ -409,6 +977,7 @@ def _plan_from_llm(message: str) -> Optional[Plan]:
             "product_name_b": {"type": ["string","null"]},
             "group_by": {"enum": allowed_group_by},
             "operation": {"enum": allowed_operation},
+            "rank_by": {"enum": ["price","unit_price", None]},
             "top_k": {"type": "integer"},
             "limit": {"type": "integer"}
         },
@@ -428,6 +997,10 @@ def _plan_from_llm(message: str) -> Optional[Plan]:
          {"intent":"aggregate","group_by":"country","filters":{"category":"arroz"}}),
         ("compara leche entera 1l vs arroz blanco 1kg en ecuador",
          {"intent":"compare","product_name":"leche entera 1l","product_name_b":"arroz blanco 1kg","filters":{"country":"EC"}}),
+        ("¿cuál es el arroz más barato por kilo en Jumbo?",
+         {"intent":"cheapest","rank_by":"unit_price","filters":{"store":"Jumbo","category":"arroz"}}),
+        ("los 5 productos más caros de Colombia",
+         {"intent":"priciest","rank_by":"price","filters":{"country":"CO"}}),
     ]
 
     prompt = (
@@ -443,7 +1016,11 @@ def _plan_from_llm(message: str) -> Optional[Plan]:
         f"\n\nUsuario: {message}\nPlan:"
     )
 
-    txt = _llm_json(prompt).strip()
+    try:
+        with stage("planner_llm"):
+            txt = _llm_json(prompt).strip()
+    except (LLMOverloaded, DeadlineExceeded):
+        return None  # cola llena o sin tiempo: planner heurístico
     m = re.search(r"\{.*\}", txt, re.S)
     if not m:
         return None
@@ -461,6 +1038,8 @@ def _plan_from_llm(message: str) -> Optional[Plan]:
 class ChatReq(BaseModel):
     message: str
     limit: Optional[int] = 100
+    timings: bool = False  # incluye desglose de latencia por etapa en la respuesta
+    deadline_ms: Optional[int] = Field(None, gt=0)  # presupuesto total del request (ver deadline.py)
 
 # --- Helper para adjuntar metadata de modelo y plan en todas las respuestas de /chat
 def with_meta(payload: dict, plan: Plan) -> dict:
@@ -478,35 +1057,102 @@ def with_meta(payload: dict, plan: Plan) -> dict:
 
 @app.post("/chat", tags=["chat"])
 def chat(req: ChatReq):
+    deadline.override(req.deadline_ms / 1000.0 if req.deadline_ms else None)
+    t0 = time.perf_counter()
+    trace = current_trace() or start_trace()
+    payload = _chat(req)
+    if str(payload.get("reply", "")).startswith(NO_INFO):
+        ABSTENTIONS.inc(endpoint="/chat")
+    if req.timings:
+        payload["timings"] = {
+            **trace["stages_ms"],
+            "total_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+            "errors": trace["errors"],
+        }
+    with stage("serialize"):
+        return _json(payload)
+
+def _chat(req: ChatReq) -> dict:
     text = req.message.strip()
+    plan = _make_plan(text, req.limit)
+    payload, draft = _execute(plan, text)
+    if draft is None:
+        return payload
+    try:
+        with stage("answer_llm"):
+            txt = llm.generate(draft.prompt)
+    except LLMOverloaded:
+        ANSWERS.inc(endpoint="/chat", path="degraded")
+        return draft.fallback
+    except DeadlineExceeded:
+        return _partial(draft, "/chat")
+    return _finish(draft, txt, "/chat")
 
-    # 1) Planner LLM (JSON) + 2) Heurística + 3) Normalización + Fallback
+# --- Planner: LLM (JSON) + heurística + normalización + fallback
+def _make_plan(text: str, limit: Optional[int]) -> Plan:
     plan = _plan_from_llm(text)
-    heur = _guess_filters(text)
+    with stage("heuristics"):
+        heur = _guess_filters(text)
 
-    if plan:
-        plan.filters = plan.filters or {}
-        for k, v in heur.items():
-            plan.filters.setdefault(k, v)
-        plan.filters = sanitize_filters(plan.filters)
-    else:
-        plan = Plan(
-            intent=_classify_intent_heuristic(text),
-            filters=sanitize_filters(heur),
-            top_k=getattr(S, "top_k", 5),
-            limit=min(max(req.limit or 100, 1), 1000),
-        )
+        if plan:
+            plan.filters = plan.filters or {}
+            for k, v in heur.items():
+                plan.filters.setdefault(k, v)
+            plan.filters = sanitize_filters(plan.filters)
+        else:
+            plan = Plan(
+                intent=_classify_intent_heuristic(text),
+                filters=sanitize_filters(heur),
+                top_k=getattr(S, "top_k", 5),
+                limit=min(max(limit or 100, 1), 1000),
+            )
+    return plan
+
+class _Draft(NamedTuple):
+    """Respuesta que falta redactar con el LLM: prompt, candidatos citables y respuesta degradada."""
+    plan: Plan
+    prompt: str
+    hits: List[Dict]
+    fallback: dict
+
+def _finish(draft: _Draft, txt: str, endpoint: str) -> dict:
+    ANSWERS.inc(endpoint=endpoint, path="llm")
+    ids = re.findall(r"\[(.*?)\]", txt)
+    ev = [h for h in draft.hits if h["product_id"] in ids]
+    if not txt or not ev:
+        return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, draft.plan)
+    return with_meta({"type":"text","reply":txt,"evidence":ev}, draft.plan)
+
+def _partial(draft: _Draft, endpoint: str) -> dict:
+    ANSWERS.inc(endpoint=endpoint, path="partial")
+    return with_meta({"type":"text","reply":PARTIAL_REPLY,"evidence":draft.hits,"partial":True}, draft.plan)
+
+# ---- EXECUTOR ----
+def _execute(plan: Plan, text: str) -> Tuple[dict, Optional[_Draft]]:
+    """(payload final, None) o (payload parcial con la evidencia, _Draft) si falta la redacción del LLM."""
+    if plan.intent in ("cheapest", "priciest"):
+        n, by = _rank_params(text)  # N siempre del texto: el planner pequeño suele inventarlo
+        by = plan.rank_by or by
+        if not has_field(by):  # colección sin derivados de ingesta: por precio
+            by = "price"
+        items = rank_by_price(plan.filters or None, n=n, order="asc" if plan.intent == "cheapest" else "desc", by=by)
+        if not items:
+            return with_meta({"type":"table","reply":NO_INFO,"count":0,"items":[]}, plan), None
+        adj = "baratos" if plan.intent == "cheapest" else "caros"
+        per = " por kg/L/unidad" if by == "unit_price" else ""
+        reply = (f"Este es el más {adj[:-1]}{per}." if len(items) == 1
+                 else f"Estos son los {len(items)} más {adj}{per}.")
+        return with_meta({"type":"table","reply":reply,"count":len(items),"items":items}, plan), None
 
-    # ---- EXECUTOR ----
     if plan.intent == "list":
         items = list_by_filter(plan.filters or None, limit=min(max(plan.limit or 100, 1), 1000))
         if not items:
-            return with_meta({"type":"table","reply":"No tengo esa información en la base","count":0,"items":[]}, plan)
-        return with_meta({"type":"table","reply":f"Encontré {len(items)} producto(s).","count":len(items),"items":items}, plan)
+            return with_meta({"type":"table","reply":"No tengo esa información en la base","count":0,"items":[]}, plan), None
+        return with_meta({"type":"table","reply":f"Encontré {len(items)} producto(s).","count":len(items),"items":items}, plan), None
 
     if plan.intent == "count":
-        items = list_by_filter(plan.filters or None, limit=1000)
-        return with_meta({"type":"text","reply":f"Tengo {len(items)} registro(s) que cumplen ese filtro.","evidence":[]}, plan)
+        items = list_by_filter(plan.filters or None, limit=1000, fields=["product_id"])
+        return with_meta({"type":"text","reply":f"Tengo {len(items)} registro(s) que cumplen ese filtro.","evidence":[]}, plan), None
 
     if plan.intent == "aggregate":
         if not plan.group_by:
@@ -516,21 +1162,26 @@ def chat(req: ChatReq):
             elif "pais" in nt: plan.group_by = "country"
         agg = aggregate_prices(plan.filters or None, by=plan.group_by)
         if not agg.get("groups"):
-            return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan)
+            return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan), None
         if plan.operation:
             for g in agg["groups"]:
                 for m in ["min","max","avg"]:
                     if m != plan.operation and m in g:
                         del g[m]
-        return with_meta({"type":"aggregate","reply":"Resumen de precios.","result":agg}, plan)
+        return with_meta({"type":"aggregate","reply":"Resumen de precios.","result":agg}, plan), None
 
     if plan.intent == "compare":
         if not (plan.product_name and plan.product_name_b):
-            return with_meta({"type":"text","reply":"Necesito dos productos para comparar.","evidence":[]}, plan)
-        hits_a = retrieve(plan.product_name, plan.filters or None)[:3]
-        hits_b = retrieve(plan.product_name_b, plan.filters or None)[:3]
+            return with_meta({"type":"text","reply":"Necesito dos productos para comparar.","evidence":[]}, plan), None
+        hits_a = retrieve(plan.product_name, plan.filters or None, topk=3)
+        hits_b = retrieve(plan.product_name_b, plan.filters or None, topk=3)
         if not hits_a or not hits_b:
-            return with_meta({"type":"text","reply":"No tengo esa información en la base para comparar.","evidence":[]}, plan)
+            return with_meta({"type":"text","reply":"No tengo esa información en la base para comparar.","evidence":[]}, plan), None
+        top_a, top_b = _decisive(hits_a, plan.product_name), _decisive(hits_b, plan.product_name_b)
+        if top_a is not None and top_b is not None and top_a["product_id"] != top_b["product_id"]:
+            ANSWERS.inc(endpoint="/chat", path="template")
+            with stage("answer_template"):
+                return with_meta({"type":"text","reply":_template_compare(top_a, top_b),"evidence":[top_a, top_b]}, plan), None
         ctx_lines = []
         for h in hits_a[:2] + hits_b[:2]:
             ctx_lines.append(f"[{h['product_id']}] {h['name']} | {h['price']} {h['currency']} | {h['store']} | {h['country']}")
@@ -540,19 +1191,26 @@ def chat(req: ChatReq):
             "Responde en español y cita [product_id].\n\n"
             f"CONTEXTO:\n{chr(10).join(ctx_lines)}\n\nPREGUNTA: {text}\nRESPUESTA:"
         )
-        txt = llm.generate(prompt)
-        ids = re.findall(r"\[(.*?)\]", txt)
-        ev = [h for h in (hits_a + hits_b) if h["product_id"] in ids]
-        if not txt or not ev:
-            return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan)
-        return with_meta({"type":"text","reply":txt,"evidence":ev}, plan)
+        a, b = hits_a[0], hits_b[0]
+        if a["product_id"] == b["product_id"]:
+            fallback = with_meta({"type":"text","reply":NO_INFO,"evidence":[],"degraded":True}, plan)
+        else:
+            fallback = with_meta({"type":"text","reply":_template_compare(a, b),"evidence":[a, b],"degraded":True}, plan)
+        hits = hits_a + hits_b
+        return with_meta({"type":"text","evidence":hits}, plan), _Draft(plan, prompt, hits, fallback)
 
     # default: lookup
+    top_k = plan.top_k or getattr(S, "top_k", 5)
     hits = retrieve(text if not plan.product_name else plan.product_name,
-                    plan.filters or None)[: plan.top_k or getattr(S, "top_k", 5)]
+                    plan.filters or None, topk=top_k)
     if not hits:
-        return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan)
-    ctx = _build_ctx(hits, plan.top_k or getattr(S, "top_k", 5))
+        return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan), None
+    top = _decisive(hits, text)
+    if top is not None:
+        ANSWERS.inc(endpoint="/chat", path="template")
+        with stage("answer_template"):
+            return with_meta({"type":"text","reply":_template_answer(top),"evidence":[top]}, plan), None
+    ctx = _build_ctx(hits, top_k)
     prompt = (
         "Eres un asistente de retail. SOLO puedes usar el CONTEXTO.\n"
         "Si el CONTEXTO no contiene la respuesta exacta, responde exactamente:\n"
@@ -560,9 +1218,103 @@ def chat(req: ChatReq):
         "Responde en español y cita [product_id].\n\n"
         f"CONTEXTO:\n{ctx}\n\nPREGUNTA: {text}\nRESPUESTA:"
     )
-    txt = llm.generate(prompt)
-    ids = re.findall(r"\[(.*?)\]", txt)
-    ev = [h for h in hits if h["product_id"] in ids]
-    if not txt or not ev:
-        return with_meta({"type":"text","reply":"No tengo esa información en la base","evidence":[]}, plan)
-    return with_meta({"type":"text","reply":txt,"evidence":ev}, plan)
+    fallback = with_meta({"type":"text","reply":_template_answer(hits[0]),"evidence":[hits[0]],"degraded":True}, plan)
+    return with_meta({"type":"text","evidence":hits}, plan), _Draft(plan, prompt, hits, fallback)
+
+# -----------------------------------------------------------------------------
+# /chat/stream  (SSE con eventos por etapa)
+#   event: plan      -> intent + filtros, apenas responde el planner
+#   event: rows      -> filas de tabla (list/cheapest/priciest) en cuanto responde Milvus
+#   event: evidence  -> candidatos recuperados antes de redactar (lookup/compare)
+#   event: token     -> fragmentos de la respuesta del LLM
+#   event: done      -> payload final, mismo formato que /chat
+#   event: error     -> deadline vencido antes de tener evidencia
+# -----------------------------------------------------------------------------
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.post("/chat/stream", tags=["chat"])
+def chat_stream(req: ChatReq):
+    deadline.override(req.deadline_ms / 1000.0 if req.deadline_ms else None)
+    text = req.message.strip()
+
+    def gen():
+        t0 = time.perf_counter()
+        # la del middleware: un set() aquí no sobrevive entre iteraciones (cada next() copia el contexto)
+        trace = current_trace() or start_trace()
+        plan = _make_plan(text, req.limit)
+        yield _sse("plan", with_meta({}, plan)["planner"])
+
+        try:
+            payload, draft = _execute(plan, text)
+        except DeadlineExceeded as e:  # los headers ya salieron: se avisa por evento
+            yield _sse("error", {"detail": "deadline exceeded", "stage": e.stage})
+            return
+        if draft is None:
+            if payload.get("type") == "table" and payload.get("items"):
+                yield _sse("rows", {"count": payload["count"], "items": payload["items"]})
+        else:
+            yield _sse("evidence", {"evidence": draft.hits})
+            if llm_scheduler.would_reject("answer"):
+                ANSWERS.inc(endpoint="/chat/stream", path="degraded")
+                payload = draft.fallback
+            else:
+                parts: List[str] = []
+                try:
+                    with stage("answer_llm"):
+                        for tok in llm.tokens(draft.prompt):
+                            parts.append(tok)
+                            yield _sse("token", {"text": tok})
+                    txt = "".join(parts).strip()
+                    if deadline.expired() and not re.search(r"\[(.*?)\]", txt):  # cortado antes de citar
+                        payload = _partial(draft, "/chat/stream")
+                    else:
+                        payload = _finish(draft, txt, "/chat/stream")
+                except LLMOverloaded:  # el slot no llegó dentro del presupuesto
+                    ANSWERS.inc(endpoint="/chat/stream", path="degraded")
+                    payload = draft.fallback
+                except DeadlineExceeded:
+                    payload = _partial(draft, "/chat/stream")
+                except Exception as e:
+                    reason = _llm_failure_reason(e)
+                    LLM_FAILURES.inc(reason=reason)
+                    note_error(f"llm:{reason}")
+                    print(f"[llm] fallo en stream ({reason}): {e!r}")
+                    payload = with_meta({"type":"text","reply":NO_INFO,"evidence":[]}, plan)
+
+        if str(payload.get("reply", "")).startswith(NO_INFO):
+            ABSTENTIONS.inc(endpoint="/chat/stream")
+        if req.timings:
+            payload["timings"] = {
+                **trace["stages_ms"],
+                "total_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                "errors": trace["errors"],
+            }
+        yield _sse("done", payload)
+
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# -----------------------------------------------------------------------------
+# Calentamiento de cachés desde el log de requests (warm.py)
+# -----------------------------------------------------------------------------
+WARM_LOG = S.warm_log_path or S.request_log_path
+cache_warmer = CacheWarmer(
+    runners={
+        "ask": lambda p: _ask(AskReq(**p)),
+        "chat": lambda p: _chat(ChatReq(**p)),
+        "search": lambda p: search(SearchReq(**p)),
+    },
+    version=data_version,
+    revalidate=revalidate_retrieval,
+    log_path=WARM_LOG,
+    top_n=S.warm_top_n,
+    max_lines=S.warm_max_lines,
+    budget_s=S.warm_budget_s,
+    check_s=S.warm_check_s,
+) if WARM_LOG and S.warm_top_n > 0 else None
+
+# solo con PRELOAD: sin él /ready también dispara el warmup, y la primera pasada ya la hace el hilo
+# del warmer (cache_warmer.start(initial=True) en lifespan); registrarla aquí la repetiría
+if cache_warmer is not None and S.preload:
+    warmup.add("cache_warm", cache_warmer.run_once)
@@ -0,0 +1,219 @@
+# bulk_ingest.py — Re-indexado completo vía archivos columnares + Milvus bulk_insert
+# En vez de upserts gRPC de 512 filas (ingest.py), escribe un archivo por columna (NumPy)
+# o Parquet por parte, los sube al object store de Milvus, lanza do_bulk_insert por parte,
+# espera los jobs y construye el índice UNA vez al final (segmentos grandes, sin compactar).
+#
+#   python bulk_ingest.py --csv ../sample.csv ../sample_extra_latam.csv --drop
+#   python bulk_ingest.py --csv feed.csv --format parquet --rows-per-file 1000000
+#
+# Object store (BULK_STORE):
+#   minio  -> bucket de Milvus en el MinIO del docker-compose (MINIO_ENDPOINT, puerto 9000 expuesto)
+#   local  -> copia a BULK_LOCAL_ROOT; sirve con Milvus en storageType=local o para probar en seco
+
+import os, time, shutil, argparse
+from typing import Dict, List
+
+import numpy as np
+
+from ingest import (
+    MILVUS_COLLECTION, EMBED_BACKEND, EMBED_MODEL, FIELD_ORDER,
+    read_csv_rows, embed_texts, ensure_connection, ensure_collection, build_index,
+)
+
+BULK_STORE      = os.getenv("BULK_STORE", "minio").lower()
+BULK_LOCAL_ROOT = os.getenv("BULK_LOCAL_ROOT", "data/bulk")
+MINIO_ENDPOINT  = os.getenv("MINIO_ENDPOINT", "127.0.0.1:9000")
+MINIO_ACCESS    = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET    = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+MINIO_BUCKET    = os.getenv("MINIO_BUCKET", "a-bucket")  # bucket por defecto de Milvus standalone
+
+# ========= Columnas =========
+STR_FIELDS   = ["product_id", "name", "brand", "category", "store", "country", "unit", "currency", "url",
+                "canonical_text", "name_norm", "brand_norm", "store_norm", "unit_base"]
+FLOAT_FIELDS = ["price", "size", "unit_price"]
+
+def to_columns(rows: List[Dict], vecs: np.ndarray) -> Dict[str, np.ndarray]:
+    """Mismo orden/campos que to_data_lists(), pero como arrays contiguos (vectores float32 [n, dim])."""
+    cols: Dict[str, np.ndarray] = {}
+    for f in STR_FIELDS:
+        cols[f] = np.array([str(r.get(f) or "") for r in rows], dtype=str)
+    for f in FLOAT_FIELDS:
+        cols[f] = np.array([float(r.get(f) or 0.0) for r in rows], dtype=np.float64)
+    cols["last_seen"] = np.array([int(r["last_seen"]) for r in rows], dtype=np.int64)
+    cols["embedding"] = np.ascontiguousarray(vecs, dtype=np.float32)
+    return {f: cols[f] for f in FIELD_ORDER}
+
+def write_numpy(cols: Dict[str, np.ndarray], out_dir: str) -> List[str]:
+    """Formato NumPy de bulk_insert: un <campo>.npy por columna en la misma carpeta."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for f, arr in cols.items():
+        p = os.path.join(out_dir, f"{f}.npy")
+        np.save(p, arr)
+        paths.append(p)
+    return paths
+
+def write_parquet(cols: Dict[str, np.ndarray], out_dir: str) -> List[str]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("--format parquet requiere pyarrow (pip install pyarrow)") from e
+    os.makedirs(out_dir, exist_ok=True)
+    arrays = {}
+    for f, arr in cols.items():
+        if f == "embedding":
+            # Lista de tamaño fijo: sin offsets int32, que desbordan con n*dim > 2^31
+            arrays[f] = pa.FixedSizeListArray.from_arrays(pa.array(arr.reshape(-1)), arr.shape[1])
+        else:
+            arrays[f] = pa.array(arr)
+    p = os.path.join(out_dir, "part.parquet")
+    pq.write_table(pa.table(arrays), p)
+    return [p]
+
+WRITERS = {"numpy": write_numpy, "parquet": write_parquet}
+
+# ========= Object store =========
+class LocalStore:
+    """Stand-in de filesystem: copia los archivos bajo root/<key>."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def put(self, path: str, key: str) -> str:
+        dst = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copyfile(path, dst)
+        return key
+
+class MinioStore:
+    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket: str, secure: bool = False):
+        try:
+            from minio import Minio
+        except ImportError as e:
+            raise RuntimeError("BULK_STORE=minio requiere el paquete minio (pip install minio)") from e
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+        self.bucket = bucket
+        if not self.client.bucket_exists(bucket):
+            self.client.make_bucket(bucket)
+
+    def put(self, path: str, key: str) -> str:
+        self.client.fput_object(self.bucket, key, path)
+        return key
+
+def make_store(kind: str):
+    if kind == "local":
+        return LocalStore(BULK_LOCAL_ROOT)
+    if kind == "minio":
+        return MinioStore(MINIO_ENDPOINT, MINIO_ACCESS, MINIO_SECRET, MINIO_BUCKET)
+    raise ValueError(f"BULK_STORE desconocido: {kind}")
+
+# ========= Preparación de archivos =========
+def embed_matrix(texts: List[str], batch: int) -> np.ndarray:
+    parts = []
+    for i in range(0, len(texts), batch):
+        vecs, _ = embed_texts(texts[i:i + batch])
+        parts.append(np.asarray(vecs, dtype=np.float32))
+    return np.concatenate(parts) if parts else np.zeros((0, 0), np.float32)
+
+def prepare_parts(rows: List[Dict], fmt: str, workdir: str, prefix: str, store,
+                  rows_per_file: int, embed_batch: int):
+    """Escribe y sube una parte cada rows_per_file filas. Devuelve ([[keys de la parte], ...], dim)."""
+    parts, dim = [], 0
+    for n, i in enumerate(range(0, len(rows), rows_per_file)):
+        chunk = rows[i:i + rows_per_file]
+        vecs = embed_matrix([r["canonical_text"] for r in chunk], embed_batch)
+        dim = vecs.shape[1]
+        part = f"part-{n:05d}"
+        local = WRITERS[fmt](to_columns(chunk, vecs), os.path.join(workdir, prefix, part))
+        parts.append([store.put(p, f"{prefix}/{part}/{os.path.basename(p)}") for p in local])
+        print(f"[BULK] {part}: {len(chunk)} filas -> {len(local)} archivo(s)")
+    return parts, dim
+
+# ========= bulk_insert =========
+def run_import(collection: str, parts: List[List[str]], poll_s: float = 2.0, timeout_s: float = 3600.0) -> int:
+    """Lanza un job por parte y espera a que todos terminen. Devuelve filas importadas."""
+    from pymilvus import utility, BulkInsertState
+
+    tasks = {utility.do_bulk_insert(collection_name=collection, files=files): files for files in parts}
+    print(f"[BULK] {len(tasks)} job(s) de bulk_insert: {list(tasks)}")
+    done_states = {BulkInsertState.ImportPersisted, BulkInsertState.ImportCompleted}
+    fail_states = {BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned}
+    pending, rows, t0 = set(tasks), 0, time.time()
+    while pending:
+        if time.time() - t0 > timeout_s:
+            raise TimeoutError(f"bulk_insert sin terminar tras {timeout_s}s: {sorted(pending)}")
+        time.sleep(poll_s)
+        for tid in sorted(pending):
+            st = utility.get_bulk_insert_state(task_id=tid)
+            if st.state in fail_states:
+                raise RuntimeError(f"bulk_insert {tid} falló ({tasks[tid][0]}…): {st.failed_reason}")
+            if st.state in done_states:
+                pending.discard(tid)
+                rows += st.row_count
+                print(f"[BULK] job {tid} {st.state_name}: {st.row_count} filas")
+            else:
+                print(f"[BULK] job {tid} {st.state_name} {st.progress}%")
+    return rows
+
+def finalize(col, timeout_s: float = 3600.0) -> None:
+    """Índice una sola vez sobre los segmentos importados, y load."""
+    from pymilvus import utility
+    if not col.has_index():
+        build_index(col)
+    utility.wait_for_index_building_complete(col.name, timeout=timeout_s)
+    col.load()
+
+# ========= Main =========
+def main():
+    ap = argparse.ArgumentParser(description="Re-indexado completo CSV -> archivos columnares -> Milvus bulk_insert")
+    ap.add_argument("--csv", nargs="+", required=True, help="Uno o más CSV del feed")
+    ap.add_argument("--format", choices=list(WRITERS), default="numpy")
+    ap.add_argument("--store", choices=["minio", "local"], default=BULK_STORE)
+    ap.add_argument("--collection", default=MILVUS_COLLECTION)
+    ap.add_argument("--rows-per-file", type=int, default=1_000_000, help="Filas por parte / job de bulk_insert")
+    ap.add_argument("--embed-batch", type=int, default=256)
+    ap.add_argument("--workdir", default="data/bulk_work", help="Carpeta local para los archivos generados")
+    ap.add_argument("--prefix", default=None, help="Prefijo en el store (default: bulk/<timestamp>)")
+    ap.add_argument("--drop", action="store_true", help="Borrar y recrear la colección (bulk_insert no deduplica)")
+    ap.add_argument("--prepare-only", action="store_true", help="Solo escribir/subir archivos, sin Milvus")
+    ap.add_argument("--timeout", type=float, default=3600.0)
+    args = ap.parse_args()
+
+    prefix = args.prefix or f"bulk/{int(time.time())}"
+    print(f"[CFG] Col: {args.collection} | formato={args.format} store={args.store} prefix={prefix}")
+    print(f"[CFG] Embeddings: backend={EMBED_BACKEND} model={EMBED_MODEL}")
+
+    t0 = time.time()
+    rows: List[Dict] = []
+    for p in args.csv:
+        rows.extend(read_csv_rows(p))
+    if not rows:
+        print("No se leyeron filas de los CSV.")
+        return
+    store = make_store(args.store)
+    parts, dim = prepare_parts(rows, args.format, args.workdir, prefix, store,
+                               args.rows_per_file, args.embed_batch)
+    t_prep = time.time() - t0
+    print(f"[BULK] {len(rows)} filas en {len(parts)} parte(s), dim={dim} ({t_prep:.1f}s)")
+    if args.prepare_only:
+        return
+
+    from pymilvus import utility
+    ensure_connection()
+    if args.drop and utility.has_collection(args.collection):
+        utility.drop_collection(args.collection)
+        print(f"[MILVUS] Colección '{args.collection}' eliminada")
+    col = ensure_collection(dim, create_index=False, name=args.collection)
+
+    t1 = time.time()
+    n = run_import(args.collection, parts, timeout_s=args.timeout)
+    t_imp = time.time() - t1
+    t2 = time.time()
+    finalize(col, timeout_s=args.timeout)
+    t_idx = time.time() - t2
+    print(f"[OK] {n} filas en '{args.collection}' | preparar={t_prep:.1f}s import={t_imp:.1f}s "
+          f"índice+load={t_idx:.1f}s total={time.time() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# caches.py — Cachés en proceso: LRU acotada + TTL + versión de datos
+#   retrieval  (retrieve.py)  hits por (pregunta normalizada, filtros, top_k, umbral, campos)
+#   answer     (api.py)       texto del LLM por (modelo, tipo, temperatura, hash del prompt)
+#
+# Una entrada guarda la versión de datos con la que se llenó (max last_seen conocido, ver
+# retrieve.data_version). Si el catálogo avanzó, la entrada deja de servirse hasta que warm.py
+# la revalida (evidencia sin cambios => se re-etiqueta) o la recalcula.
+# El prompt del LLM ya lleva precios e ids: la caché de respuestas no necesita versión.
+
+import threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from metrics import CACHE_REQUESTS
+
+class TTLCache:
+    def __init__(self, name: str, capacity: int, ttl_s: float):
+        self.name = name
+        self.capacity = max(0, int(capacity))
+        self.ttl_s = ttl_s
+        self._items: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()  # valor, versión, t
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def get(self, key: Hashable, version: int = 0) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self.ttl_s and now - item[2] > self.ttl_s:
+                del self._items[key]
+                item = None
+            if item is None:
+                result, value = "miss", None
+            elif item[1] < version:
+                result, value = "stale", None  # se queda: warm.py la revalida
+            else:
+                self._items.move_to_end(key)
+                result, value = "hit", item[0]
+        CACHE_REQUESTS.inc(cache=self.name, result=result)
+        return value
+
+    def put(self, key: Hashable, value: Any, version: int = 0) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._items[key] = (value, version, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def stale(self, version: int) -> List[Tuple[Hashable, Any, int]]:
+        """Entradas llenadas con una versión anterior: (clave, valor, versión)."""
+        with self._lock:
+            return [(k, v, ver) for k, (v, ver, _) in self._items.items() if ver < version]
+
+    def retag(self, key: Hashable, version: int) -> None:
+        """Evidencia sin cambios: la entrada vuelve a servirse con la versión nueva (sin renovar el TTL)."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items[key] = (item[0], version, item[2])
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._items), "capacity": self.capacity, "ttl_s": self.ttl_s}
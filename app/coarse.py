@@ -0,0 +1,214 @@
+# coarse.py — Búsqueda en dos etapas: código compacto + re-rank exacto en float32
+# El índice vectorial en memoria cuesta ~3 KB/producto (768 float32) más el grafo. Aquí:
+#   - binary: signo por dimensión, 768 bits = 96 B/producto (32x menos), distancia HAMMING
+#   - sq8:    int8 por dimensión con escala por dimensión, 768 B/producto (4x menos), IP aproximado
+# Se buscan `topk * COARSE_OVERSAMPLE` candidatos con el código y se re-ordenan por IP exacto
+# contra los vectores float (Milvus por pk o la réplica mmap de local_index.py).
+#
+# Milvus 2.3 admite un solo campo vectorial por colección: el código binario vive en una colección
+# compañera `coarse_<colección>` (pk + columnas de filtro + BINARY_VECTOR con BIN_IVF_FLAT).
+# Con reindex.py cada versión tiene la suya y `coarse_<alias>` sigue al alias en el switch.
+# sq8 no tiene tipo vectorial en Milvus 2.3: solo existe en la réplica local.
+#
+#   python coarse.py build                         # compañera desde la colección existente
+#   python coarse.py bench --backend local --queries 200 --k 10 --oversample 10
+
+import argparse, time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PREFIX = "coarse_"
+CODE_FIELD = "code"
+# Columnas de filtro que replica la compañera (mismos nombres que usa retrieve.build_expr)
+FILTER_FIELDS = ("country", "category", "name_norm", "brand_norm", "store_norm")
+KINDS = ("binary", "sq8")
+MAX_CANDIDATES = 16384  # tope de `limit` en search() de Milvus
+
+def coarse_name(collection: str) -> str:
+    return f"{PREFIX}{collection}"
+
+# =============================================================================
+# Códigos
+# =============================================================================
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def binarize(vecs) -> np.ndarray:
+    """Signo por dimensión empaquetado en bits: uint8 [n, dim/8]."""
+    return np.packbits(np.asarray(vecs, dtype=np.float32) > 0, axis=1)
+
+def hamming(codes: np.ndarray, qcode: np.ndarray) -> np.ndarray:
+    x = np.bitwise_xor(codes, qcode)
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0: popcount nativo, por palabras de 64 bits si cuadra
+        if x.shape[1] % 8 == 0:
+            x = x.view(np.uint64)
+        return np.bitwise_count(x).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[x].sum(axis=1, dtype=np.int32)
+
+def sq8_scale(vecs) -> np.ndarray:
+    """Escala simétrica por dimensión (max |x| / 127)."""
+    m = np.zeros(np.asarray(vecs[:1]).shape[1], dtype=np.float32)
+    for s0 in range(0, len(vecs), 65536):
+        m = np.maximum(m, np.abs(np.asarray(vecs[s0:s0 + 65536], dtype=np.float32)).max(axis=0))
+    return np.maximum(m, 1e-12) / 127.0
+
+def sq8_encode(vecs, scale: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(np.asarray(vecs, dtype=np.float32) / scale), -127, 127).astype(np.int8)
+
+def coarse_scores(kind: str, codes: np.ndarray, q: np.ndarray, scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """Mayor = más parecido (hamming se niega para compartir el orden con IP)."""
+    if kind == "binary":
+        return -hamming(codes, binarize(q[None, :])[0]).astype(np.float32)
+    return np.einsum("ij,j->i", codes, q * scale, dtype=np.float32)  # sin copia float del bloque int8
+
+def rerank(q: np.ndarray, ids: Sequence, vecs: np.ndarray, topk: int, sim_th: float) -> List[Tuple[object, float]]:
+    """IP exacto sobre los candidatos: [(id, score)] ordenado, score >= sim_th."""
+    if not len(ids):
+        return []
+    sc = np.asarray(vecs, dtype=np.float32) @ q
+    order = np.argsort(-sc)[:topk]
+    return [(ids[i], float(sc[i])) for i in order if sc[i] >= sim_th]
+
+# =============================================================================
+# Colección compañera en Milvus (pymilvus se importa solo aquí)
+# =============================================================================
+def ensure_coarse_collection(name: str, dim: int, nlist: int = 1024):
+    from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, utility
+    if utility.has_collection(name):
+        return Collection(name)
+    fields = [FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=128, is_primary=True, auto_id=False)]
+    fields += [FieldSchema(name=f, dtype=DataType.VARCHAR, max_length=512) for f in FILTER_FIELDS]
+    fields.append(FieldSchema(name=CODE_FIELD, dtype=DataType.BINARY_VECTOR, dim=dim))
+    col = Collection(name=name, schema=CollectionSchema(fields, description=f"Código binario (signo) de {dim} bits"))
+    col.create_index(CODE_FIELD, {"index_type": "BIN_IVF_FLAT", "metric_type": "HAMMING", "params": {"nlist": nlist}})
+    return col
+
+def insert_coarse(col, rows: List[Dict], vecs, batch_size: int = 2048) -> int:
+    codes = binarize(vecs)
+    for i in range(0, len(rows), batch_size):
+        chunk = rows[i:i + batch_size]
+        data = [[str(r["product_id"]) for r in chunk]]
+        data += [[str(r.get(f) or "") for r in chunk] for f in FILTER_FIELDS]
+        data.append([bytes(c) for c in codes[i:i + batch_size]])
+        col.upsert(data)
+    col.flush()
+    return len(rows)
+
+def build_from(main_col, coarse_col, vector_field: str, batch_size: int = 2000) -> int:
+    """Llena la compañera recorriendo la colección principal (sin re-embeber)."""
+    it = main_col.query_iterator(batch_size=batch_size, expr="",
+                                 output_fields=["product_id", *FILTER_FIELDS, vector_field])
+    n = 0
+    try:
+        while True:
+            batch = it.next()
+            if not batch:
+                break
+            n += insert_coarse(coarse_col, batch, [r[vector_field] for r in batch])
+    finally:
+        it.close()
+    return n
+
+def covers(filters: Optional[Dict]) -> bool:
+    """La compañera solo replica FILTER_FIELDS: otro filtro => búsqueda de una etapa."""
+    return all(k in FILTER_FIELDS for k in (filters or {}))
+
+# =============================================================================
+# Benchmark: una etapa (retrieve actual) vs dos etapas
+# =============================================================================
+def _percentile(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100.0 * (len(xs) - 1))))] if xs else 0.0
+
+def _timed(fn, qvecs) -> Tuple[List[List[str]], List[float]]:
+    ids, lat = [], []
+    for q in qvecs:
+        t0 = time.perf_counter()
+        hits = fn(q[None, :])[0]
+        lat.append((time.perf_counter() - t0) * 1000.0)
+        ids.append([h["product_id"] for h in hits])
+    return ids, lat
+
+def _sample_texts(n: int, seed: int) -> Iterator[str]:
+    import retrieve
+    rows = retrieve.list_by_filter(None, limit=retrieve.PAGE_MAX, fields=["name", "brand"])
+    rnd = np.random.default_rng(seed)
+    for i in rnd.choice(len(rows), size=min(n, len(rows)), replace=False):
+        yield f"{rows[i]['name']} {rows[i]['brand']}"
+
+def bench(backend: str, n_queries: int, k: int, oversample: int, kinds: Sequence[str], seed: int = 7) -> List[Dict]:
+    import retrieve
+    from settings import get_settings
+    S = get_settings()
+    texts = list(_sample_texts(n_queries, seed))
+    qvecs = retrieve._embed_queries(texts)
+    sim_th = -1.0  # sin umbral: se compara el top-k completo
+
+    if backend == "local":
+        idx = retrieve._get_local()
+        fields = ["product_id"]
+        base = lambda q: idx.search(q, None, k, sim_th, fields)
+        variants = {kind: (lambda q, kind=kind: idx.search(q, None, k, sim_th, fields, coarse=kind, oversample=oversample))
+                    for kind in kinds if idx.has_coarse(kind)}
+    else:
+        base = lambda q: retrieve.retrieve_many_vec(q, None, k, sim_th, ["product_id"], two_stage=False)
+        variants = {"binary": lambda q: retrieve.retrieve_many_vec(q, None, k, sim_th, ["product_id"],
+                                                                    two_stage=True, oversample=oversample)}
+
+    ref, ref_lat = _timed(base, qvecs)
+    out = [{"variant": "single-stage", "recall": 1.0, "p50_ms": _percentile(ref_lat, 50),
+            "p99_ms": _percentile(ref_lat, 99), "bytes_per_vec": 4 * qvecs.shape[1]}]
+    for kind, fn in variants.items():
+        got, lat = _timed(fn, qvecs)
+        rec = [len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(got, ref)]
+        out.append({"variant": f"{kind} x{oversample}", "recall": float(np.mean(rec)),
+                    "p50_ms": _percentile(lat, 50), "p99_ms": _percentile(lat, 99),
+                    "bytes_per_vec": qvecs.shape[1] // 8 if kind == "binary" else qvecs.shape[1]})
+    print(f"[BENCH] backend={backend} queries={len(texts)} k={k} (recall@k vs single-stage) "
+          f"| SEARCH_BACKEND={S.search_backend}")
+    print(f"{'variante':<16} {'recall':>7} {'p50_ms':>8} {'p99_ms':>8} {'B/vector':>9}")
+    for r in out:
+        print(f"{r['variant']:<16} {r['recall']:>7.3f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['bytes_per_vec']:>9d}")
+    return out
+
+# =============================================================================
+# Main
+# =============================================================================
+def main():
+    ap = argparse.ArgumentParser(description="Código compacto para búsqueda en dos etapas")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Crea/llena coarse_<colección> desde la colección principal")
+    b.add_argument("--collection", default=None, help="Default: MILVUS_COLLECTION (o la versión detrás del alias)")
+    b.add_argument("--nlist", type=int, default=1024)
+    bb = sub.add_parser("bench", help="Recall/latencia: una etapa vs dos etapas")
+    bb.add_argument("--backend", choices=["local", "milvus"], default="local")
+    bb.add_argument("--queries", type=int, default=200)
+    bb.add_argument("--k", type=int, default=10)
+    bb.add_argument("--oversample", type=int, default=10)
+    bb.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    args = ap.parse_args()
+
+    if args.cmd == "bench":
+        bench(args.backend, args.queries, args.k, args.oversample, args.kinds)
+        return
+
+    import retrieve, reindex
+    from pymilvus import Collection
+    retrieve._get_collection()  # conexión
+    target = args.collection
+    if target is None:  # detrás del alias: la compañera es de la versión y el alias coarse_ la sigue
+        v = reindex.current_version()
+        target = reindex.collection_name(v) if v else retrieve.COL
+    main_col = Collection(target)
+    field = retrieve._vector_spec(main_col)[0]
+    dim = int(next(f.params["dim"] for f in main_col.schema.fields if f.name == field))
+    t0 = time.perf_counter()
+    col = ensure_coarse_collection(coarse_name(target), dim, nlist=args.nlist)
+    n = build_from(main_col, col, field)
+    col.load()
+    print(f"[OK] {n} códigos en '{col.name}' ({dim // 8} B/vector) en {time.perf_counter() - t0:.1f}s")
+    if target != retrieve.COL:
+        reindex._switch_coarse(target)
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,12 @@ def main():
         FieldSchema(name="last_seen",  dtype=DataType.INT64),
         FieldSchema(name="url",        dtype=DataType.VARCHAR, max_length=512),
         FieldSchema(name="canonical_text", dtype=DataType.VARCHAR, max_length=2048),
+        # derivados en ingesta (textnorm.py)
+        FieldSchema(name="name_norm",  dtype=DataType.VARCHAR, max_length=256),
+        FieldSchema(name="brand_norm", dtype=DataType.VARCHAR, max_length=128),
+        FieldSchema(name="store_norm", dtype=DataType.VARCHAR, max_length=64),
+        FieldSchema(name="unit_price", dtype=DataType.DOUBLE),
+        FieldSchema(name="unit_base",  dtype=DataType.VARCHAR, max_length=8),
         FieldSchema(name="vector",     dtype=DataType.FLOAT_VECTOR, dim=768),
     ]
     schema = CollectionSchema(fields, description="Retail products for RAG (no hallucinations)")
@@ -1,3 +1,4 @@
+import json
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
 from app.settings import get_settings
 
@@ -23,14 +24,19 @@ def ensure_collection() -> Collection:
         col.create_index("embedding", {"index_type": "IVF_FLAT", "metric_type": "COSINE", "params": {"nlist": 1024}})
     return Collection(name)
 
-def query_rows(country: str | None = None, offset: int = 0, limit: int = 50):
-    """Listado simple con filtro por país y paginación."""
+def query_rows(country: str | None = None, offset: int = 0, limit: int = 50, cursor: str | None = None):
+    """Listado simple con filtro por país y paginación (cursor por id u offset)."""
     col = ensure_collection()
     col.load()
-    expr = None
+    parts = []
     if country:
         # NOTA: para VARCHAR en Milvus, usa comillas dobles
-        expr = f'country == "{country}"'
+        parts.append(f'country == "{country}"')
+    if cursor:
+        # keyset: Milvus ordena query() por PK, así que "id > cursor" es la página siguiente
+        parts.append(f"id > {json.dumps(cursor)}")
+        offset = 0
+    expr = " and ".join(parts) or None
     fields = ["id", "title", "country", "price"]
     res = col.query(expr=expr, output_fields=fields, offset=offset, limit=limit)
     return res
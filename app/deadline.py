@@ -0,0 +1,85 @@
+# deadline.py — Presupuesto de tiempo por request, propagado a cada etapa
+# Sin deadline, un /chat puede encadenar planner + Milvus + respuesta durante minutos aunque
+# el cliente ya se haya ido. Aquí:
+#   - el middleware abre el deadline: header X-Request-Deadline-Ms o REQUEST_DEADLINE_S
+#   - el body (`deadline_ms` en /ask y /chat) lo reemplaza; si vino header, solo puede acortarlo
+#   - cada etapa pide su timeout con budget(): Milvus, cola y request del LLM, num_predict
+#   - vencido => DeadlineExceeded; el endpoint devuelve lo que ya tenga (evidencia sin redacción)
+#
+# El contextvar guarda un objeto mutable: las copias del contexto (threadpool, generadores de
+# StreamingResponse) ven los cambios hechos desde el endpoint.
+
+import time, contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from metrics import Counter, note_error
+
+DEADLINE_EXCEEDED = Counter("rag_deadline_exceeded_total", "Requests que agotaron su deadline", labels=("stage",))
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage: str = ""):
+        super().__init__(f"deadline agotado en {stage or '?'}")
+        self.stage = stage
+
+class _Deadline:
+    __slots__ = ("t0", "at", "explicit")
+
+    def __init__(self, budget_s: Optional[float], explicit: bool):
+        self.t0 = time.monotonic()
+        self.at = self.t0 + budget_s if budget_s else None
+        self.explicit = explicit  # lo fijó el cliente (header): el body no puede alargarlo
+
+_current: contextvars.ContextVar[Optional[_Deadline]] = contextvars.ContextVar("rag_deadline", default=None)
+
+def start(budget_s: Optional[float], explicit: bool = False) -> None:
+    """Abre el deadline del request (budget_s None/0 => sin límite)."""
+    _current.set(_Deadline(budget_s, explicit))
+
+def override(budget_s: Optional[float]) -> None:
+    """Deadline pedido en el body, contado desde el inicio del request."""
+    if not budget_s:
+        return
+    d = _current.get()
+    if d is None:
+        start(budget_s, explicit=True)
+        return
+    at = d.t0 + budget_s
+    d.at = min(d.at, at) if (d.explicit and d.at is not None) else at
+    d.explicit = True
+
+def remaining() -> Optional[float]:
+    d = _current.get()
+    if d is None or d.at is None:
+        return None
+    return d.at - time.monotonic()
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+def exceeded(stage: str) -> DeadlineExceeded:
+    DEADLINE_EXCEEDED.inc(stage=stage)
+    note_error(f"deadline:{stage}")
+    return DeadlineExceeded(stage)
+
+def budget(cap: Optional[float], stage: str) -> Optional[float]:
+    """Timeout para una etapa: min(cap, tiempo restante). Vencido => DeadlineExceeded."""
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise exceeded(stage)
+    return left if cap is None else min(cap, left)
+
+@contextmanager
+def guard(stage: str):
+    """Traduce el timeout del cliente (gRPC/HTTP) a DeadlineExceeded si fue el deadline quien lo causó."""
+    try:
+        yield
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if expired():
+            raise exceeded(stage) from e
+        raise
@@ -0,0 +1,216 @@
+# embed_server.py — Sidecar de embeddings compartido entre workers de uvicorn
+# Un solo proceso carga el encoder (torch/int8/onnx, ver encoders.py) y atiende por Unix socket;
+# las peticiones concurrentes de todos los workers se agrupan en micro-batches.
+#
+#   python embed_server.py --socket /tmp/rag-embed.sock --max-batch 64 --max-wait-ms 5
+#   EMBED_SOCKET=/tmp/rag-embed.sock uvicorn api:app --workers 8
+#
+# Protocolo (ambos sentidos): 4 bytes big-endian con el largo + JSON.
+#   request:  {"texts": [...], "normalize": true}
+#   response: {"shape": [n, d]} seguido de n*d float32 crudos  |  {"error": "..."}
+
+import argparse, json, os, queue, signal, socket, socketserver, struct, threading, time
+from typing import List, Optional
+
+import numpy as np
+
+_HDR = struct.Struct(">I")
+
+def _send_msg(sock: socket.socket, obj: dict, payload: bytes = b"") -> None:
+    body = json.dumps(obj).encode("utf-8")
+    sock.sendall(_HDR.pack(len(body)) + body + payload)
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket cerrado")
+        buf += chunk
+    return bytes(buf)
+
+def _recv_msg(sock: socket.socket) -> dict:
+    (n,) = _HDR.unpack(_recv_exact(sock, _HDR.size))
+    return json.loads(_recv_exact(sock, n))
+
+# -----------------------------------------------------------------------------
+# Cliente (lo usa retrieve._get_model() cuando EMBED_SOCKET está definido)
+# -----------------------------------------------------------------------------
+class EmbedClient:
+    """Misma interfaz que SentenceTransformer.encode(); una conexión por hilo."""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _sock(self) -> socket.socket:
+        s = getattr(self._local, "sock", None)
+        if s is None:
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.settimeout(self.timeout)
+            s.connect(self.path)
+            self._local.sock = s
+        return s
+
+    def _close(self) -> None:
+        s = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if s is not None:
+            try:
+                s.close()
+            except OSError:
+                pass
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **_) -> np.ndarray:
+        texts = list(texts)
+        for attempt in (0, 1):  # un reintento si el sidecar se reinició
+            try:
+                s = self._sock()
+                _send_msg(s, {"texts": texts, "normalize": bool(normalize_embeddings)})
+                hdr = _recv_msg(s)
+                if "error" in hdr:
+                    raise RuntimeError(f"embed_server: {hdr['error']}")
+                n, d = hdr["shape"]
+                raw = _recv_exact(s, n * d * 4)
+                return np.frombuffer(raw, dtype=np.float32).reshape(n, d)
+            except (ConnectionError, OSError):
+                self._close()
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+# -----------------------------------------------------------------------------
+# Servidor
+# -----------------------------------------------------------------------------
+class _Pending:
+    __slots__ = ("texts", "normalize", "done", "result", "error")
+
+    def __init__(self, texts: List[str], normalize: bool):
+        self.texts = texts
+        self.normalize = normalize
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+
+class Batcher:
+    """Junta peticiones hasta max_batch textos o max_wait_ms desde la primera, y codifica de una vez."""
+
+    def __init__(self, model, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.q: "queue.Queue[_Pending]" = queue.Queue()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+        threading.Thread(target=self._loop, name="embed-batcher", daemon=True).start()
+
+    def submit(self, texts: List[str], normalize: bool) -> _Pending:
+        p = _Pending(texts, normalize)
+        self.q.put(p)
+        p.done.wait()
+        return p
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self.q.get()]
+            n = len(batch[0].texts)
+            deadline = time.perf_counter() + self.max_wait_s
+            while n < self.max_batch:
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    break
+                try:
+                    p = self.q.get(timeout=left)
+                except queue.Empty:
+                    break
+                batch.append(p)
+                n += len(p.texts)
+            for norm in (True, False):
+                group = [p for p in batch if p.normalize is norm]
+                if group:
+                    self._encode(group, norm)
+
+    def _encode(self, group: List[_Pending], normalize: bool) -> None:
+        texts = [t for p in group for t in p.texts]
+        try:
+            vecs = np.asarray(self.model.encode(texts, normalize_embeddings=normalize), dtype=np.float32)
+            i = 0
+            for p in group:
+                p.result = vecs[i:i + len(p.texts)]
+                i += len(p.texts)
+        except Exception as e:
+            for p in group:
+                p.error = repr(e)
+        self.stats["requests"] += len(group)
+        self.stats["texts"] += len(texts)
+        self.stats["batches"] += 1
+        for p in group:
+            p.done.set()
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher: Batcher = self.server.batcher
+        while True:
+            try:
+                req = _recv_msg(self.request)
+            except (ConnectionError, OSError, struct.error):
+                return
+            texts = req.get("texts") or []
+            if not texts:
+                _send_msg(self.request, {"shape": [0, self.server.dim]})
+                continue
+            p = batcher.submit(texts, bool(req.get("normalize", True)))
+            if p.error:
+                _send_msg(self.request, {"error": p.error})
+            else:
+                arr = np.ascontiguousarray(p.result, dtype=np.float32)
+                _send_msg(self.request, {"shape": list(arr.shape)}, arr.tobytes())
+
+class EmbedServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 256  # un worker abre una conexión por hilo; el default (5) da EAGAIN
+
+    def __init__(self, path: str, model, max_batch: int = 64, max_wait_ms: float = 5.0):
+        if os.path.exists(path):
+            os.unlink(path)  # socket viejo de una ejecución anterior
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o660)
+        self.batcher = Batcher(model, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.dim = int(np.asarray(model.encode(["query: warmup"], normalize_embeddings=True)).shape[1])
+
+def main():
+    from settings import get_settings
+    s = get_settings()
+    ap = argparse.ArgumentParser(description="Sidecar de embeddings por Unix socket")
+    ap.add_argument("--socket", default=s.embed_socket or "/tmp/rag-embed.sock")
+    ap.add_argument("--max-batch", type=int, default=64)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    ap.add_argument("--stub", action="store_true", help="StubEncoder (sin torch) para pruebas offline")
+    args = ap.parse_args()
+
+    if args.stub:
+        from stubs import StubEncoder
+        model = StubEncoder()
+    else:
+        from encoders import load_encoder
+        from retrieve import EMB
+        model = load_encoder(s.embed_runtime, EMB, s.embed_model_path)
+
+    srv = EmbedServer(args.socket, model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    print(f"[embed_server] {args.socket} dim={srv.dim} runtime={'stub' if args.stub else s.embed_runtime} "
+          f"max_batch={args.max_batch} max_wait_ms={args.max_wait_ms}")
+    def _on_term(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, _on_term)  # docker stop / systemd: limpiar el socket igual que con Ctrl-C
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        st = srv.batcher.stats
+        print(f"[embed_server] requests={st['requests']} texts={st['texts']} batches={st['batches']}")
+        srv.server_close()
+        os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
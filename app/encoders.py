@@ -0,0 +1,247 @@
+# encoders.py — Runtimes del encoder de consultas: torch fp32, int8 dinámico u ONNX
+#
+#   EMBED_RUNTIME=torch | int8 | onnx      (por defecto torch, igual que antes)
+#   EMBED_MODEL_PATH=models/e5-onnx         (ruta local; vacío => EMBED_MODEL del hub)
+#
+#   python encoders.py export   --out models/e5-onnx [--quantize]
+#   python encoders.py validate --csv ../sample.csv --runtimes torch int8 onnx
+#
+# Todos exponen encode(texts, normalize_embeddings=True) -> np.ndarray, como SentenceTransformer.
+
+import os, sys, json, time, inspect, argparse, subprocess, tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RUNTIMES = ("torch", "int8", "onnx")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_quantized.onnx"
+
+def _l2n(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+# ========= Runtimes =========
+class TorchEncoder:
+    """SentenceTransformer fp32 (GPU si hay)."""
+
+    def __init__(self, model: str):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"[embeddings] runtime=torch device={device}")
+        self.model = SentenceTransformer(model, device=device)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **kw) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=normalize_embeddings, **kw)
+
+class Int8Encoder(TorchEncoder):
+    """Cuantización dinámica int8 de las capas Linear (CPU). Sin exportar nada."""
+
+    def __init__(self, model: str):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        print("[embeddings] runtime=int8 device=cpu")
+        self.model = SentenceTransformer(model, device="cpu")
+        torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+class OnnxEncoder:
+    """onnxruntime (CPU) sobre un export local; mean pooling + L2 como e5."""
+
+    def __init__(self, path: str, quantized: Optional[bool] = None, max_length: int = 512):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError("EMBED_RUNTIME=onnx requiere 'onnxruntime'") from e
+        if quantized is None:
+            quantized = os.path.exists(os.path.join(path, ONNX_INT8_FILE))
+        f = os.path.join(path, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not os.path.exists(f):
+            raise FileNotFoundError(f"No existe {f}; genera el modelo con: python encoders.py export --out {path}")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(f, opts, providers=["CPUExecutionProvider"])
+        # `tokenizers` (Rust) directo: evita importar transformers/torch y su RSS
+        from tokenizers import Tokenizer
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self._inputs = {i.name for i in self.session.get_inputs()}
+        print(f"[embeddings] runtime=onnx file={os.path.basename(f)}")
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **_) -> np.ndarray:
+        enc = self.tokenizer.encode_batch(texts)
+        tok = {
+            "input_ids": np.array([e.ids for e in enc], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in enc], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in enc], dtype=np.int64),
+        }
+        feeds = {k: v for k, v in tok.items() if k in self._inputs}
+        hidden = self.session.run(None, feeds)[0]
+        mask = tok["attention_mask"][..., None].astype(np.float32)
+        emb = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _l2n(emb) if normalize_embeddings else emb
+
+def load_encoder(runtime: str, model: str, path: str = ""):
+    """Crea el encoder del runtime pedido. `path` (copia local) tiene prioridad sobre `model`."""
+    runtime = (runtime or "torch").lower()
+    # un directorio de export ONNX no es cargable por SentenceTransformer
+    src = path if path and not os.path.exists(os.path.join(path, ONNX_FILE)) else model
+    if runtime == "torch":
+        return TorchEncoder(src)
+    if runtime == "int8":
+        return Int8Encoder(src)
+    if runtime == "onnx":
+        if not path:
+            raise ValueError("EMBED_RUNTIME=onnx requiere EMBED_MODEL_PATH con el export ONNX")
+        return OnnxEncoder(path)
+    raise ValueError(f"EMBED_RUNTIME desconocido: {runtime} (usa {', '.join(RUNTIMES)})")
+
+# ========= Export =========
+def export_onnx(model: str, out: str, quantize: bool = False, opset: int = 17) -> str:
+    """Exporta el transformer base (sin pooling) a ONNX y, opcional, su versión int8 dinámica."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out, exist_ok=True)
+    tok = AutoTokenizer.from_pretrained(model)
+    net = AutoModel.from_pretrained(model).eval()
+    sample = tok(["query: ejemplo"], return_tensors="pt")
+    names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    axes = {k: {0: "batch", 1: "seq"} for k in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    kw = dict(input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=opset)
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kw["dynamo"] = False  # torch>=2.5: exportador TorchScript (no requiere onnxscript)
+    with torch.no_grad():
+        torch.onnx.export(net, tuple(sample[k] for k in names), os.path.join(out, ONNX_FILE), **kw)
+    tok.save_pretrained(out)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(os.path.join(out, ONNX_FILE), os.path.join(out, ONNX_INT8_FILE),
+                         weight_type=QuantType.QInt8)
+    return out
+
+# ========= Validación =========
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _catalogue(csv_paths: List[str]):
+    from ingest import read_csv_rows
+    rows = []
+    for p in csv_paths:
+        rows.extend(read_csv_rows(p))
+    queries = [f"precio de {r['name']}" for r in rows] + [f"{r['brand']} {r['category']} {r['store']}" for r in rows]
+    return rows, queries
+
+def _probe(runtime: str, model: str, path: str, queries_file: str, out_npy: str) -> Dict:
+    """Corre en un proceso aparte para medir RSS y carga de cada runtime de forma aislada."""
+    with open(queries_file, encoding="utf-8") as fh:
+        queries = json.load(fh)
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    enc = load_encoder(runtime, model, path)
+    load_s = time.perf_counter() - t0
+    enc.encode(["query: warmup"], normalize_embeddings=True)
+    lat, vecs = [], []
+    for q in queries:  # batch de 1, como en el request path
+        t = time.perf_counter()
+        vecs.append(enc.encode(["query: " + q], normalize_embeddings=True)[0])
+        lat.append((time.perf_counter() - t) * 1000.0)
+    np.save(out_npy, np.asarray(vecs, dtype=np.float32))
+    return {"runtime": runtime, "load_s": round(load_s, 2), "rss_mb": round(_rss_mb(), 1),
+            "rss_model_mb": round(_rss_mb() - rss0, 1),
+            "lat_p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "lat_p95_ms": round(float(np.percentile(lat, 95)), 2)}
+
+def validate(csv_paths: List[str], model: str, path: str, runtimes: List[str], k: int = 5) -> List[Dict]:
+    """
+    Compara cada runtime contra torch fp32: coseno de los embeddings de consulta y recall@k
+    sobre el catálogo (índice construido con pasajes fp32, como en ingest.py).
+    """
+    rows, queries = _catalogue(csv_paths)
+    ref = TorchEncoder(model)
+    passages = ref.encode(["passage: " + r["canonical_text"] for r in rows], normalize_embeddings=True)
+
+    out: List[Dict] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        qfile = os.path.join(tmp, "queries.json")
+        with open(qfile, "w", encoding="utf-8") as fh:
+            json.dump(queries, fh, ensure_ascii=False)
+        vecs: Dict[str, np.ndarray] = {}
+        for rt in ["torch", *[r for r in runtimes if r != "torch"]]:
+            npy = os.path.join(tmp, f"{rt}.npy")
+            cmd = [sys.executable, os.path.abspath(__file__), "_probe", "--runtime", rt, "--model", model,
+                   "--path", (path if rt == "onnx" else ""), "--queries", qfile, "--out", npy]
+            res = subprocess.run(cmd, capture_output=True, text=True)
+            if res.returncode != 0:
+                print(f"[WARN] runtime={rt} falló:\n{res.stderr.strip()[-800:]}")
+                continue
+            stats = json.loads(res.stdout.strip().splitlines()[-1])
+            vecs[rt] = np.load(npy)
+            out.append(stats)
+
+    if "torch" not in vecs:
+        return out
+    base = vecs["torch"]
+    k = max(1, min(k, len(passages)))
+    base_top = np.argsort(-(base @ passages.T), axis=1)[:, :k]
+    for st in out:
+        v = vecs[st["runtime"]]
+        cos = np.sum(_l2n(v) * _l2n(base), axis=1)
+        top = np.argsort(-(v @ passages.T), axis=1)[:, :k]
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, base_top)])
+        st.update({"cos_mean": round(float(cos.mean()), 5), "cos_min": round(float(cos.min()), 5),
+                   "recall": round(float(recall), 4), "k": k})
+    return out
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Runtimes del encoder (torch/int8/onnx)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("export", help="Exporta EMBED_MODEL a ONNX (opcional int8)")
+    p.add_argument("--model", type=str, default=None)
+    p.add_argument("--out", type=str, required=True)
+    p.add_argument("--quantize", action="store_true")
+
+    default_csv = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "sample.csv"))
+    p = sub.add_parser("validate", help="Coseno/recall/latencia/RSS vs torch fp32")
+    p.add_argument("--csv", nargs="+", default=[default_csv])
+    p.add_argument("--model", type=str, default=None)
+    p.add_argument("--path", type=str, default=None)
+    p.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=RUNTIMES)
+    p.add_argument("--k", type=int, default=5)
+
+    p = sub.add_parser("_probe")  # uso interno de validate
+    for a in ("--runtime", "--model", "--path", "--queries", "--out"):
+        p.add_argument(a, type=str, default="")
+    args = parser.parse_args()
+
+    if args.cmd == "_probe":
+        print(json.dumps(_probe(args.runtime, args.model, args.path, args.queries, args.out)))
+        return
+
+    from settings import get_settings
+    S = get_settings()
+    model = args.model or S.embed_model
+    if args.cmd == "export":
+        print(f"[OK] Export en {export_onnx(model, args.out, quantize=args.quantize)}")
+        return
+
+    stats = validate(args.csv, model, args.path if args.path is not None else S.embed_model_path,
+                     args.runtimes, k=args.k)
+    cols = ["runtime", "load_s", "rss_mb", "rss_model_mb", "lat_p50_ms", "lat_p95_ms", "cos_mean", "cos_min", "recall", "k"]
+    print(" ".join(f"{c:>12}" for c in cols))
+    for st in stats:
+        print(" ".join(f"{str(st.get(c, '-')):>12}" for c in cols))
+
+if __name__ == "__main__":
+    main()
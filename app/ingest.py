@@ -1,6 +1,8 @@
-# ingest.py — Ingesta a Milvus con esquema "completo" (14 campos)
+# ingest.py — Ingesta a Milvus con esquema "completo" (19 campos)
 # Campos: product_id, name, brand, category, store, country, price, unit,
 #         size, currency, last_seen, url, canonical_text, embedding
+# Derivados (calculados una vez aquí, ver textnorm.py):
+#         name_norm, brand_norm, store_norm (sin tildes, para filtrar), unit_price + unit_base
 
 import os, csv, math, time, argparse, itertools
 from typing import Dict, List, Tuple
@@ -16,6 +18,8 @@ from pymilvus import (
     connections, utility, Collection, CollectionSchema, FieldSchema, DataType
 )
 
+from textnorm import add_derived, sanitize
+
 # ========= Config desde .env =========
 MILVUS_HOST       = os.getenv("MILVUS_HOST", "127.0.0.1")
 MILVUS_PORT       = os.getenv("MILVUS_PORT", "19530")
@@ -25,12 +29,14 @@ MILVUS_COLLECTION = os.getenv("MILVUS_COLLECTION", "retail_products")
 EMBED_BACKEND     = os.getenv("EMBED_BACKEND", "hf").lower()
 EMBED_MODEL       = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-base")
 OLLAMA_HOST       = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
+OLLAMA_HOSTS      = os.getenv("OLLAMA_HOSTS", "")  # varios backends: ver llm_pool.py
 
 # ========= Utilidades =========
 FIELD_ORDER = [
     "product_id", "name", "brand", "category", "store", "country",
     "price", "unit", "size", "currency", "last_seen", "url",
-    "canonical_text", "embedding"
+    "canonical_text", "name_norm", "brand_norm", "store_norm", "unit_price", "unit_base",
+    "embedding"
 ]
 
 def canonical(r: Dict) -> str:
@@ -48,9 +54,14 @@ def l2_normalize(vec: List[float]) -> List[float]:
 def ensure_connection():
     connections.connect(alias="default", host=MILVUS_HOST, port=str(MILVUS_PORT))
 
-def ensure_collection(dim: int) -> Collection:
-    """Crea la colección con 14 campos si no existe. Si existe, valida campos y dimensión."""
-    name = MILVUS_COLLECTION
+def build_index(col: Collection):
+    col.create_index("embedding", {"index_type": "IVF_FLAT", "metric_type": "COSINE", "params": {"nlist": 1024}})
+
+def ensure_collection(dim: int, create_index: bool = True, name: str = "") -> Collection:
+    """Crea la colección con 19 campos si no existe. Si existe, valida campos y dimensión.
+    create_index=False: el índice se construye después (bulk_ingest.py, una sola vez al final).
+    name: colección destino (reindex.py crea versiones); default MILVUS_COLLECTION."""
+    name = name or MILVUS_COLLECTION
     if not utility.has_collection(name):
         fields = [
             FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=128, is_primary=True, auto_id=False),
@@ -66,11 +77,17 @@ def ensure_collection(dim: int) -> Collection:
             FieldSchema(name="last_seen",   dtype=DataType.INT64),
             FieldSchema(name="url",         dtype=DataType.VARCHAR, max_length=1024),
             FieldSchema(name="canonical_text", dtype=DataType.VARCHAR, max_length=4096),
+            FieldSchema(name="name_norm",   dtype=DataType.VARCHAR, max_length=512),
+            FieldSchema(name="brand_norm",  dtype=DataType.VARCHAR, max_length=128),
+            FieldSchema(name="store_norm",  dtype=DataType.VARCHAR, max_length=128),
+            FieldSchema(name="unit_price",  dtype=DataType.DOUBLE),
+            FieldSchema(name="unit_base",   dtype=DataType.VARCHAR, max_length=8),
             FieldSchema(name="embedding",   dtype=DataType.FLOAT_VECTOR, dim=dim),
         ]
-        schema = CollectionSchema(fields, description=f"Retail products (14 campos) | embedder={EMBED_BACKEND}:{EMBED_MODEL}")
+        schema = CollectionSchema(fields, description=f"Retail products (19 campos) | embedder={EMBED_BACKEND}:{EMBED_MODEL}")
         col = Collection(name=name, schema=schema)
-        col.create_index("embedding", {"index_type": "IVF_FLAT", "metric_type": "COSINE", "params": {"nlist": 1024}})
+        if create_index:
+            build_index(col)
         return col
 
     # Si ya existe, validar que tenga los campos esperados y la dimensión
@@ -94,19 +111,29 @@ def ensure_collection(dim: int) -> Collection:
 
 # ========= Backends de embeddings =========
 def embed_ollama(texts: List[str]) -> List[List[float]]:
-    import requests
-    out = []
-    url = f"{OLLAMA_HOST}/api/embeddings"
-    for t in texts:
-        r = requests.post(url, json={"model": EMBED_MODEL, "prompt": t})
-        r.raise_for_status()
-        vec = r.json()["embedding"]
-        out.append(l2_normalize(vec))
-    return out
+    """Reparte los textos entre los backends de OLLAMA_HOSTS (un hilo por backend que sirve el modelo)."""
+    from concurrent.futures import ThreadPoolExecutor
+    from llm_pool import get_pool
+    pool = get_pool(OLLAMA_HOSTS, OLLAMA_HOST)
+
+    def one(t: str) -> List[float]:
+        data = pool.post_json("/api/embeddings", {"model": EMBED_MODEL, "prompt": t}, model=EMBED_MODEL)
+        return l2_normalize(data["embedding"])
+
+    workers = max(1, len(pool.each(EMBED_MODEL)))
+    if workers == 1:
+        return [one(t) for t in texts]
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(one, texts))
+
+_hf_model = None
 
 def embed_hf(texts: List[str]) -> List[List[float]]:
-    from sentence_transformers import SentenceTransformer
-    model = SentenceTransformer(EMBED_MODEL)
+    global _hf_model
+    if _hf_model is None:  # una sola carga aunque se llame por lotes
+        from sentence_transformers import SentenceTransformer
+        _hf_model = SentenceTransformer(EMBED_MODEL)
+    model = _hf_model
     prepped = [("passage: " + t) if "e5" in EMBED_MODEL else t for t in texts]
     vecs = model.encode(prepped, normalize_embeddings=True)
     return [v.tolist() for v in vecs]
@@ -128,8 +155,9 @@ def read_csv_rows(csv_path: str) -> List[Dict]:
             r["last_seen"] = int(r.get("last_seen") or int(time.time() * 1000))
             r["price"] = float(r["price"]) if r.get("price") not in (None, "",) else 0.0
             r["size"] = float(r["size"]) if r.get("size") not in (None, "",) else 0.0
-            # canonical_text si no viene
-            r["canonical_text"] = r.get("canonical_text") or canonical(r)
+            # canonical_text si no viene; se guarda ya sanitizado
+            r["canonical_text"] = sanitize(r.get("canonical_text") or canonical(r))
+            add_derived(r)
             rows.append(r)
     return rows
 
@@ -160,6 +188,11 @@ def to_data_lists(rows: List[Dict], vecs: List[List[float]]) -> List[list]:
         [int(r.get("last_seen")) for r in rows],
         [r["url"] for r in rows],
         [r["canonical_text"] for r in rows],
+        [r["name_norm"] for r in rows],
+        [r["brand_norm"] for r in rows],
+        [r["store_norm"] for r in rows],
+        [float(r["unit_price"]) for r in rows],
+        [r["unit_base"] for r in rows],
         vecs,
     ]
 
@@ -185,8 +218,10 @@ def insert_batches(col: Collection, rows: List[Dict], vecs: List[List[float]], b
 
 # ========= Main =========
 def main():
-    parser = argparse.ArgumentParser(description="Ingesta CSV -> Milvus (14 campos)")
+    parser = argparse.ArgumentParser(description="Ingesta CSV -> Milvus (19 campos)")
     parser.add_argument("--csv", type=str, default="data/sample.csv", help="Ruta del CSV")
+    parser.add_argument("--coarse", action="store_true",
+                        help="También escribe coarse_<colección> con el código binario (COARSE_SEARCH, ver coarse.py)")
     args = parser.parse_args()
 
     csv_path = os.path.normpath(args.csv)
@@ -220,5 +255,12 @@ def main():
     total = insert_batches(col, rows, vecs, batch_size=512)
     print(f"[OK] Ingestados {total} registros en '{MILVUS_COLLECTION}'.")
 
+    if args.coarse:
+        import coarse
+        ccol = coarse.ensure_coarse_collection(coarse.coarse_name(MILVUS_COLLECTION), dim)
+        n = coarse.insert_coarse(ccol, rows, vecs)
+        ccol.load()
+        print(f"[OK] {n} códigos binarios ({dim // 8} B/vector) en '{ccol.name}'.")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,277 @@
+# lexical.py — Índice léxico en proceso (BM25) sobre nombre/marca/presentación + product_id literal
+# "precio del arroz la merced 900g" o un product_id pegado tal cual no necesitan el encoder e5
+# ni el ANN: basta un índice invertido en memoria.
+#   - tokens: fold() + presentación llevada a unidad base ("900 g" == "900g" == "0.9kg"); sin stopwords
+#   - postings CSR en NumPy (término -> docs), BM25 con tf binario (nombres cortos: tf casi siempre 1)
+#   - decisivo: product_id literal, o todos los términos de la pregunta presentes en
+#     1..LEXICAL_MAX_EXACT productos (con al menos LEXICAL_MIN_TERMS términos) => retrieve() no embebe
+#   - si no: los candidatos BM25 se fusionan con los vectoriales por RRF (retrieve.py)
+#
+# Se construye al arrancar (warmup) y se refresca en background por last_seen cada LEXICAL_REFRESH_S
+# (lo nuevo de cada ingesta) o con POST /admin/lexical/refresh. Las bajas requieren full=true.
+# El índice es inmutable: refresh arma uno nuevo y cambia la referencia.
+
+import math, re, threading, time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from metrics import Counter
+from textnorm import UNIT_FACTORS, fold
+
+LEXICAL_RESULTS = Counter("rag_lexical_total", "Consultas por resultado de la ruta léxica", labels=("result",))
+
+# Columnas crudas que necesita el índice (retrieve.iter_catalog)
+SOURCE_FIELDS = ["product_id", "name", "brand", "size", "unit", "country", "category", "store", "last_seen"]
+# Filtros que se pueden aplicar en el índice (mismos nombres que deja retrieve._norm_filters)
+FILTER_FIELDS = ("country", "category", "store_norm", "brand_norm", "name_norm")
+
+# Palabras de la pregunta que no describen el producto (tampoco se indexan)
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "o", "para", "por",
+    "que", "se", "su", "un", "una", "unos", "unas", "y", "me", "mi", "hoy",
+    "precio", "precios", "cuanto", "cuanta", "cuesta", "cuestan", "vale", "valen", "valor", "costo",
+    "cual", "cuales", "donde", "hay", "tiene", "tienen", "dame", "busco", "quiero", "necesito",
+}
+
+K1, B = 1.2, 0.75
+
+_UNITS = "|".join(sorted((re.escape(u) for u in UNIT_FACTORS), key=len, reverse=True))
+_SIZE = re.compile(rf"(\d+(?:[.,]\d+)?)\s*({_UNITS})\b")
+_TOKEN = re.compile(r"\d+(?:\.\d+)?[a-z]*|[a-z]+")
+_PK_STRIP = "[](){}<>.,;:¿?¡!\"'"
+
+def size_token(qty, unit: Optional[str]) -> Optional[str]:
+    """Presentación en unidad base: (900, "g") -> "0.9kg"; (1, "lt") -> "1l"."""
+    base = UNIT_FACTORS.get(fold(unit).strip().rstrip("."))
+    try:
+        qty = float(qty)
+    except (TypeError, ValueError):
+        return None
+    if not base or qty <= 0:
+        return None
+    return f"{round(qty * base[1], 6):g}{base[0].lower()}"
+
+def tokenize(text: Optional[str]) -> List[str]:
+    def _size(m):
+        tok = size_token(m.group(1).replace(",", "."), m.group(2))
+        return f" {tok} " if tok else m.group(0)
+    t = _SIZE.sub(_size, fold(text))
+    return [w for w in _TOKEN.findall(t) if w not in STOPWORDS]
+
+def doc_tokens(r: Dict) -> List[str]:
+    toks = tokenize(f"{r.get('name') or ''} {r.get('brand') or ''}")
+    size = size_token(r.get("size"), r.get("unit"))
+    if size:
+        toks.append(size)
+    return list(dict.fromkeys(toks))
+
+def _filter_values(r: Dict) -> Dict[str, str]:
+    return {"country": str(r.get("country") or ""), "category": str(r.get("category") or ""),
+            "store_norm": fold(r.get("store")), "brand_norm": fold(r.get("brand")), "name_norm": fold(r.get("name"))}
+
+def covers(filters: Optional[Dict]) -> bool:
+    """Otros filtros (o valores no texto) => el índice léxico no aplica, búsqueda solo vectorial."""
+    return all(k in FILTER_FIELDS and isinstance(v, str) for k, v in (filters or {}).items())
+
+def rrf(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal Rank Fusion: sum(1 / (k + rango)) por id, mayor primero."""
+    acc: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, pk in enumerate(ranking, start=1):
+            acc[pk] = acc.get(pk, 0.0) + 1.0 / (k + rank)
+    return sorted(acc.items(), key=lambda kv: -kv[1])
+
+class Lookup(NamedTuple):
+    decisive: bool
+    hits: List[Tuple[str, float]]  # (product_id, score normalizado: top = 1.0)
+
+# =============================================================================
+# Índice
+# =============================================================================
+class LexicalIndex:
+    def __init__(self, vocab: Dict[str, int], indptr: np.ndarray, postings: np.ndarray, dl: np.ndarray,
+                 pk: np.ndarray, fcodes: Dict[str, np.ndarray], fvocab: Dict[str, Dict[str, int]],
+                 max_last_seen: int = 0):
+        self.vocab, self.indptr, self.postings = vocab, indptr, postings
+        self.dl, self.pk, self.fcodes, self.fvocab = dl, pk, fcodes, fvocab
+        self.n = len(pk)
+        self.max_last_seen = max_last_seen
+        self.built_at = time.time()
+        self.pk_order = np.argsort(pk, kind="stable")
+        self.pk_sorted = pk[self.pk_order]
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((self.n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(dl.mean()) if self.n else 1.0
+        self.norm = ((K1 + 1) / (1 + K1 * (1 - B + B * dl / max(avgdl, 1e-6)))).astype(np.float32)
+        # valores de filtro (tienda/categoría/país) que puede traer la pregunta sin estar en el nombre
+        self.context_terms = {t for f in ("store_norm", "category", "country") for v in fvocab[f] for t in tokenize(v)}
+
+    @classmethod
+    def empty(cls) -> "LexicalIndex":
+        return cls({}, np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.float32),
+                   np.zeros(0, dtype=str), {f: np.zeros(0, np.int32) for f in FILTER_FIELDS},
+                   {f: {} for f in FILTER_FIELDS})
+
+    def merge(self, batches: Iterable[List[Dict]]) -> "LexicalIndex":
+        """Índice nuevo = este + altas/actualizaciones (por product_id, gana la última). Sin filas => self."""
+        vocab = dict(self.vocab)
+        fvocab = {f: dict(v) for f, v in self.fvocab.items()}
+        pks: List[str] = []
+        terms: List[int] = []
+        owner: List[int] = []
+        dl: List[int] = []
+        fcodes: Dict[str, List[int]] = {f: [] for f in FILTER_FIELDS}
+        max_ls = self.max_last_seen
+        for batch in batches:
+            for r in batch:
+                j = len(pks)
+                pks.append(str(r["product_id"]))
+                toks = doc_tokens(r)
+                for t in toks:
+                    terms.append(vocab.setdefault(t, len(vocab)))
+                    owner.append(j)
+                dl.append(len(toks))
+                for f, v in _filter_values(r).items():
+                    fcodes[f].append(fvocab[f].setdefault(v, len(fvocab[f])))
+                max_ls = max(max_ls, int(r.get("last_seen") or 0))
+        if not pks:
+            return self
+
+        new_pk = np.array(pks, dtype=str)
+        _, last = np.unique(new_pk[::-1], return_index=True)
+        keep_new = np.zeros(len(new_pk), dtype=bool)
+        keep_new[len(new_pk) - 1 - last] = True  # duplicados dentro del lote: queda la última fila
+        keep_old = ~np.isin(self.pk, new_pk) if self.n else np.zeros(0, dtype=bool)
+
+        # doc ids: primero los antiguos que sobreviven, luego los nuevos
+        old_map = np.cumsum(keep_old) - 1
+        new_map = np.cumsum(keep_new) - 1 + int(keep_old.sum())
+        old_terms = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        old_sel = keep_old[self.postings] if self.n else np.zeros(0, dtype=bool)
+        t_arr = np.asarray(terms, dtype=np.int64)
+        o_arr = np.asarray(owner, dtype=np.int64)
+        new_sel = keep_new[o_arr]
+        all_t = np.concatenate([old_terms[old_sel], t_arr[new_sel]])
+        all_d = np.concatenate([old_map[self.postings[old_sel]], new_map[o_arr[new_sel]]]).astype(np.int32)
+        order = np.lexsort((all_d, all_t))
+        indptr = np.searchsorted(all_t[order], np.arange(len(vocab) + 1)).astype(np.int64)
+
+        return LexicalIndex(
+            vocab, indptr, all_d[order],
+            np.concatenate([self.dl[keep_old], np.asarray(dl, dtype=np.float32)[keep_new]]).astype(np.float32),
+            np.concatenate([self.pk[keep_old], new_pk[keep_new]]),
+            {f: np.concatenate([self.fcodes[f][keep_old], np.asarray(fcodes[f], dtype=np.int32)[keep_new]])
+             for f in FILTER_FIELDS},
+            fvocab, max_ls,
+        )
+
+    # --- consulta ---
+    def _mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        m = None
+        for k, v in (filters or {}).items():
+            code = self.fvocab[k].get(v)
+            cur = self.fcodes[k] == code if code is not None else np.zeros(self.n, dtype=bool)
+            m = cur if m is None else (m & cur)
+        return m
+
+    def _literal(self, question: str, mask: Optional[np.ndarray]) -> List[str]:
+        cands = [question.strip().strip(_PK_STRIP)] + [w.strip(_PK_STRIP) for w in question.split()]
+        out = []
+        for c in dict.fromkeys(c for c in cands if c):
+            i = int(np.searchsorted(self.pk_sorted, c))
+            if i < self.n and self.pk_sorted[i] == c:
+                row = int(self.pk_order[i])
+                if mask is None or mask[row]:
+                    out.append(c)
+        return out
+
+    def lookup(self, question: str, filters: Optional[Dict], k: int, min_terms: int = 2,
+               max_exact: int = 20) -> Lookup:
+        if not self.n:
+            return Lookup(False, [])
+        mask = self._mask(filters)
+        literal = self._literal(question, mask)
+        if literal:
+            return Lookup(True, [(pk, 1.0) for pk in literal[:k]])
+
+        toks = list(dict.fromkeys(tokenize(question)))
+        known = [self.vocab[t] for t in toks if t in self.vocab]
+        unknown = [t for t in toks if t not in self.vocab and t not in self.context_terms]
+        if not known:
+            return Lookup(False, [])
+
+        scores = np.zeros(self.n, dtype=np.float32)
+        cover = np.zeros(self.n, dtype=np.uint8)
+        for t in known:
+            docs = self.postings[self.indptr[t]:self.indptr[t + 1]]
+            scores[docs] += self.idf[t] * self.norm[docs]
+            cover[docs] += 1
+        if mask is not None:
+            scores[~mask] = 0.0
+            cover[~mask] = 0
+
+        exact = np.nonzero(cover == len(known))[0]
+        decisive = not unknown and len(known) >= min_terms and 1 <= len(exact) <= max_exact
+        cand = exact if decisive else np.nonzero(scores > 0)[0]
+        if not len(cand):
+            return Lookup(False, [])
+        if len(cand) > k:
+            cand = cand[np.argpartition(-scores[cand], k - 1)[:k]]
+        cand = cand[np.argsort(-scores[cand], kind="stable")]
+        top = float(scores[cand[0]]) or 1.0
+        return Lookup(decisive, [(str(self.pk[i]), float(scores[i]) / top) for i in cand])
+
+    def stats(self) -> Dict:
+        return {"docs": self.n, "terms": len(self.vocab), "postings": int(len(self.postings)),
+                "max_last_seen": self.max_last_seen, "built_at": round(self.built_at, 3)}
+
+# =============================================================================
+# Instancia por proceso: construcción/refresh en background
+# =============================================================================
+Source = Callable[[Optional[int]], Iterator[List[Dict]]]  # since(last_seen) -> lotes; None => todo
+
+_index: Optional[LexicalIndex] = None
+_refresh_lock = threading.Lock()
+_state_lock = threading.Lock()
+_running = False
+_last_check = -math.inf
+RETRY_S = 5.0  # sin índice todavía (p.ej. Milvus caído): reintento de la construcción
+
+def current() -> Optional[LexicalIndex]:
+    return _index
+
+def refresh(source: Source, full: bool = False) -> LexicalIndex:
+    """Síncrono: completo la primera vez (o full=True), incremental por last_seen después."""
+    global _index
+    with _refresh_lock:
+        base = None if full or _index is None else _index
+        t0 = time.perf_counter()
+        new = (base or LexicalIndex.empty()).merge(source(base.max_last_seen if base is not None else None))
+        if new is not _index:
+            _index = new
+            print(f"[lexical] {'incremental' if base is not None else 'completo'}: {new.n} productos, "
+                  f"{len(new.vocab)} términos en {time.perf_counter() - t0:.2f}s")
+        return _index
+
+def _refresh_bg(source: Source) -> None:
+    global _running
+    try:
+        refresh(source)
+    except Exception as e:
+        print(f"[lexical] refresh falló: {e!r}")
+    finally:
+        with _state_lock:
+            _running = False
+
+def get_index(source: Source, refresh_s: float) -> Optional[LexicalIndex]:
+    """Índice vigente sin bloquear (None mientras se construye el primero); dispara el refresh si toca."""
+    global _running, _last_check
+    now = time.monotonic()
+    every = RETRY_S if _index is None else refresh_s
+    if every > 0 and now - _last_check >= every:
+        with _state_lock:
+            if not _running and now - _last_check >= every:
+                _running, _last_check = True, now
+                threading.Thread(target=_refresh_bg, args=(source,), name="lexical-refresh", daemon=True).start()
+    return _index
@@ -0,0 +1,63 @@
+# lifecycle.py — Precarga de recursos en background y estado de readiness (/ready)
+# El servidor acepta conexiones de inmediato (/health responde); /ready pasa a 200
+# solo cuando todos los pasos registrados (embedder, Milvus, Ollama...) quedaron calientes.
+
+import threading, time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class Warmup:
+    def __init__(self, retry_s: float = 5.0):
+        self.retry_s = retry_s
+        self._steps: List[Tuple[str, Callable[[], None]]] = []
+        self.state: Dict[str, Dict] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()  # /ready (threadpool) puede llamar start() en paralelo
+        self._stop = threading.Event()
+
+    def add(self, name: str, fn: Callable[[], None]) -> None:
+        self._steps.append((name, fn))
+        self.state[name] = {"ok": False, "seconds": None, "error": None}
+
+    @property
+    def ready(self) -> bool:
+        return all(st["ok"] for st in self.state.values())
+
+    def run(self) -> None:
+        """Ejecuta los pasos pendientes; reintenta los fallidos hasta que todos queden OK."""
+        self.started_at = time.perf_counter()
+        while not self._stop.is_set():
+            for name, fn in self._steps:
+                st = self.state[name]
+                if st["ok"]:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    fn()
+                    st.update(ok=True, error=None)
+                except Exception as e:
+                    st["error"] = repr(e)
+                    print(f"[warmup] {name} falló: {e!r}")
+                st["seconds"] = round(time.perf_counter() - t0, 3)
+            if self.ready:
+                self.finished_at = time.perf_counter()
+                print(f"[warmup] listo en {self.finished_at - self.started_at:.2f}s "
+                      + " ".join(f"{k}={v['seconds']}s" for k, v in self.state.items()))
+                return
+            self._stop.wait(self.retry_s)
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def report(self) -> Dict:
+        total = None
+        if self.started_at is not None:
+            total = round((self.finished_at or time.perf_counter()) - self.started_at, 3)
+        return {"ready": self.ready, "warmup_s": total, "steps": self.state}
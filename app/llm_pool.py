@@ -0,0 +1,198 @@
+# llm_pool.py — Pool de backends Ollama con balanceo por solicitudes pendientes y salud pasiva
+# Sin proxy delante: cada proceso elige el backend por request.
+#   - least-outstanding-requests entre los backends sanos que sirven el modelo
+#   - salud pasiva: N fallos seguidos => backend expulsado `eject_s` segundos (luego se reintenta)
+#   - afinidad (sticky): prompts con el mismo prefijo (planner) vuelven al backend con el KV cache caliente,
+#     salvo que tenga `sticky_slack` pendientes más que el menos cargado
+#
+# OLLAMA_HOSTS="http://cpu1:11434=phi3:mini|llama3,http://cpu2:11434"   (sin "=modelos" => sirve todos)
+#
+# Módulo autocontenido (solo requests): lo importan api.py, ingest.py y app/services/rag.py.
+
+import hashlib, json, threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+class NoBackendAvailable(RuntimeError):
+    pass
+
+def prefix_key(prompt: str, n: int = 512) -> str:
+    """Clave de afinidad: hash del prefijo del prompt (instrucciones + ejemplos fijos del planner)."""
+    return hashlib.blake2b(prompt[:n].encode("utf-8"), digest_size=8).hexdigest()
+
+def parse_hosts(spec: str) -> List[Tuple[str, Optional[List[str]]]]:
+    out = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, models = item.partition("=")
+        out.append((url.strip().rstrip("/"), [m.strip() for m in models.split("|") if m.strip()] or None))
+    return out
+
+class Backend:
+    def __init__(self, url: str, models: Optional[List[str]] = None):
+        self.url = url.rstrip("/")
+        self.models = set(models) if models else None  # None => cualquier modelo
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.latency_sum = 0.0
+        self.latency_ewma: Optional[float] = None
+
+    def serves(self, model: Optional[str]) -> bool:
+        return model is None or self.models is None or model in self.models
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "models": sorted(self.models) if self.models else None,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy(time.time()),
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "latency_avg_s": round(self.latency_sum / self.requests, 4) if self.requests else None,
+            "latency_ewma_s": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+        }
+
+class OllamaPool:
+    def __init__(self, backends: List[Tuple[str, Optional[List[str]]]], eject_after: int = 3,
+                 eject_s: float = 30.0, sticky_slack: int = 2, sticky_max: int = 1024):
+        if not backends:
+            raise ValueError("OllamaPool necesita al menos un backend")
+        self.backends = [Backend(u, m) for u, m in backends]
+        self.eject_after = eject_after
+        self.eject_s = eject_s
+        self.sticky_slack = sticky_slack
+        self.sticky_max = sticky_max
+        self._sticky: Dict[str, Backend] = {}
+        self._lock = threading.Lock()
+        self._rr = 0
+
+    @classmethod
+    def from_spec(cls, spec: str, default_url: str, **kw) -> "OllamaPool":
+        return cls(parse_hosts(spec) or [(default_url, None)], **kw)
+
+    # --- selección ---
+    def pick(self, model: Optional[str] = None, sticky_key: Optional[str] = None,
+             exclude: Tuple[Backend, ...] = ()) -> Backend:
+        now = time.time()
+        with self._lock:
+            serving = [b for b in self.backends if b.serves(model) and b not in exclude]
+            if not serving:
+                raise NoBackendAvailable(f"ningún backend sirve el modelo {model!r}")
+            cands = [b for b in serving if b.healthy(now)]
+            if not cands:  # todos expulsados: probar el que vuelve antes (mejor que fallar seguro)
+                cands = [min(serving, key=lambda b: b.ejected_until)]
+            least = min(b.outstanding for b in cands)
+            if sticky_key:
+                b = self._sticky.get(sticky_key)
+                if b in cands and b.outstanding <= least + self.sticky_slack:
+                    return self._acquire(b)
+            best = [b for b in cands if b.outstanding == least]
+            self._rr += 1
+            b = best[self._rr % len(best)]
+            if sticky_key:
+                if len(self._sticky) >= self.sticky_max:
+                    self._sticky.pop(next(iter(self._sticky)))
+                self._sticky[sticky_key] = b
+            return self._acquire(b)
+
+    def _acquire(self, b: Backend) -> Backend:
+        b.outstanding += 1
+        return b
+
+    def _release(self, b: Backend, latency: float, ok: bool) -> None:
+        with self._lock:
+            b.outstanding -= 1
+            b.requests += 1
+            b.latency_sum += latency
+            b.latency_ewma = latency if b.latency_ewma is None else 0.8 * b.latency_ewma + 0.2 * latency
+            if ok:
+                b.consecutive_failures = 0
+                return
+            b.errors += 1
+            b.consecutive_failures += 1
+            if b.consecutive_failures >= self.eject_after:
+                b.ejected_until = time.time() + self.eject_s
+                b.ejections += 1
+                print(f"[llm_pool] {b.url} expulsado {self.eject_s:.0f}s tras {b.consecutive_failures} fallos")
+
+    @contextmanager
+    def use(self, model: Optional[str] = None, sticky_key: Optional[str] = None,
+            exclude: Tuple[Backend, ...] = ()) -> Iterator[Backend]:
+        b = self.pick(model, sticky_key, exclude)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield b
+            ok = True
+        except GeneratorExit:  # el cliente cortó un streaming: no es culpa del backend
+            ok = True
+            raise
+        finally:
+            self._release(b, time.perf_counter() - t0, ok)
+
+    # --- llamadas ---
+    def post_json(self, path: str, payload: Dict, model: Optional[str] = None, sticky_key: Optional[str] = None,
+                  timeout: float = 120, retries: int = 1) -> Dict:
+        """POST no-streaming; ante error de conexión/5xx reintenta en otro backend."""
+        tried: Tuple[Backend, ...] = ()
+        for attempt in range(retries + 1):
+            try:
+                with self.use(model, sticky_key, exclude=tried) as b:
+                    tried += (b,)
+                    r = requests.post(f"{b.url}{path}", json=payload, timeout=timeout)
+                    r.raise_for_status()
+                    return r.json()
+            except (requests.ConnectionError, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or e.response is None or e.response.status_code >= 500
+                if attempt >= retries or not retryable or len(tried) >= len(self.each(model)):
+                    raise
+            except NoBackendAvailable:
+                raise
+        raise AssertionError("unreachable")
+
+    def stream_lines(self, path: str, payload: Dict, model: Optional[str] = None,
+                     sticky_key: Optional[str] = None, timeout: float = 120) -> Iterator[Dict]:
+        """POST streaming (NDJSON): el backend cuenta como ocupado hasta terminar de leer."""
+        with self.use(model, sticky_key) as b:
+            r = requests.post(f"{b.url}{path}", json=payload, stream=True, timeout=timeout)
+            r.raise_for_status()
+            for line in r.iter_lines(chunk_size=None):  # sin buffer de 512 bytes: cada token al llegar
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                yield chunk
+                if chunk.get("done"):
+                    break
+
+    def each(self, model: Optional[str] = None) -> List[Backend]:
+        return [b for b in self.backends if b.serves(model)]
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [b.stats() for b in self.backends]
+
+# --- Un pool por (spec, url por defecto) y proceso ---
+_pools: Dict[Tuple[str, str], OllamaPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(spec: str, default_url: str) -> OllamaPool:
+    key = (spec or "", default_url)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = OllamaPool.from_spec(spec, default_url)
+        return _pools[key]
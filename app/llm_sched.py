@@ -0,0 +1,147 @@
+# llm_sched.py — Control de admisión y cola con prioridades delante del LLM (Ollama)
+# Ollama en CPU atiende pocas generaciones a la vez; sin límite, una ráfaga hace que todas
+# se alarguen hasta el timeout. Aquí:
+#   - como mucho LLM_MAX_CONCURRENCY generaciones en vuelo por proceso
+#   - cola por prioridad: planner antes que answer, interactive (/chat, /ask) antes que batch
+#   - si la espera estimada supera el presupuesto de la clase => LLMOverloaded de inmediato
+#     (el caller degrada: planner heurístico / respuesta por plantilla)
+#
+# La clase del request (interactive | batch) viene del header X-Request-Class (middleware).
+
+import heapq, itertools, threading, time, contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import deadline
+from metrics import Counter, Gauge, Histogram, note_error
+
+KIND_RANK = {"planner": 0, "answer": 1}
+CALLER_RANK = {"interactive": 0, "batch": 1}
+
+request_class: contextvars.ContextVar[str] = contextvars.ContextVar("llm_request_class", default="interactive")
+
+LLM_QUEUE = Gauge("rag_llm_queue_length", "Generaciones esperando turno", labels=("kind",))
+LLM_INFLIGHT = Gauge("rag_llm_inflight", "Generaciones en curso")
+LLM_QUEUE_WAIT = Histogram("rag_llm_queue_wait_seconds", "Espera en cola antes de llegar al LLM", labels=("kind", "caller"))
+LLM_REJECTED = Counter("rag_llm_rejected_total", "Generaciones rechazadas por admisión", labels=("kind", "caller", "reason"))
+
+class LLMOverloaded(Exception):
+    """La espera estimada (o real) supera el presupuesto: usar la ruta degradada."""
+
+class _Waiter:
+    __slots__ = ("kind", "event", "granted", "cancelled")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int = 2, budgets: Optional[Dict[str, float]] = None,
+                 seed_service_s: Optional[Dict[str, float]] = None):
+        self.limit = max(1, int(max_concurrency))
+        self.budgets = budgets or {"interactive": 15.0, "batch": 120.0}
+        # tiempo de servicio estimado por tipo (EWMA); semilla conservadora para CPU
+        self.service_s = dict(seed_service_s or {"planner": 2.0, "answer": 8.0})
+        self._lock = threading.Lock()
+        self._running = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+
+    @staticmethod
+    def priority(kind: str, caller: str) -> int:
+        return CALLER_RANK.get(caller, 1) * len(KIND_RANK) + KIND_RANK.get(kind, 1)
+
+    def _predict(self, prio: int) -> float:
+        """Espera estimada: trabajo encolado con prioridad >= la mía + un servicio medio, repartido en los slots."""
+        ahead = sum(self.service_s[w.kind] for p, _, w in self._heap if p <= prio and not w.cancelled)
+        mean = sum(self.service_s.values()) / len(self.service_s)
+        return (ahead + mean) / self.limit
+
+    def _free(self) -> bool:
+        return self._running < self.limit and not any(not w.cancelled for _, _, w in self._heap)
+
+    def predicted_wait(self, kind: str, caller: Optional[str] = None) -> float:
+        with self._lock:
+            if self._free():
+                return 0.0
+            return self._predict(self.priority(kind, caller or request_class.get()))
+
+    def would_reject(self, kind: str, caller: Optional[str] = None) -> bool:
+        caller = caller or request_class.get()
+        return self.predicted_wait(kind, caller) > self.budgets.get(caller, self.budgets["interactive"])
+
+    def _reject(self, kind: str, caller: str, reason: str, msg: str):
+        LLM_REJECTED.inc(kind=kind, caller=caller, reason=reason)
+        note_error(f"llm:overloaded:{reason}")
+        raise LLMOverloaded(msg)
+
+    def _update_gauges(self) -> None:
+        counts = {k: 0 for k in KIND_RANK}
+        for _, _, w in self._heap:
+            if not w.cancelled:
+                counts[w.kind] = counts.get(w.kind, 0) + 1
+        for k, n in counts.items():
+            LLM_QUEUE.set(n, kind=k)
+        LLM_INFLIGHT.set(self._running)
+
+    @contextmanager
+    def slot(self, kind: str = "answer", caller: Optional[str] = None, budget_s: Optional[float] = None):
+        caller = caller or request_class.get()
+        budget = budget_s if budget_s is not None else self.budgets.get(caller, self.budgets["interactive"])
+        left = deadline.remaining()
+        if left is not None:  # no esperar turno más allá del deadline del request
+            budget = max(0.0, min(budget, left))
+        prio = self.priority(kind, caller)
+        t0 = time.perf_counter()
+        waiter = None
+        with self._lock:
+            if self._free():
+                self._running += 1
+            else:
+                pred = self._predict(prio)
+                if pred > budget:
+                    self._reject(kind, caller, "predicted", f"espera estimada {pred:.1f}s > {budget:.1f}s")
+                waiter = _Waiter(kind)
+                heapq.heappush(self._heap, (prio, next(self._seq), waiter))
+            self._update_gauges()
+
+        if waiter is not None and not waiter.event.wait(budget):
+            with self._lock:
+                if not waiter.granted:  # si el slot llegó justo ahora, se usa
+                    waiter.cancelled = True
+                    self._update_gauges()
+                    self._reject(kind, caller, "timeout", f"sin slot tras {budget:.1f}s en cola")
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - t0, kind=kind, caller=caller)
+
+        ts = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - ts
+            self._release(kind, dt)
+
+    def _release(self, kind: str, service_s: float) -> None:
+        with self._lock:
+            self.service_s[kind] = 0.8 * self.service_s.get(kind, service_s) + 0.2 * service_s
+            while self._heap:
+                _, _, w = heapq.heappop(self._heap)
+                if w.cancelled:
+                    continue
+                w.granted = True  # el slot pasa directo al siguiente (running no cambia)
+                w.event.set()
+                break
+            else:
+                self._running -= 1
+            self._update_gauges()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.limit,
+                "running": self._running,
+                "queued": sum(1 for _, _, w in self._heap if not w.cancelled),
+                "service_s": {k: round(v, 3) for k, v in self.service_s.items()},
+                "budgets_s": dict(self.budgets),
+            }
@@ -0,0 +1,356 @@
+# loadgen.py — Generador de carga y replay de logs contra la API
+#
+# Ejemplos:
+#   python loadgen.py --offline --synthetic 300 --concurrency 8
+#   python loadgen.py --offline --replay ../logs/requests.jsonl --rate 5 --duration 60
+#   python loadgen.py --base-url http://127.0.0.1:8000 --synthetic 200 --endpoints /chat /list
+#
+# Formato del log (una línea JSON por request; el mismo que escribe REQUEST_LOG_PATH):
+#   {"ts": 1700000000.0, "endpoint": "/chat", "payload": {"message": "..."}}
+#   ("intent" opcional; para /chat se toma del planner en la respuesta)
+#
+# --offline levanta la API en este proceso con Milvus/embeddings/Ollama falsos (stubs.py),
+# así la planificación de capacidad se puede repetir en un portátil sin servicios.
+
+import argparse, csv, json, math, os, random, socket, sys, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+ENDPOINTS = ["/ask", "/ask/stream", "/chat", "/chat/stream", "/list", "/aggregate"]
+NO_INFO = "No tengo esa información"
+
+COUNTRY_NAMES = {
+    "MX": "México", "BR": "Brasil", "AR": "Argentina", "CO": "Colombia", "CL": "Chile",
+    "PE": "Perú", "EC": "Ecuador", "CR": "Costa Rica", "PA": "Panamá", "PY": "Paraguay",
+}
+
+@dataclass
+class Job:
+    endpoint: str
+    payload: Dict
+    intent: Optional[str] = None
+
+@dataclass
+class Result:
+    endpoint: str
+    intent: str
+    latency_s: float
+    ok: bool
+    abstained: bool = False
+    ttft_s: Optional[float] = None
+
+# ========= Carga de trabajo =========
+def load_log(path: str) -> List[Job]:
+    """Lee un log JSONL. Acepta {"endpoint","payload"} o líneas sueltas con "message"/"question"."""
+    jobs: List[Job] = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                d = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if "endpoint" in d and isinstance(d.get("payload"), dict):
+                jobs.append(Job(d["endpoint"], d["payload"], d.get("intent")))
+            elif d.get("message"):
+                jobs.append(Job("/chat", {"message": d["message"]}, d.get("intent")))
+            elif d.get("question"):
+                jobs.append(Job("/ask", {"question": d["question"], "filters": d.get("filters")}, "lookup"))
+            else:
+                skipped += 1
+    if skipped:
+        print(f"[LOG] {skipped} línea(s) ignoradas en {path}")
+    return jobs
+
+def read_catalogue(csv_paths: List[str]) -> List[Dict]:
+    rows: List[Dict] = []
+    for p in csv_paths:
+        with open(p, newline="", encoding="utf-8") as f:
+            rows.extend(csv.DictReader(f))
+    return rows
+
+def synthetic_jobs(rows: List[Dict], n: int, endpoints: List[str], seed: int = 7) -> List[Job]:
+    """Preguntas de retail en español generadas desde el catálogo CSV."""
+    rnd = random.Random(seed)
+    cats = sorted({r["category"] for r in rows})
+    countries = sorted({r["country"] for r in rows})
+
+    def lookup_q(r: Dict) -> str:
+        return rnd.choice([
+            f"¿cuánto cuesta {r['name']}?",
+            f"precio del {r['name']} en {r['store']}",
+            f"¿a cómo está el {r['name']} en {COUNTRY_NAMES.get(r['country'], r['country'])}?",
+        ])
+
+    jobs: List[Job] = []
+    for _ in range(n):
+        ep = rnd.choice(endpoints)
+        r = rnd.choice(rows)
+        country = COUNTRY_NAMES.get(r["country"], r["country"])
+        if ep in ("/ask", "/ask/stream"):
+            jobs.append(Job(ep, {"question": lookup_q(r), "filters": {"country": r["country"]}}, "lookup"))
+        elif ep == "/list":
+            flt = {"country": rnd.choice(countries)}
+            if rnd.random() < 0.5:
+                flt["category"] = rnd.choice(cats)
+            jobs.append(Job(ep, {"filters": flt, "limit": 100}, "list"))
+        elif ep == "/aggregate":
+            jobs.append(Job(ep, {"filters": {"category": rnd.choice(cats)},
+                                 "group_by": rnd.choice(["store", "country", None])}, "aggregate"))
+        else:
+            b = rnd.choice(rows)
+            intent, msg = rnd.choice([
+                ("lookup", lookup_q(r)),
+                ("lookup", lookup_q(r)),
+                ("list", f"muéstrame los {r['category']} en {country}"),
+                ("aggregate", f"promedio de precios por tienda para {r['category']}"),
+                ("count", f"¿cuántos productos hay en {country}?"),
+                ("compare", f"compara {r['name']} vs {b['name']}"),
+            ])
+            jobs.append(Job(ep, {"message": msg}, intent))
+    return jobs
+
+# ========= Ejecución =========
+def _is_abstention(endpoint: str, data: Dict) -> bool:
+    if endpoint == "/list":
+        return not data.get("count")
+    if endpoint == "/aggregate":
+        return not data.get("groups")
+    txt = data.get("answer") or data.get("reply") or ""
+    return str(txt).startswith(NO_INFO)
+
+def run_one(session: requests.Session, base_url: str, job: Job, timeout: float,
+            t_sched: Optional[float] = None) -> Result:
+    # En modo open-loop la latencia se mide desde la llegada programada (evita coordinated omission)
+    t0 = t_sched if t_sched is not None else time.perf_counter()
+    intent = job.intent or job.endpoint.strip("/")
+    try:
+        if job.endpoint.endswith("/stream"):
+            ttft = None
+            parts: List[str] = []
+            event, done = "", None
+            with session.post(base_url + job.endpoint, json=job.payload, stream=True, timeout=timeout) as r:
+                r.raise_for_status()
+                for line in r.iter_lines(decode_unicode=True):
+                    if line and line.startswith("event:"):  # /chat/stream: eventos con nombre
+                        event = line[6:].strip()
+                        continue
+                    if not line or not line.startswith("data:"):
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    if event == "done":
+                        done = json.loads(line[5:])
+                    elif not event:
+                        parts.append(line[5:].strip())
+            if done is not None:
+                if not job.intent:
+                    intent = (done.get("planner") or {}).get("intent") or intent
+                txt = str(done.get("reply") or "")
+            else:
+                txt = " ".join(parts)
+            return Result(job.endpoint, intent, time.perf_counter() - t0, True,
+                          abstained=txt.startswith(NO_INFO), ttft_s=ttft)
+
+        r = session.post(base_url + job.endpoint, json=job.payload, timeout=timeout)
+        r.raise_for_status()
+        data = r.json()
+        if job.endpoint == "/chat" and not job.intent:
+            intent = (data.get("planner") or {}).get("intent") or intent
+        return Result(job.endpoint, intent, time.perf_counter() - t0, True,
+                      abstained=_is_abstention(job.endpoint, data))
+    except Exception:
+        return Result(job.endpoint, intent, time.perf_counter() - t0, False)
+
+def run(jobs: List[Job], base_url: str, concurrency: int = 4, rate: float = 0.0,
+        duration: float = 0.0, timeout: float = 120.0, seed: int = 7) -> Tuple[List[Result], float]:
+    """
+    rate <= 0: closed-loop (cada worker dispara el siguiente al terminar).
+    rate > 0:  open-loop con llegadas Poisson a `rate` req/s.
+    duration > 0 repite la carga en ciclo hasta cumplir el tiempo.
+    """
+    local = threading.local()
+    results: List[Result] = []
+    lock = threading.Lock()
+
+    def task(job: Job, t_sched: Optional[float] = None):
+        s = getattr(local, "session", None)
+        if s is None:
+            s = local.session = requests.Session()
+        res = run_one(s, base_url, job, timeout, t_sched)
+        with lock:
+            results.append(res)
+
+    def job_stream():
+        i = 0
+        while True:
+            if duration <= 0 and i >= len(jobs):
+                return
+            yield jobs[i % len(jobs)]
+            i += 1
+
+    rnd = random.Random(seed)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        if rate > 0:
+            t_next = start
+            for job in job_stream():
+                t_next += rnd.expovariate(rate)
+                if duration > 0 and t_next - start > duration:
+                    break
+                delay = t_next - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(task, job, t_next)
+        else:
+            sem = threading.Semaphore(max(1, concurrency))
+            for job in job_stream():
+                if duration > 0 and time.perf_counter() - start > duration:
+                    break
+                sem.acquire()
+                fut = pool.submit(task, job)
+                fut.add_done_callback(lambda _: sem.release())
+    return results, time.perf_counter() - start
+
+# ========= Reporte =========
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    v = sorted(values)
+    k = max(0, min(len(v) - 1, math.ceil(p / 100.0 * len(v)) - 1))
+    return v[k]
+
+def summarize(results: List[Result], elapsed: float) -> Dict:
+    groups: Dict[Tuple[str, str], List[Result]] = defaultdict(list)
+    for r in results:
+        groups[(r.endpoint, r.intent)].append(r)
+
+    def stats(rs: List[Result]) -> Dict:
+        lat = [r.latency_s * 1000.0 for r in rs if r.ok]
+        ttft = [r.ttft_s * 1000.0 for r in rs if r.ok and r.ttft_s is not None]
+        ok = [r for r in rs if r.ok]
+        out = {
+            "n": len(rs),
+            "error_rate": round(1 - len(ok) / len(rs), 4) if rs else 0.0,
+            "abstention_rate": round(sum(r.abstained for r in ok) / len(ok), 4) if ok else 0.0,
+            **{f"p{p}_ms": round(percentile(lat, p), 1) for p in (50, 90, 95, 99)},
+        }
+        if ttft:
+            out.update({f"ttft_p{p}_ms": round(percentile(ttft, p), 1) for p in (50, 90, 99)})
+        return out
+
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "overall": stats(results),
+        "by_endpoint_intent": {f"{ep} [{it}]": stats(rs) for (ep, it), rs in sorted(groups.items())},
+    }
+
+def print_report(rep: Dict) -> None:
+    print(f"\n[RESULT] {rep['requests']} requests en {rep['elapsed_s']}s -> {rep['throughput_rps']} req/s")
+    head = f"{'endpoint [intent]':32} {'n':>6} {'err%':>6} {'abst%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'ttft50':>8} {'ttft99':>8}"
+    print(head)
+    print("-" * len(head))
+    rows = list(rep["by_endpoint_intent"].items()) + [("TOTAL", rep["overall"])]
+    for name, s in rows:
+        print(f"{name:32} {s['n']:>6} {s['error_rate']*100:>6.1f} {s['abstention_rate']*100:>6.1f} "
+              f"{s['p50_ms']:>8} {s['p90_ms']:>8} {s['p99_ms']:>8} "
+              f"{s.get('ttft_p50_ms', '-'):>8} {s.get('ttft_p99_ms', '-'):>8}")
+
+# ========= Modo offline =========
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_offline(args) -> Tuple[str, callable]:
+    """Levanta FakeOllama + API (uvicorn en un hilo) con stubs de Milvus y embeddings."""
+    from stubs import FakeOllama, install
+
+    fakes = [FakeOllama(ttft_ms=args.stub_ttft_ms, tokens_per_s=args.stub_tps,
+                        fail_rate=args.stub_fail_rate).start() for _ in range(max(1, args.stub_backends))]
+    os.environ["OLLAMA_HOST"] = fakes[0].url  # antes de importar api (settings se cachea)
+    if len(fakes) > 1:
+        os.environ["OLLAMA_HOSTS"] = ",".join(f.url for f in fakes)
+    install(args.csv, embed_ms=args.stub_embed_ms, search_ms=args.stub_search_ms, query_ms=args.stub_query_ms)
+
+    import uvicorn
+    import api
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    t = threading.Thread(target=server.run, daemon=True)
+    t.start()
+    while not server.started:
+        time.sleep(0.05)
+    print(f"[OFFLINE] API stub en http://127.0.0.1:{port} | Ollama falso en {', '.join(f.url for f in fakes)}")
+
+    def stop():
+        server.should_exit = True
+        t.join(timeout=5)
+        for f in fakes:
+            f.stop()
+    return f"http://127.0.0.1:{port}", stop
+
+# ========= Main =========
+def main():
+    default_csv = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "sample.csv"))
+    parser = argparse.ArgumentParser(description="Generador de carga / replay contra la API RAG")
+    parser.add_argument("--base-url", type=str, default="http://127.0.0.1:8000")
+    parser.add_argument("--offline", action="store_true", help="API en proceso con backends falsos")
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument("--replay", type=str, help="Log JSONL a reproducir")
+    src.add_argument("--synthetic", type=int, default=200, help="N preguntas sintéticas desde el CSV")
+    parser.add_argument("--csv", nargs="+", default=[default_csv], help="Catálogo(s) CSV")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="req/s (Poisson). 0 = closed-loop")
+    parser.add_argument("--duration", type=float, default=0.0, help="segundos (repite la carga en ciclo)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=str, help="Escribe el reporte en este archivo")
+    # latencias simuladas del modo offline
+    parser.add_argument("--stub-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--stub-tps", type=float, default=20.0, help="tokens/s del LLM falso")
+    parser.add_argument("--stub-fail-rate", type=float, default=0.0)
+    parser.add_argument("--stub-backends", type=int, default=1, help="N servidores Ollama falsos (OLLAMA_HOSTS)")
+    parser.add_argument("--stub-embed-ms", type=float, default=15.0)
+    parser.add_argument("--stub-search-ms", type=float, default=5.0)
+    parser.add_argument("--stub-query-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    jobs = load_log(args.replay) if args.replay else \
+        synthetic_jobs(read_catalogue(args.csv), args.synthetic, args.endpoints, seed=args.seed)
+    if not jobs:
+        print("No hay requests para ejecutar.")
+        sys.exit(1)
+
+    stop = None
+    base_url = args.base_url.rstrip("/")
+    if args.offline:
+        base_url, stop = start_offline(args)
+    try:
+        print(f"[RUN] {len(jobs)} jobs | concurrency={args.concurrency} rate={args.rate or 'closed-loop'} "
+              f"duration={args.duration or '-'}")
+        results, elapsed = run(jobs, base_url, args.concurrency, args.rate, args.duration,
+                               args.timeout, args.seed)
+    finally:
+        if stop:
+            stop()
+
+    rep = summarize(results, elapsed)
+    print_report(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
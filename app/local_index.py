@@ -0,0 +1,493 @@
+# local_index.py — Réplica local de solo lectura del catálogo (vectores + columnas) en NumPy mmap
+# Milvus sigue siendo la fuente de verdad. Esto sirve búsqueda y listados en proceso,
+# sin salto de red, y varios workers comparten la misma copia en page cache.
+#
+#   python local_index.py snapshot --path ../data/local_index            # copia completa
+#   python local_index.py refresh  --path ../data/local_index            # incremental por last_seen
+#   python local_index.py build-ivf --path ../data/local_index --nlist 256
+#
+# Layout: <path>/CURRENT apunta a una versión inmutable <path>/v<ms>/ con
+#   vectors.f32              float32 [N, dim] (crudo, np.memmap)
+#   product_id.npy           ids (unicode fijo) + pk_order.npy / pk_sorted.npy para cursores
+#   <campo>.codes.npy        columnas categóricas (country/store/...) como códigos int32
+#   <campo>.bin/.off.npy     texto libre como blob UTF-8 + offsets
+#   <campo>.npy              numéricas (price/size/last_seen)
+#   centroids.npy/assign.npy índice IVF opcional
+#   codes_b1.npy             signo por dimensión en bits, uint8 [N, dim/8]   (COARSE_SEARCH=binary)
+#   codes_i8.npy + sq8_scale int8 [N, dim] con escala por dimensión        (COARSE_SEARCH=sq8)
+
+import os, json, time, shutil, argparse, threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from coarse import binarize, coarse_scores, sq8_encode, sq8_scale
+from textnorm import DERIVED_FIELDS, add_derived, sanitize
+
+# name_norm es de alta cardinalidad pero es filtro (name -> name_norm): va codificado como las categóricas
+CAT_FIELDS = ("country", "store", "category", "brand", "unit", "currency", "store_norm", "brand_norm", "unit_base",
+              "name_norm")
+TEXT_FIELDS = ("name", "url", "canonical_text")
+NUM_FIELDS = {"price": np.float64, "size": np.float64, "last_seen": np.int64, "unit_price": np.float64}
+SNAPSHOT_FIELDS = ["product_id", *CAT_FIELDS, *TEXT_FIELDS, *NUM_FIELDS]
+
+SCAN_CHUNK = 65536  # filas por bloque en búsqueda exacta (acota memoria temporal)
+KEEP_VERSIONS = 3
+
+# =============================================================================
+# Escritura
+# =============================================================================
+class _VersionWriter:
+    """Escribe una versión nueva en streaming; publish() la activa de forma atómica."""
+
+    def __init__(self, root: str, dim: int):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.dim = dim
+        self.dir = os.path.join(root, f"v{int(time.time() * 1000)}")
+        os.makedirs(self.dir)
+        self._vf = open(os.path.join(self.dir, "vectors.f32"), "wb")
+        self._cols: Dict[str, list] = {f: [] for f in SNAPSHOT_FIELDS}
+        self.n = 0
+
+    def append(self, rows: List[Dict], vecs) -> None:
+        m = np.ascontiguousarray(np.asarray(vecs, dtype=np.float32).reshape(len(rows), self.dim))
+        self._vf.write(m.tobytes())
+        rows = [r if r.get("name_norm") is not None else _legacy_row(r) for r in rows]
+        for f in SNAPSHOT_FIELDS:
+            self._cols[f].extend(r.get(f) for r in rows)
+        self.n += len(rows)
+
+    def publish(self, centroids: Optional[np.ndarray] = None) -> str:
+        self._vf.close()
+        d, meta = self.dir, {"count": self.n, "dim": self.dim, "created": int(time.time()), "vocab": {}}
+
+        pk = np.array([str(x) for x in self._cols["product_id"]], dtype=str)
+        np.save(os.path.join(d, "product_id.npy"), pk)
+        order = np.argsort(pk, kind="stable").astype(np.int64)
+        np.save(os.path.join(d, "pk_order.npy"), order)
+        np.save(os.path.join(d, "pk_sorted.npy"), pk[order])
+
+        for f in CAT_FIELDS:
+            vals = [str(v or "") for v in self._cols[f]]
+            vocab = sorted(set(vals))
+            pos = {v: i for i, v in enumerate(vocab)}
+            np.save(os.path.join(d, f"{f}.codes.npy"), np.array([pos[v] for v in vals], dtype=np.int32))
+            meta["vocab"][f] = vocab
+
+        for f in TEXT_FIELDS:
+            enc = [str(v or "").encode("utf-8") for v in self._cols[f]]
+            off = np.zeros(len(enc) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in enc], out=off[1:])
+            with open(os.path.join(d, f"{f}.bin"), "wb") as fh:
+                fh.write(b"".join(enc))
+            np.save(os.path.join(d, f"{f}.off.npy"), off)
+
+        for f, dt in NUM_FIELDS.items():
+            np.save(os.path.join(d, f"{f}.npy"), np.array([v or 0 for v in self._cols[f]], dtype=dt))
+        meta["max_last_seen"] = max((int(v or 0) for v in self._cols["last_seen"]), default=0)
+
+        if self.n:  # códigos compactos para búsqueda en dos etapas (coarse.py)
+            vecs = np.memmap(os.path.join(d, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.n, self.dim))
+            scale = sq8_scale(vecs)
+            np.save(os.path.join(d, "sq8_scale.npy"), scale)
+            b1 = np.lib.format.open_memmap(os.path.join(d, "codes_b1.npy"), mode="w+", dtype=np.uint8,
+                                           shape=(self.n, (self.dim + 7) // 8))
+            i8 = np.lib.format.open_memmap(os.path.join(d, "codes_i8.npy"), mode="w+", dtype=np.int8,
+                                           shape=(self.n, self.dim))
+            for s0 in range(0, self.n, SCAN_CHUNK):
+                chunk = np.asarray(vecs[s0:s0 + SCAN_CHUNK])
+                b1[s0:s0 + SCAN_CHUNK] = binarize(chunk)
+                i8[s0:s0 + SCAN_CHUNK] = sq8_encode(chunk, scale)
+            b1.flush()
+            i8.flush()
+
+        if centroids is not None and self.n:
+            np.save(os.path.join(d, "centroids.npy"), centroids.astype(np.float32))
+            vecs = np.memmap(os.path.join(d, "vectors.f32"), dtype=np.float32, mode="r", shape=(self.n, self.dim))
+            np.save(os.path.join(d, "assign.npy"), _assign(vecs, centroids))
+            meta["nlist"] = int(len(centroids))
+
+        with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False)
+        tmp = os.path.join(self.root, "CURRENT.tmp")
+        with open(tmp, "w") as fh:
+            fh.write(os.path.basename(d))
+        os.replace(tmp, os.path.join(self.root, "CURRENT"))  # activación atómica
+        _cleanup(self.root, keep=KEEP_VERSIONS)
+        return d
+
+def _legacy_row(r: Dict) -> Dict:
+    """Fila de una colección anterior a los derivados de ingesta: se completan aquí, una vez."""
+    r = dict(r, canonical_text=sanitize(r.get("canonical_text")))
+    return add_derived(r)
+
+def _cleanup(root: str, keep: int) -> None:
+    # los workers que aún mapean una versión borrada siguen leyendo (inode vivo) hasta recargar
+    versions = sorted(x for x in os.listdir(root) if x.startswith("v") and os.path.isdir(os.path.join(root, x)))
+    for v in versions[:-keep]:
+        shutil.rmtree(os.path.join(root, v), ignore_errors=True)
+
+def _assign(vecs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(vecs), dtype=np.int32)
+    for i in range(0, len(vecs), SCAN_CHUNK):
+        out[i:i + SCAN_CHUNK] = np.argmax(np.asarray(vecs[i:i + SCAN_CHUNK]) @ centroids.T, axis=1)
+    return out
+
+def train_ivf(vecs: np.ndarray, nlist: int, iters: int = 10, sample: int = 100_000, seed: int = 0) -> np.ndarray:
+    """k-means esférico (vectores normalizados, similitud IP) sobre una muestra."""
+    rnd = np.random.default_rng(seed)
+    n = len(vecs)
+    idx = rnd.choice(n, size=min(n, sample), replace=False)
+    x = np.asarray(vecs[np.sort(idx)], dtype=np.float32)
+    nlist = max(1, min(nlist, len(x)))
+    c = x[rnd.choice(len(x), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        a = np.argmax(x @ c.T, axis=1)
+        for k in range(nlist):
+            members = x[a == k]
+            if len(members):
+                c[k] = members.sum(axis=0)
+        c /= np.maximum(np.linalg.norm(c, axis=1, keepdims=True), 1e-12)
+    return c
+
+# =============================================================================
+# Lectura
+# =============================================================================
+class LocalIndex:
+    """Versión publicada, mapeada en memoria. Inmutable: para ver cambios se abre otra."""
+
+    def __init__(self, root: str):
+        with open(os.path.join(root, "CURRENT")) as fh:
+            self.version = fh.read().strip()
+        d = os.path.join(root, self.version)
+        with open(os.path.join(d, "meta.json"), encoding="utf-8") as fh:
+            self.meta = json.load(fh)
+        self.n, self.dim = int(self.meta["count"]), int(self.meta["dim"])
+        self.max_last_seen = int(self.meta.get("max_last_seen", 0))
+        self.vectors = np.memmap(os.path.join(d, "vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(self.n, self.dim)) if self.n else np.zeros((0, self.dim), np.float32)
+        self.pk = np.load(os.path.join(d, "product_id.npy"), mmap_mode="r")
+        self.pk_order = np.load(os.path.join(d, "pk_order.npy"), mmap_mode="r")
+        self.pk_sorted = np.load(os.path.join(d, "pk_sorted.npy"), mmap_mode="r")
+        # versiones publicadas antes de los derivados de ingesta no traen todas las columnas
+        cat = [f for f in CAT_FIELDS if f in self.meta["vocab"]]
+        self.codes = {f: np.load(os.path.join(d, f"{f}.codes.npy"), mmap_mode="r") for f in cat}
+        self.vocab = {f: {v: i for i, v in enumerate(self.meta["vocab"][f])} for f in cat}
+        self._vocab_list = {f: self.meta["vocab"][f] for f in cat}
+        self.text = {}
+        for f in (*TEXT_FIELDS, *(f for f in CAT_FIELDS if f not in self.codes)):  # name_norm como texto: < v2
+            if not os.path.exists(os.path.join(d, f"{f}.bin")):
+                continue
+            size = os.path.getsize(os.path.join(d, f"{f}.bin"))
+            blob = np.memmap(os.path.join(d, f"{f}.bin"), dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+            self.text[f] = (blob, np.load(os.path.join(d, f"{f}.off.npy"), mmap_mode="r"))
+        self.nums = {f: np.load(os.path.join(d, f"{f}.npy"), mmap_mode="r") for f in NUM_FIELDS
+                     if os.path.exists(os.path.join(d, f"{f}.npy"))}
+        self.fields = frozenset(["product_id", *self.codes, *self.text, *self.nums])
+        self.snapshot_fields = [f for f in SNAPSHOT_FIELDS if f in self.fields]
+        self._text_codes: Dict[str, Tuple[np.ndarray, Dict[str, int]]] = {}
+        self.coarse_codes: Dict[str, np.ndarray] = {}
+        for kind, fname in (("binary", "codes_b1.npy"), ("sq8", "codes_i8.npy")):
+            if os.path.exists(os.path.join(d, fname)):
+                self.coarse_codes[kind] = np.load(os.path.join(d, fname), mmap_mode="r")
+        self.sq8_scale = np.load(os.path.join(d, "sq8_scale.npy")) if "sq8" in self.coarse_codes else None
+        self.centroids = self.assign = None
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        if os.path.exists(os.path.join(d, "centroids.npy")):
+            self.centroids = np.load(os.path.join(d, "centroids.npy"))
+            self.assign = np.load(os.path.join(d, "assign.npy"), mmap_mode="r")
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+
+    # --- columnas ---
+    def value(self, field: str, i: int):
+        if field == "product_id":
+            return str(self.pk[i])
+        if field in self.codes:
+            return self._vocab_list[field][int(self.codes[field][i])]
+        if field in self.text:
+            blob, off = self.text[field]
+            return bytes(blob[off[i]:off[i + 1]]).decode("utf-8")
+        if field in self.nums:
+            return self.nums[field][i].item()
+        raise KeyError(field)
+
+    def row(self, i: int, fields: Iterable[str]) -> Dict:
+        return {f: self.value(f, i) for f in fields}
+
+    def text_codes(self, field: str) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Columna de texto usada como filtro: se codifica una vez por versión y se filtra como categórica."""
+        got = self._text_codes.get(field)
+        if got is None:
+            blob, off = self.text[field]
+            raw, off = bytes(blob), np.asarray(off).tolist()
+            vocab: Dict[str, int] = {}
+            codes = np.fromiter((vocab.setdefault(raw[off[i]:off[i + 1]].decode("utf-8"), len(vocab))
+                                 for i in range(self.n)), dtype=np.int32, count=self.n)
+            got = self._text_codes[field] = (codes, vocab)  # carrera benigna: mismo resultado
+        return got
+
+    def mask(self, filters: Optional[Dict]) -> Optional[np.ndarray]:
+        """Máscara booleana para filtros de igualdad exacta (None => sin filtro)."""
+        if not filters:
+            return None
+        m = np.ones(self.n, dtype=bool)
+        for k, v in filters.items():
+            if k in self.codes:
+                code = self.vocab[k].get(str(v))
+                if code is None:
+                    return np.zeros(self.n, dtype=bool)
+                m &= np.asarray(self.codes[k]) == code
+            elif k in self.nums:
+                try:
+                    m &= np.asarray(self.nums[k]) == float(v)
+                except (TypeError, ValueError):
+                    return np.zeros(self.n, dtype=bool)
+            elif k == "product_id":
+                m &= np.asarray(self.pk) == str(v)
+            elif k in self.text:
+                codes, vocab = self.text_codes(k)
+                code = vocab.get(str(v))
+                if code is None:
+                    return np.zeros(self.n, dtype=bool)
+                m &= codes == code
+            else:
+                raise ValueError(f"Filtro no soportado en índice local: {k}")
+        return m
+
+    # --- búsqueda ---
+    def _topk(self, rows: Optional[np.ndarray], k: int, score) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k por score(sel) sobre `rows` (None => todas), por bloques; sel es slice o array de filas."""
+        best_i = np.empty(0, dtype=np.int64)
+        best_s = np.empty(0, dtype=np.float32)
+        total = self.n if rows is None else len(rows)
+        for s0 in range(0, total, SCAN_CHUNK):
+            if rows is None:
+                idx = np.arange(s0, min(s0 + SCAN_CHUNK, total))
+                sc = score(slice(s0, s0 + SCAN_CHUNK))
+            else:
+                idx = rows[s0:s0 + SCAN_CHUNK]
+                sc = score(idx)
+            cand_i = np.concatenate([best_i, idx])
+            cand_s = np.concatenate([best_s, sc])
+            if len(cand_s) > k:
+                top = np.argpartition(-cand_s, k - 1)[:k]
+                cand_i, cand_s = cand_i[top], cand_s[top]
+            best_i, best_s = cand_i, cand_s
+        o = np.argsort(-best_s)
+        return best_i[o], best_s[o]
+
+    def _scan(self, q: np.ndarray, rows: Optional[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k exacto por IP."""
+        return self._topk(rows, k, lambda sel: np.asarray(self.vectors[sel]) @ q)
+
+    def has_coarse(self, kind: str) -> bool:
+        return kind in self.coarse_codes
+
+    def _coarse_candidates(self, q: np.ndarray, rows: Optional[np.ndarray], k: int, kind: str) -> np.ndarray:
+        """Candidatos por código compacto, ordenados por fila (lectura secuencial del mmap float)."""
+        codes = self.coarse_codes[kind]
+        idx, _ = self._topk(rows, k, lambda sel: coarse_scores(kind, np.asarray(codes[sel]), q, self.sq8_scale))
+        return np.sort(idx)
+
+    def _probe_rows(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        order, bounds = self._lists
+        lists = np.argsort(-(self.centroids @ q))[:max(1, nprobe)]
+        return np.sort(np.concatenate([order[bounds[c]:bounds[c + 1]] for c in lists]))
+
+    def search(self, qvecs, filters: Optional[Dict], topk: int, sim_th: float,
+               fields: List[str], nprobe: int = 0, coarse: str = "", oversample: int = 10) -> List[List[Dict]]:
+        """
+        Exacta por defecto; IVF si hay centroides y nprobe > 0.
+        coarse=binary|sq8: topk*oversample candidatos por código compacto y re-rank exacto.
+        """
+        m = self.mask(filters)
+        base = None if m is None else np.nonzero(m)[0]
+        out: List[List[Dict]] = []
+        for q in np.asarray(qvecs, dtype=np.float32):
+            rows = base
+            if self._lists is not None and nprobe > 0:
+                rows = self._probe_rows(q, nprobe)
+                if m is not None:
+                    rows = rows[m[rows]]
+            if coarse and self.has_coarse(coarse) and self.n:
+                rows = self._coarse_candidates(q, rows, max(1, topk) * max(1, oversample), coarse)
+            idx, sc = self._scan(q, rows, max(1, topk)) if self.n else (np.empty(0, np.int64), np.empty(0))
+            hits = []
+            for i, s in zip(idx, sc):
+                if s < sim_th:
+                    break
+                hits.append({"score": float(s), **self.row(int(i), fields)})
+            out.append(hits)
+        return out
+
+    # --- listados (orden por product_id, cursor keyset) ---
+    def query(self, filters: Optional[Dict], fields: List[str], limit: int,
+              cursor: Optional[str] = None) -> List[Dict]:
+        start = int(np.searchsorted(self.pk_sorted, str(cursor), side="right")) if cursor else 0
+        sel = np.asarray(self.pk_order[start:])
+        m = self.mask(filters)
+        if m is not None:
+            sel = sel[m[sel]]
+        return [self.row(int(i), fields) for i in sel[:limit]]
+
+    def iter_batches(self, filters: Optional[Dict], fields: List[str], batch_size: int) -> Iterator[List[Dict]]:
+        m = self.mask(filters)
+        sel = np.asarray(self.pk_order)
+        if m is not None:
+            sel = sel[m[sel]]
+        for s0 in range(0, len(sel), batch_size):
+            yield [self.row(int(i), fields) for i in sel[s0:s0 + batch_size]]
+
+    def _pk_rows(self, ids: List[str]) -> Iterator[Tuple[str, int]]:
+        for pk in ids:
+            j = int(np.searchsorted(self.pk_sorted, str(pk)))
+            if j < self.n and str(self.pk_sorted[j]) == str(pk):
+                yield str(pk), int(self.pk_order[j])
+
+    def vectors_by_pk(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Vectores float de una lista de pk (re-rank de la búsqueda en dos etapas sobre Milvus)."""
+        return {pk: np.asarray(self.vectors[i]) for pk, i in self._pk_rows(ids)}
+
+    def by_pk(self, ids: List[str], fields: List[str]) -> List[Dict]:
+        return [self.row(i, fields) for _, i in self._pk_rows(ids)]
+
+    # --- top-N por columna numérica (cheapest / priciest) ---
+    def rank(self, filters: Optional[Dict], by: str, n: int, desc: bool, fields: List[str]) -> List[Dict]:
+        """argpartition sobre la columna mmap; valores <= 0 (sin precio / no convertible) se excluyen."""
+        v = np.asarray(self.nums[by])
+        sel = np.flatnonzero(v > 0)
+        m = self.mask(filters)
+        if m is not None:
+            sel = sel[m[sel]]
+        key = -v[sel] if desc else v[sel]
+        if len(sel) > n:
+            part = np.argpartition(key, n - 1)[:n]
+            sel, key = sel[part], key[part]
+        order = sorted(range(len(sel)), key=lambda j: (key[j], str(self.pk[sel[j]])))
+        return [self.row(int(sel[j]), fields) for j in order]
+
+# --- Caché por proceso con recarga cuando cambia CURRENT ---
+_local: Optional[LocalIndex] = None
+_local_lock = threading.Lock()
+_last_check = 0.0
+
+def get_local_index(root: str, check_every_s: float = 10.0) -> LocalIndex:
+    global _local, _last_check
+    now = time.monotonic()
+    if _local is not None and now - _last_check < check_every_s:
+        return _local
+    with _local_lock:
+        _last_check = now
+        try:
+            with open(os.path.join(root, "CURRENT")) as fh:
+                current = fh.read().strip()
+        except FileNotFoundError:
+            if _local is None:
+                raise
+            return _local
+        if _local is None or _local.version != current:
+            _local = LocalIndex(root)
+            print(f"[local-index] cargada versión {current} ({_local.n} filas)")
+    return _local
+
+# =============================================================================
+# Sincronización desde Milvus
+# =============================================================================
+def _source_fields(col) -> List[str]:
+    """SNAPSHOT_FIELDS que existen en la colección; los derivados que falten se calculan al escribir."""
+    try:
+        names = {f.name for f in col.schema.fields}
+    except Exception:  # stubs
+        return SNAPSHOT_FIELDS
+    return [f for f in SNAPSHOT_FIELDS if f in names or f not in DERIVED_FIELDS]
+
+def _iter_milvus(col, expr: str, vector_field: str, batch_size: int = 1000) -> Iterator[List[Dict]]:
+    it = col.query_iterator(batch_size=batch_size, expr=expr, output_fields=_source_fields(col) + [vector_field])
+    try:
+        while True:
+            batch = it.next()
+            if not batch:
+                break
+            yield batch
+    finally:
+        it.close()
+
+def snapshot(col, root: str, dim: int, vector_field: str = "vector") -> str:
+    """Copia completa de la colección a una versión nueva."""
+    base = _open_or_none(root)
+    w = _VersionWriter(root, dim)
+    for batch in _iter_milvus(col, "", vector_field):
+        w.append(batch, [r[vector_field] for r in batch])
+    return w.publish(centroids=base.centroids if base is not None else None)
+
+def refresh(col, root: str, vector_field: str = "vector") -> str:
+    """
+    Incremental: trae de Milvus solo filas con last_seen > max_last_seen de la versión actual
+    y reescribe una versión nueva (altas + actualizaciones). Las bajas requieren snapshot.
+    """
+    base = LocalIndex(root)
+    updates: Dict[str, Tuple[Dict, list]] = {}
+    for batch in _iter_milvus(col, f"last_seen > {base.max_last_seen}", vector_field):
+        for r in batch:
+            updates[str(r["product_id"])] = (r, r[vector_field])
+    if not updates:
+        return os.path.join(root, base.version)
+
+    w = _VersionWriter(root, base.dim)
+    for s0 in range(0, base.n, SCAN_CHUNK):
+        ids = range(s0, min(s0 + SCAN_CHUNK, base.n))
+        rows = [base.row(i, base.snapshot_fields) for i in ids]
+        vecs = np.array(base.vectors[s0:s0 + SCAN_CHUNK])
+        for j, r in enumerate(rows):
+            upd = updates.pop(r["product_id"], None)
+            if upd is not None:
+                rows[j], vecs[j] = upd[0], upd[1]
+        w.append(rows, vecs)
+    if updates:
+        new = list(updates.values())
+        w.append([r for r, _ in new], [v for _, v in new])
+    return w.publish(centroids=base.centroids)
+
+def build_ivf(root: str, nlist: int, iters: int = 10) -> str:
+    """Entrena centroides sobre la versión actual y publica una copia con índice IVF."""
+    base = LocalIndex(root)
+    c = train_ivf(base.vectors, nlist, iters=iters)
+    w = _VersionWriter(root, base.dim)
+    for s0 in range(0, base.n, SCAN_CHUNK):
+        ids = range(s0, min(s0 + SCAN_CHUNK, base.n))
+        w.append([base.row(i, base.snapshot_fields) for i in ids], base.vectors[s0:s0 + SCAN_CHUNK])
+    return w.publish(centroids=c)
+
+def _open_or_none(root: str) -> Optional[LocalIndex]:
+    try:
+        return LocalIndex(root)
+    except FileNotFoundError:
+        return None
+
+def main():
+    from settings import get_settings
+    S = get_settings()
+    parser = argparse.ArgumentParser(description="Réplica local (NumPy mmap) de la colección de Milvus")
+    parser.add_argument("cmd", choices=["snapshot", "refresh", "build-ivf"])
+    parser.add_argument("--path", type=str, default=S.local_index_path)
+    parser.add_argument("--nlist", type=int, default=256)
+    args = parser.parse_args()
+
+    if args.cmd == "build-ivf":
+        print(f"[OK] IVF publicado en {build_ivf(args.path, args.nlist)}")
+        return
+
+    import retrieve
+    col = retrieve._get_collection()
+    t0 = time.perf_counter()
+    if args.cmd == "snapshot":
+        out = snapshot(col, args.path, S.milvus_dim, vector_field=retrieve.vector_field())
+    else:
+        out = refresh(col, args.path, vector_field=retrieve.vector_field())
+    print(f"[OK] {args.cmd} -> {out} en {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()
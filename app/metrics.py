@@ -0,0 +1,169 @@
+# metrics.py — Métricas en proceso con exposición estilo Prometheus (sin dependencias)
+# Cada worker de uvicorn tiene su propio registro; scrapea cada proceso por separado.
+
+import threading, time, contextvars
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Buckets de latencia (segundos): de regex/filtros (ms) a generación LLM en CPU (decenas de s)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: List["_Metric"] = []
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(k, "")) for k in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        out = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for k, v in items:
+            out.append(f"{self.name}{_fmt_labels(self.labels, k)} {v}")
+        return out
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # por serie: [conteos por bucket..., suma, total]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        k = self._key(labels)
+        with self._lock:
+            s = self._series.get(k)
+            if s is None:
+                s = self._series[k] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        out = super().render()
+        with self._lock:
+            items = [(k, list(s)) for k, s in self._series.items()]
+        for k, s in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += s[i]
+                lbl = _fmt_labels(self.labels, k, 'le="%s"' % b)
+                out.append(f"{self.name}_bucket{lbl} {acc}")
+            lbl = _fmt_labels(self.labels, k, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{lbl} {s[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, k)} {s[-2]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, k)} {s[-1]}")
+        return out
+
+class Callback(_Metric):
+    """Serie calculada en cada scrape a partir de estado externo: fn() -> [(labels, valor), ...]."""
+
+    def __init__(self, name: str, help: str, fn, labels: Tuple[str, ...] = (), kind: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        out = super().render()
+        for labels, v in self._fn():
+            out.append(f"{self.name}{_fmt_labels(self.labels, self._key(labels))} {v}")
+        return out
+
+def render() -> str:
+    """Exposición en formato texto de Prometheus (text/plain; version=0.0.4)."""
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+# -----------------------------------------------------------------------------
+# Métricas del pipeline RAG
+# -----------------------------------------------------------------------------
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latencia por etapa del pipeline", labels=("stage",))
+REQUEST_SECONDS = Histogram("rag_request_seconds", "Latencia total por endpoint", labels=("endpoint",))
+CACHE_REQUESTS = Counter("rag_cache_requests_total", "Consultas a cachés en proceso", labels=("cache", "result"))
+ABSTENTIONS = Counter("rag_abstentions_total", "Respuestas 'No tengo esa información'", labels=("endpoint",))
+LLM_FAILURES = Counter("rag_llm_failures_total", "Fallos de generación LLM", labels=("reason",))
+MILVUS_CALLS = Counter("rag_milvus_calls_total", "Llamadas a Milvus", labels=("op",))
+ANSWERS = Counter("rag_answers_total", "Respuestas por plantilla, LLM o degradadas (cola del LLM llena)", labels=("endpoint", "path"))
+
+# -----------------------------------------------------------------------------
+# Traza por request (desglose de tiempos opcional en la respuesta)
+# -----------------------------------------------------------------------------
+_trace: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("rag_trace", default=None)
+
+def start_trace() -> Dict:
+    """Abre una traza para el request actual; stage()/note_error() la van llenando."""
+    t = {"stages_ms": {}, "errors": []}
+    _trace.set(t)
+    return t
+
+def current_trace() -> Optional[Dict]:
+    return _trace.get()
+
+def note_error(kind: str) -> None:
+    t = _trace.get()
+    if t is not None:
+        t["errors"].append(kind)
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa: histograma global + acumulado en la traza del request (ms)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, stage=name)
+        t = _trace.get()
+        if t is not None:
+            st = t["stages_ms"]
+            st[name] = round(st.get(name, 0.0) + dt * 1000.0, 3)
@@ -0,0 +1,92 @@
+# profiler.py — Diagnóstico en caliente (rutas /admin/*, solo con ENABLE_ADMIN_ROUTES)
+#   sample()   profiler por muestreo: sys._current_frames() cada `interval_s` sobre TODOS los hilos
+#              (workers del threadpool, streaming, scheduler). Salida "collapsed stacks"
+#              (frame;frame;frame N) lista para flamegraph.pl / speedscope / inferno.
+#   SlowLog    ring buffer acotado con la traza por etapa de los requests más lentos que el umbral.
+#
+# Muestrear no instrumenta nada: el costo es recorrer las pilas ~200 veces/s mientras dura el perfil.
+
+import os, sys, threading, time
+from collections import Counter as _Counter, deque
+from typing import Dict, List, Optional
+
+# Hojas de hilos ociosos (esperando trabajo/IO): se descartan salvo idle=True
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker"),
+    ("socketserver.py", "serve_forever"), ("base_events.py", "_run_once"),
+}
+
+_profile_lock = threading.Lock()
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def sample(seconds: float, interval_s: float = 0.005, idle: bool = False, by_thread: bool = False) -> str:
+    """Perfil de `seconds` segundos; una línea por pila distinta: "raíz;...;hoja cuenta"."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("ya hay un perfil en curso")
+    try:
+        me = threading.get_ident()
+        counts: _Counter = _Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()} if by_thread else {}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if by_thread:
+                    stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval_s)
+        return "\n".join(f"{k} {v}" for k, v in counts.most_common()) + ("\n" if counts else "")
+    finally:
+        _profile_lock.release()
+
+class SlowLog:
+    """Últimos `capacity` requests lentos (FIFO): ruta, status, latencia y ms por etapa."""
+
+    def __init__(self, capacity: int = 200, threshold_ms: float = 2000.0):
+        self.threshold_ms = threshold_ms
+        self._items: deque = deque(maxlen=max(1, capacity))
+        self._lock = threading.Lock()
+        self.seen = 0
+
+    def maybe_add(self, latency_ms: float, entry: Dict) -> bool:
+        if latency_ms < self.threshold_ms:
+            return False
+        entry["latency_ms"] = round(latency_ms, 1)
+        with self._lock:
+            self._items.append(entry)
+            self.seen += 1
+        return True
+
+    def query(self, path: Optional[str] = None, min_ms: float = 0.0, since: Optional[float] = None,
+              limit: int = 50) -> List[Dict]:
+        """Más recientes primero."""
+        with self._lock:
+            items = list(self._items)
+        out = []
+        for e in reversed(items):
+            if path and e.get("path") != path:
+                continue
+            if e["latency_ms"] < min_ms or (since is not None and e["ts"] < since):
+                continue
+            out.append(e)
+            if len(out) >= limit:
+                break
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
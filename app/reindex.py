@@ -0,0 +1,225 @@
+# reindex.py — Re-indexado blue/green con alias de Milvus
+# La API lee MILVUS_COLLECTION (retail_products) como ALIAS; cada rebuild crea una colección
+# versionada retail_products_<versión>, la llena, indexa, carga y calienta sin tocar la viva,
+# y recién entonces mueve el alias (alter_alias es atómico). La versión anterior queda para rollback.
+#
+#   python reindex.py adopt                       # una vez: retail_products -> retail_products_v0 + alias
+#   python reindex.py build --csv ../sample.csv   # crea y calienta retail_products_v<timestamp>
+#   python reindex.py switch v20250101030000      # alias -> esa versión
+#   python reindex.py rebuild --csv feed.csv --mode bulk   # build + switch
+#   python reindex.py rollback | status | drop <versión>
+#
+# --coarse en build/rebuild crea además coarse_retail_products_<versión> (coarse.py); el alias
+# coarse_retail_products sigue al principal en cada switch. El prefijo no choca con versions().
+
+import argparse, time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import coarse
+from ingest import (
+    MILVUS_COLLECTION, read_csv_rows, embed_texts, ensure_connection, ensure_collection, insert_batches,
+)
+
+ALIAS = MILVUS_COLLECTION
+
+def collection_name(version: str) -> str:
+    return f"{ALIAS}_{version}"
+
+def versions() -> List[str]:
+    """Versiones existentes (orden cronológico si se usan los nombres por defecto v<timestamp>)."""
+    from pymilvus import utility
+    pref = f"{ALIAS}_"
+    return sorted(c[len(pref):] for c in utility.list_collections() if c.startswith(pref))
+
+def current_version() -> Optional[str]:
+    from pymilvus import utility
+    for v in versions():
+        if ALIAS in utility.list_aliases(collection_name(v)):
+            return v
+    return None
+
+# ========= Build =========
+def warm_and_check(col, texts: List[str], rounds: int = 3, k: int = 10, min_recall: float = 0.9) -> float:
+    """Busca los propios textos de la muestra: calienta segmentos/índice y valida la versión nueva."""
+    import retrieve
+    field, metric = retrieve._vector_spec(col)
+    vecs, _ = embed_texts(texts)
+    q = np.asarray(vecs, dtype=np.float32)
+    param = {"metric_type": metric, "params": {"ef": 128, "nprobe": 16}}
+    for _ in range(rounds):
+        res = col.search(data=q, anns_field=field, param=param, limit=k, output_fields=["canonical_text"])
+    found = sum(any(h.entity.get("canonical_text") == t for h in hits) for t, hits in zip(texts, res))
+    recall = found / max(1, len(texts))
+    if recall < min_recall:
+        raise RuntimeError(f"Versión {col.name}: recall@{k} de auto-búsqueda {recall:.2f} < {min_recall}")
+    return recall
+
+def build(version: str, csv_paths: List[str], mode: str = "upsert", fmt: str = "numpy", store: str = "minio",
+          rows_per_file: int = 1_000_000, embed_batch: int = 256, sample: int = 32, timeout_s: float = 3600.0,
+          with_coarse: bool = False) -> str:
+    from pymilvus import utility
+    name = collection_name(version)
+    if utility.has_collection(name):
+        raise ValueError(f"La versión '{name}' ya existe")
+    rows: List[Dict] = []
+    for p in csv_paths:
+        rows.extend(read_csv_rows(p))
+    if not rows:
+        raise ValueError("No se leyeron filas de los CSV")
+
+    t0 = time.time()
+    if mode == "bulk":
+        import bulk_ingest
+        parts, dim = bulk_ingest.prepare_parts(rows, fmt, "data/bulk_work", f"reindex/{version}",
+                                               bulk_ingest.make_store(store), rows_per_file, embed_batch)
+        col = ensure_collection(dim, create_index=False, name=name)
+        bulk_ingest.run_import(name, parts, timeout_s=timeout_s)
+        bulk_ingest.finalize(col, timeout_s=timeout_s)
+    else:
+        vecs, dim = embed_texts([r["canonical_text"] for r in rows])
+        col = ensure_collection(dim, name=name)
+        insert_batches(col, rows, vecs, batch_size=512)  # colección nueva: no compite con la viva
+        utility.wait_for_index_building_complete(name, timeout=timeout_s)
+        col.load()
+    print(f"[REINDEX] {name}: {col.num_entities} filas cargadas en {time.time() - t0:.1f}s")
+
+    step = max(1, len(rows) // sample)
+    recall = warm_and_check(col, [r["canonical_text"] for r in rows[::step][:sample]])
+    print(f"[REINDEX] {name} caliente | recall auto-búsqueda={recall:.2f}")
+
+    if with_coarse:
+        import retrieve
+        ccol = coarse.ensure_coarse_collection(coarse.coarse_name(name), dim)
+        n = coarse.build_from(col, ccol, retrieve._vector_spec(col)[0])
+        utility.wait_for_index_building_complete(ccol.name, timeout=timeout_s)
+        ccol.load()
+        print(f"[REINDEX] {ccol.name}: {n} códigos binarios")
+    return name
+
+# ========= Alias =========
+def switch(version: str) -> None:
+    from pymilvus import utility, Collection
+    from pymilvus.client.types import LoadState
+    import retrieve
+    name = collection_name(version)
+    if not utility.has_collection(name):
+        raise ValueError(f"No existe la versión '{name}'")
+    if utility.load_state(name) != LoadState.Loaded:
+        raise RuntimeError(f"'{name}' no está cargada; no se mueve el alias a una versión fría")
+    prev = current_version()
+    if prev is None and ALIAS in utility.list_collections():
+        raise RuntimeError(f"'{ALIAS}' es una colección real; corre primero `reindex.py adopt`")
+    if prev is not None:
+        old, new = retrieve._vector_spec(Collection(collection_name(prev))), retrieve._vector_spec(Collection(name))
+        if old != new:
+            print(f"[WARN] campo/métrica cambia {old} -> {new}: reiniciar los workers de la API tras el switch")
+        utility.alter_alias(collection_name=name, alias=ALIAS)
+    else:
+        utility.create_alias(collection_name=name, alias=ALIAS)
+    print(f"[REINDEX] alias '{ALIAS}': {prev and collection_name(prev)} -> {name}")
+    _switch_coarse(name)
+
+def _switch_coarse(name: str) -> None:
+    """coarse_<alias> -> coarse_<versión> si la versión tiene compañera (si no, se deja y se avisa)."""
+    from pymilvus import utility, Collection
+    from pymilvus.client.types import LoadState
+    target, alias = coarse.coarse_name(name), coarse.coarse_name(ALIAS)
+    if not utility.has_collection(target):
+        if utility.has_collection(alias):
+            print(f"[WARN] '{name}' no tiene '{target}': COARSE_SEARCH seguiría leyendo la versión anterior")
+        return
+    if utility.load_state(target) != LoadState.Loaded:
+        Collection(target).load()
+    if any(alias in utility.list_aliases(c) for c in utility.list_collections() if c.startswith(coarse.PREFIX)):
+        utility.alter_alias(collection_name=target, alias=alias)
+    else:
+        utility.create_alias(collection_name=target, alias=alias)
+    print(f"[REINDEX] alias '{alias}' -> {target}")
+
+def rollback() -> str:
+    cur = current_version()
+    older = [v for v in versions() if cur is None or v < cur]
+    if not older:
+        raise RuntimeError("No hay versión anterior para rollback")
+    prev = older[-1]
+    name = collection_name(prev)
+    from pymilvus import Collection
+    Collection(name).load()  # puede haberse liberado para ahorrar memoria
+    switch(prev)
+    return prev
+
+def adopt() -> None:
+    """Migra una colección real llamada como el alias a <alias>_v0 y crea el alias (corte breve, una vez)."""
+    from pymilvus import utility
+    if ALIAS not in utility.list_collections():
+        print(f"[REINDEX] '{ALIAS}' no es una colección real; nada que adoptar")
+        return
+    target = collection_name("v0")
+    utility.rename_collection(ALIAS, target)
+    utility.create_alias(collection_name=target, alias=ALIAS)
+    print(f"[REINDEX] '{ALIAS}' renombrada a '{target}' y alias creado")
+
+def drop(version: str) -> None:
+    from pymilvus import utility
+    if version == current_version():
+        raise RuntimeError(f"'{collection_name(version)}' está viva detrás del alias; haz switch/rollback antes")
+    utility.drop_collection(collection_name(version))
+    print(f"[REINDEX] '{collection_name(version)}' eliminada")
+    if utility.has_collection(coarse.coarse_name(collection_name(version))):
+        utility.drop_collection(coarse.coarse_name(collection_name(version)))
+
+def status() -> None:
+    from pymilvus import utility, Collection
+    cur = current_version()
+    print(f"alias '{ALIAS}' -> {cur and collection_name(cur)}")
+    for v in versions():
+        name = collection_name(v)
+        col = Collection(name)
+        mark = "*" if v == cur else " "
+        print(f" {mark} {name:40s} filas={col.num_entities:<10d} estado={utility.load_state(name)} "
+              f"| {col.description}")
+
+# ========= Main =========
+def main():
+    ap = argparse.ArgumentParser(description="Re-indexado blue/green con alias de Milvus")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    for cmd in ("build", "rebuild"):
+        p = sub.add_parser(cmd)
+        p.add_argument("--csv", nargs="+", required=True)
+        p.add_argument("--version", default=None, help="Default: v<YYYYmmddHHMMSS>")
+        p.add_argument("--mode", choices=["upsert", "bulk"], default="upsert")
+        p.add_argument("--format", choices=["numpy", "parquet"], default="numpy")
+        p.add_argument("--store", choices=["minio", "local"], default="minio")
+        p.add_argument("--rows-per-file", type=int, default=1_000_000)
+        p.add_argument("--timeout", type=float, default=3600.0)
+        p.add_argument("--coarse", action="store_true", help="También coarse_<versión> (código binario)")
+    for cmd in ("switch", "drop"):
+        sub.add_parser(cmd).add_argument("version")
+    for cmd in ("rollback", "adopt", "status"):
+        sub.add_parser(cmd)
+    args = ap.parse_args()
+
+    ensure_connection()
+    if args.cmd in ("build", "rebuild"):
+        version = args.version or time.strftime("v%Y%m%d%H%M%S")
+        build(version, args.csv, mode=args.mode, fmt=args.format, store=args.store,
+              rows_per_file=args.rows_per_file, timeout_s=args.timeout, with_coarse=args.coarse)
+        if args.cmd == "rebuild":
+            switch(version)
+        else:
+            print(f"[REINDEX] listo; para activarla: python reindex.py switch {version}")
+    elif args.cmd == "switch":
+        switch(args.version)
+    elif args.cmd == "drop":
+        drop(args.version)
+    elif args.cmd == "rollback":
+        print(f"[REINDEX] rollback a {rollback()}")
+    elif args.cmd == "adopt":
+        adopt()
+    else:
+        status()
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,374 @@
 # retrieve.py
-from typing import List, Dict, Optional, Literal
-from pymilvus import connections, Collection
-from sentence_transformers import SentenceTransformer
+from typing import Iterator, List, Dict, Optional, Literal, Tuple
 from statistics import mean
-import torch
-import re, json
+import numpy as np
+import json, heapq, threading, time
+from collections import OrderedDict
 
-COL = "retail_products"
-EMB = "intfloat/multilingual-e5-base"
+import coarse
+import deadline
+import lexical
+from caches import TTLCache
+from metrics import stage, CACHE_REQUESTS, MILVUS_CALLS
+from settings import get_settings
+from textnorm import fold, sanitize
+
+# Nombre lógico: en producción es un alias de Milvus que apunta a retail_products_<versión> (reindex.py)
+COL = get_settings().milvus_collection
+# Mismo EMBED_MODEL que ingest/reindex: una versión re-indexada con otro modelo se sirve sin tocar código
+EMB = get_settings().embed_model
+QUERY_PREFIX = "query: " if "e5" in EMB else ""  # e5 espera query:/passage: (ingest pone passage:)
+VECTOR_FIELD = "vector"  # default; el real se lee del esquema al conectar (ver _vector_spec)
 
 # --- Config de búsqueda ---
 SIM_TH = 0.40   # umbral de similitud (IP: 0..1). Ajusta si hace falta
-TOPK   = 50     # máximo de resultados a considerar
+TOPK   = 50     # límite por defecto; los callers pasan su top_k real
+PAGE_MAX = 1000  # tope por página en listados
+EMB_CACHE_SIZE = 2048  # preguntas recientes con embedding en memoria
+
+# Campos escalares que devuelven búsquedas y listados (los que existan en la colección, ver available_fields)
+OUTPUT_FIELDS = [
+    "product_id","name","brand","category","store","country",
+    "price","unit","size","currency","url","canonical_text",
+    "unit_price","unit_base",
+]
+# Filtros de texto que se resuelven contra la columna sin tildes precalculada (<campo>_norm), si existe
+NORM_FILTERS = ("name", "brand", "store")
 
 # --- Carga perezosa del modelo (evita duplicar RAM con --reload) ---
-_model: Optional[SentenceTransformer] = None
+# Runtime seleccionable (torch fp32 / int8 / onnx), ver encoders.py
+# Init con lock y doble chequeo: el hilo de warmup y los primeros requests llegan a la vez
+_model = None
+_model_lock = threading.Lock()
 
-def _get_model() -> SentenceTransformer:
+def _get_model():
     global _model
     if _model is None:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"[embeddings] usando device={device}")
-        _model = SentenceTransformer(EMB, device=device)
+        with _model_lock:
+            if _model is None:
+                s = get_settings()
+                if s.embed_socket:  # sidecar compartido entre workers (embed_server.py)
+                    from embed_server import EmbedClient
+                    _model = EmbedClient(s.embed_socket)
+                else:
+                    from encoders import load_encoder
+                    _model = load_encoder(s.embed_runtime, EMB, s.embed_model_path)
     return _model
 
+# --- Caché LRU de embeddings de consulta (preguntas repetidas no pasan por encode) ---
+_emb_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_emb_lock = threading.Lock()
+
+def _embed_queries(questions: List[str]) -> np.ndarray:
+    texts = [QUERY_PREFIX + q for q in questions]
+    out: List[Optional[np.ndarray]] = [None] * len(texts)
+    missing: List[int] = []
+    with _emb_lock:
+        for i, t in enumerate(texts):
+            v = _emb_cache.get(t)
+            if v is None:
+                missing.append(i)
+            else:
+                _emb_cache.move_to_end(t)
+                out[i] = v
+    CACHE_REQUESTS.inc(len(texts) - len(missing), cache="embedding", result="hit")
+    CACHE_REQUESTS.inc(len(missing), cache="embedding", result="miss")
+    if missing:
+        with stage("embed"):
+            vecs = _get_model().encode([texts[i] for i in missing], normalize_embeddings=True)
+        with _emb_lock:
+            for i, v in zip(missing, vecs):
+                out[i] = v
+                _emb_cache[texts[i]] = v
+                if len(_emb_cache) > EMB_CACHE_SIZE:
+                    _emb_cache.popitem(last=False)
+    return np.stack(out)
+
+# --- Caché de resultados por pregunta normalizada (caches.py); se invalida por data_version() ---
+_ret_cache = TTLCache("retrieval", get_settings().retrieval_cache_size, get_settings().retrieval_cache_ttl_s)
+
+def _ret_key(question: str, filters: Optional[Dict], limit: int, sim_th: float, fields: List[str]) -> Tuple:
+    return (" ".join(fold(question).split()).strip(" ?¿!¡."), json.dumps(filters or {}, sort_keys=True, default=str),
+            limit, round(float(sim_th), 4), tuple(fields))
+
+# --- Conexión perezosa (una sola conexión + load por proceso) ---
+# pymilvus (grpc) se importa aquí y no al importar el módulo: arranque más rápido
+_col = None
+_col_lock = threading.Lock()
+_spec: Tuple[str, str] = (VECTOR_FIELD, "IP")  # (campo vectorial, métrica) de la colección conectada
+_fields: Optional[frozenset] = None  # columnas de la colección conectada (None = no describible)
+
+def _vector_spec(col) -> Tuple[str, str]:
+    """Campo vectorial y métrica según esquema/índice: las versiones de reindex.py pueden cambiarlos."""
+    try:
+        from pymilvus import DataType
+        field = next(f.name for f in col.schema.fields if f.dtype == DataType.FLOAT_VECTOR)
+        metric = next((ix.params.get("metric_type") for ix in col.indexes if ix.field_name == field), None)
+        return field, metric or "IP"
+    except Exception:  # stubs / colecciones sin esquema describible
+        return VECTOR_FIELD, "IP"
+
+def _schema_fields(col) -> Optional[frozenset]:
+    """Columnas del esquema: las colecciones de la ingesta original no traen los derivados (textnorm.py)."""
+    try:
+        return frozenset(f.name for f in col.schema.fields)
+    except Exception:  # stubs / colecciones sin esquema describible
+        return None
+
+def _get_collection():
+    global _col, _spec, _fields
+    if _col is None:
+        with _col_lock:
+            if _col is None:
+                from pymilvus import connections, Collection
+                s = get_settings()
+                connections.connect(alias="default", host=s.milvus_host, port=str(s.milvus_port))
+                col = Collection(COL)  # alias o colección real; Milvus resuelve el alias en cada request
+                col.load()  # bloqueante
+                _spec = _vector_spec(col)
+                _fields = _schema_fields(col)
+                _col = col  # al final: quien lo ve no-None ve también _spec/_fields
+    return _col
+
+# --- Colección compañera con código binario (COARSE_SEARCH, ver coarse.py) ---
+_coarse_col = None
+_coarse_checked = False
+_coarse_lock = threading.Lock()
+
+def _get_coarse():
+    """coarse_<COL> cargada, o None si no existe (se consulta una vez por proceso)."""
+    global _coarse_col, _coarse_checked
+    if _coarse_col is None and not _coarse_checked:
+        _get_collection()  # conexión
+        with _coarse_lock:
+            if _coarse_checked:
+                return _coarse_col
+            from pymilvus import Collection, utility
+            name = coarse.coarse_name(COL)
+            try:
+                if utility.has_collection(name):
+                    col = Collection(name)
+                    col.load()
+                    _coarse_col = col
+                else:
+                    print(f"[retrieve] COARSE_SEARCH activo pero no existe '{name}' (python coarse.py build): una etapa")
+            except Exception as e:
+                print(f"[retrieve] compañera '{name}' no disponible ({e!r}): una etapa")
+            _coarse_checked = True
+    return _coarse_col
+
+_warned: set = set()
+
+def _warn_once(key: str, msg: str) -> None:
+    if key not in _warned:
+        _warned.add(key)
+        print(msg)
+
+def _float_vectors(ids: List[str]) -> Dict[str, np.ndarray]:
+    """Vectores float por pk: réplica mmap (SEARCH_BACKEND/COARSE_RERANK=local) o query por pk a Milvus."""
+    s = get_settings()
+    local = _get_local()
+    if local is None and s.coarse_rerank == "local":
+        from local_index import get_local_index
+        local = get_local_index(s.local_index_path, s.local_index_check_s)
+    if local is not None:
+        return local.vectors_by_pk(ids)
+    col = _get_collection()
+    out: Dict[str, np.ndarray] = {}
+    for i in range(0, len(ids), 4096):
+        chunk = ids[i:i + 4096]
+        MILVUS_CALLS.inc(op="query")
+        with deadline.guard("milvus_vectors"):
+            rows = col.query(expr=f"product_id in {json.dumps(chunk)}", output_fields=[_spec[0]],
+                             limit=len(chunk), timeout=_milvus_timeout("milvus_vectors"))
+        for r in rows:
+            out[str(r["product_id"])] = np.asarray(r[_spec[0]], dtype=np.float32)
+    return out
+
+def _two_stage(ccol, qvecs: np.ndarray, filters: Optional[Dict], limit: int, sim_th: float,
+               out_fields: List[str], oversample: int) -> List[List[Dict]]:
+    """HAMMING sobre coarse_<COL> con limit*oversample candidatos -> IP exacto -> filas de los ganadores."""
+    k1 = min(coarse.MAX_CANDIDATES, limit * max(1, oversample))
+    MILVUS_CALLS.inc(op="search_coarse")
+    with stage("milvus_coarse"), deadline.guard("milvus_coarse"):
+        res = ccol.search(
+            data=[bytes(c) for c in coarse.binarize(qvecs)],
+            anns_field=coarse.CODE_FIELD,
+            param={"metric_type": "HAMMING", "params": {"nprobe": 16}},
+            limit=k1,
+            expr=build_expr(filters),
+            output_fields=[],
+            timeout=_milvus_timeout("milvus_coarse"),
+        )
+    cands = [[str(h.id) for h in hits] for hits in res]
+    with stage("rerank"):
+        vecs = _float_vectors(sorted({pk for c in cands for pk in c}))
+        ranked = []
+        for q, ids in zip(np.asarray(qvecs, dtype=np.float32), cands):
+            ids = [pk for pk in ids if pk in vecs]
+            m = np.stack([vecs[pk] for pk in ids]) if ids else np.zeros((0, len(q)), np.float32)
+            ranked.append(coarse.rerank(q, ids, m, limit, sim_th))
+    rows = {r["product_id"]: r for r in fetch_by_ids(list(dict.fromkeys(pk for rk in ranked for pk, _ in rk)), out_fields)}
+    return [[{"score": sc, **rows[pk]} for pk, sc in rk if pk in rows] for rk in ranked]
+
+def vector_field() -> str:
+    _get_collection()
+    return _spec[0]
+
+def available_fields() -> Optional[frozenset]:
+    """Columnas del backend activo (réplica local o colección de Milvus); None = no se sabe, todas."""
+    local = _get_local()
+    if local is not None:
+        return local.fields
+    _get_collection()
+    return _fields
+
+def has_field(name: str) -> bool:
+    avail = available_fields()
+    return avail is None or name in avail
+
+# --- Réplica local opcional (SEARCH_BACKEND=local); None => Milvus ---
+def _get_local():
+    s = get_settings()
+    if s.search_backend != "local":
+        return None
+    from local_index import get_local_index
+    return get_local_index(s.local_index_path, s.local_index_check_s)
+
+# --- Índice léxico en proceso (LEXICAL_SEARCH, ver lexical.py); None mientras se construye ---
+def _get_lexical() -> Optional["lexical.LexicalIndex"]:
+    s = get_settings()
+    if not s.lexical_search:
+        return None
+    return lexical.get_index(iter_catalog, s.lexical_refresh_s)
+
+def refresh_lexical(full: bool = False) -> Dict:
+    return lexical.refresh(iter_catalog, full=full).stats()
+
+# --- Versión de datos y revalidación de la caché de retrieval (warm.py) ---
+_mv_value: Optional[int] = None
+_mv_checked = -float("inf")
+_mv_running = False
+_mv_lock = threading.Lock()
+
+def _poll_milvus_version() -> None:
+    """
+    max(last_seen) de la colección. Milvus 2.3 no agrega: se piden filas con last_seen mayor que el
+    máximo conocido hasta que no quede ninguna (cada vuelta sube el piso; pocas vueltas tras una ingesta).
+    """
+    global _mv_value, _mv_running
+    s = get_settings()
+    try:
+        col = _get_collection()
+        v = _mv_value or 0
+        while True:
+            MILVUS_CALLS.inc(op="query")
+            rows = col.query(expr=f"last_seen > {v}", output_fields=["last_seen"], limit=PAGE_MAX,
+                             timeout=s.milvus_timeout_s or None)
+            if not rows:
+                break
+            v = max(int(r["last_seen"]) for r in rows)
+        _mv_value = v
+    except Exception as e:
+        print(f"[retrieve] versión de datos no disponible ({e!r})")
+    finally:
+        with _mv_lock:
+            _mv_running = False
+
+def _milvus_version() -> Optional[int]:
+    """
+    Último valor sondeado, sin bloquear (None hasta el primer sondeo OK). El sondeo corre en un hilo
+    cada DATA_VERSION_CHECK_S (como lexical.get_index): los scans no caen dentro de ningún request.
+    """
+    global _mv_running, _mv_checked
+    s = get_settings()
+    if s.data_version_check_s <= 0:
+        return None
+    now = time.monotonic()
+    every = min(s.data_version_check_s, lexical.RETRY_S) if _mv_value is None else s.data_version_check_s
+    if now - _mv_checked >= every:
+        with _mv_lock:
+            if not _mv_running and now - _mv_checked >= every:
+                _mv_running, _mv_checked = True, now
+                threading.Thread(target=_poll_milvus_version, name="data-version", daemon=True).start()
+    return _mv_value
+
+def data_version() -> Optional[int]:
+    """max(last_seen) del catálogo (índice léxico, réplica local o sondeo a Milvus); None = desconocida."""
+    lex = _get_lexical()  # de paso dispara el refresh por last_seen si toca
+    if lex is not None:
+        return lex.max_last_seen
+    local = _get_local()
+    return local.max_last_seen if local is not None else _milvus_version()
+
+def last_seen_by_ids(ids: List[str]) -> Dict[str, int]:
+    """last_seen actual por product_id (los que ya no existen no aparecen)."""
+    if not ids:
+        return {}
+    local = _get_local()
+    if local is not None:
+        return {r["product_id"]: int(r["last_seen"]) for r in local.by_pk(list(ids), ["product_id", "last_seen"])}
+    col = _get_collection()
+    out: Dict[str, int] = {}
+    for i in range(0, len(ids), PAGE_MAX):
+        chunk = list(ids[i:i + PAGE_MAX])
+        MILVUS_CALLS.inc(op="query")
+        rows = col.query(expr=f"product_id in {json.dumps(chunk)}", output_fields=["last_seen"], limit=len(chunk),
+                         timeout=_milvus_timeout("milvus_query"))
+        out.update({str(r["product_id"]): int(r["last_seen"] or 0) for r in rows})
+    return out
+
+def revalidate_retrieval() -> Dict[str, int]:
+    """
+    Entradas llenadas antes de la última ingesta: si ninguna fila de su evidencia cambió
+    (last_seen <= versión de la entrada) vuelven a servirse; si cambió o desapareció, se descartan.
+    """
+    version = data_version()
+    stale = _ret_cache.stale(version) if version is not None else []
+    if not stale:
+        return {"kept": 0, "dropped": 0}
+    seen = last_seen_by_ids(list({h["product_id"] for _, hits, _ in stale for h in hits}))
+    kept = dropped = 0
+    for key, hits, ver in stale:
+        if all(seen.get(h["product_id"], ver + 1) <= ver for h in hits):
+            _ret_cache.retag(key, version)
+            kept += 1
+        else:
+            _ret_cache.discard(key)
+            dropped += 1
+    return {"kept": kept, "dropped": dropped}
+
+def cache_stats() -> Dict:
+    return {"embedding": {"size": len(_emb_cache), "capacity": EMB_CACHE_SIZE}, "retrieval": _ret_cache.stats()}
+
+# --- Precarga (lifespan / PRELOAD) ---
+def warm_lexical() -> None:
+    if lexical.current() is None:
+        lexical.refresh(iter_catalog)
+
+def warm_embedder() -> None:
+    _get_model().encode([QUERY_PREFIX + "warmup"], normalize_embeddings=True)
+
+def warm_search_backend() -> None:
+    if _get_local() is None:
+        _get_collection()
+
 # --- Utilidades ---
-def sanitize(text: str) -> str:
-    text = text or ""
-    text = re.sub(r"(?i)(ignore|override|disregard).*", "", text)
-    return text.replace("```", "").strip()
+def _milvus_timeout(stage_name: str) -> Optional[float]:
+    """Timeout gRPC de la llamada: MILVUS_TIMEOUT_S acotado por lo que queda del deadline del request."""
+    return deadline.budget(get_settings().milvus_timeout_s or None, stage_name)
+
+def _fold_filters(filters: Optional[Dict], only: Optional[frozenset] = None) -> Optional[Dict]:
+    """name/brand/store -> <campo>_norm == fold(valor): sin tildes ni mayúsculas, sin regex por fila.
+    only: columnas existentes; un <campo>_norm que no esté queda como igualdad sobre el campo crudo."""
+    if not filters:
+        return filters
+    norm = {k for k in filters if k in NORM_FILTERS and (only is None or f"{k}_norm" in only)}
+    return {(f"{k}_norm" if k in norm else k): (fold(str(v)) if k in norm else v) for k, v in filters.items()}
+
+def _norm_filters(filters: Optional[Dict]) -> Optional[Dict]:
+    """Filtros para el backend activo: <campo>_norm solo si la colección lo tiene."""
+    return _fold_filters(filters, available_fields()) if filters else filters
 
 def build_expr(filters: Optional[Dict]) -> Optional[str]:
     """
@@ -45,78 +385,357 @@ def build_expr(filters: Optional[Dict]) -> Optional[str]:
             parts.append(f"{k} == {json.dumps(str(v))}")  # escapa strings correctamente
     return " and ".join(parts) if parts else None
 
+def _and_expr(*exprs: Optional[str]) -> Optional[str]:
+    parts = [f"({e})" for e in exprs if e]
+    return " and ".join(parts) if parts else None
+
+def check_fields(fields: Optional[List[str]]) -> List[str]:
+    """
+    Valida una proyección de columnas contra OUTPUT_FIELDS (None => todas las que tenga la colección).
+    product_id siempre se incluye (citas, cursores).
+    """
+    avail = available_fields()
+    if not fields:
+        return [f for f in OUTPUT_FIELDS if avail is None or f in avail]
+    unknown = [f for f in fields if f not in OUTPUT_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    missing = [f for f in fields if avail is not None and f not in avail]
+    if missing:
+        raise ValueError(f"Campos no disponibles en esta colección (requiere reindex): {', '.join(missing)}")
+    return list(dict.fromkeys(["product_id", *fields]))
+
+def _clean_row(r: Dict) -> Dict:
+    """Normaliza tipos/strings de una fila devuelta por query()."""
+    if "canonical_text" in r and not has_field("name_norm"):
+        r["canonical_text"] = sanitize(r["canonical_text"])  # colección sin texto limpio de ingesta
+    if "price" in r:
+        r["price"] = float(r["price"])
+    if "size" in r:
+        r["size"] = float(r["size"])
+    if "unit_price" in r:
+        r["unit_price"] = float(r["unit_price"])
+    return r
+
 # --- BÚSQUEDA SEMÁNTICA (para preguntas tipo "¿cuánto cuesta ...?") ---
-def retrieve(question: str, filters: Optional[Dict]=None, topk: int = TOPK, sim_th: float = SIM_TH) -> List[Dict]:
+def retrieve(question: str, filters: Optional[Dict]=None, topk: int = TOPK, sim_th: float = SIM_TH,
+             fields: Optional[List[str]]=None) -> List[Dict]:
     """
     Retorna hits con campos estructurados (+ score) usando búsqueda vectorial.
+    `fields` limita las columnas que se piden a Milvus y se post-procesan.
+    """
+    return retrieve_many([question], filters, topk=topk, sim_th=sim_th, fields=fields)[0]
+
+def retrieve_many(questions: List[str], filters: Optional[Dict]=None, topk: int = TOPK,
+                  sim_th: float = SIM_TH, fields: Optional[List[str]]=None) -> List[List[Dict]]:
+    """
+    Variante por lotes de retrieve(): un solo encode() y un solo search() para N preguntas.
+    top_k y umbral se aplican en Milvus (range search: solo distance > radius), así que
+    solo viajan y se deserializan los hits que sobreviven.
+    """
+    if not questions:
+        return []
+    out_fields = check_fields(fields)  # validar antes de pagar el encode
+    limit = max(1, int(topk))
+    lex = _get_lexical()
+    version = data_version() if _ret_cache.enabled else None
+    cached = version is not None  # sin versión no hay cómo invalidar tras una ingesta: no se cachea
+    keys = [_ret_key(q, filters, limit, sim_th, out_fields) for q in questions] if cached else []
+    out: List[Optional[List[Dict]]] = [_ret_cache.get(k, version) for k in keys] if cached else [None] * len(questions)
+    miss = [i for i, hits in enumerate(out) if hits is None]
+    if miss:
+        qs = [questions[i] for i in miss]
+        if lex is None or not lexical.covers(_fold_filters(filters)):
+            res = retrieve_many_vec(_embed_queries(qs), filters, topk=limit, sim_th=sim_th, fields=out_fields)
+        else:
+            res = _retrieve_hybrid(lex, qs, filters, limit, sim_th, out_fields)
+        for i, hits in zip(miss, res):
+            if cached:
+                _ret_cache.put(keys[i], hits, version)
+            out[i] = hits
+    return [[dict(h) for h in hits] for hits in out]  # copias: los callers pueden anotar los hits
+
+def _retrieve_hybrid(lex: "lexical.LexicalIndex", questions: List[str], filters: Optional[Dict], limit: int,
+                     sim_th: float, out_fields: List[str]) -> List[List[Dict]]:
     """
-    connections.connect(alias="default", host="127.0.0.1", port="19530")
-    col = Collection(COL)
-    col.load()  # bloqueante
+    Léxico primero: si es decisivo (product_id literal / nombre+marca+presentación exactos) no se embebe;
+    esos hits van marcados "match": "lexical" y su score es BM25 normalizado (top = 1.0), no coseno.
+    Si no, el top-k se elige por RRF entre candidatos BM25 y vectoriales; los que solo vinieron por BM25
+    reciben su score IP real (vector por pk) y quedan fuera bajo sim_th o sin vector. El resultado se
+    ordena por score: los callers leen hits[0] como el mejor coseno (plantilla, margen).
+    """
+    s = get_settings()
+    with stage("lexical"):
+        looks = [lex.lookup(q, _fold_filters(filters), limit, s.lexical_min_terms, s.lexical_max_exact)
+                 for q in questions]
+    scored: List[Optional[List[Tuple[str, float]]]] = [None] * len(questions)
+    vec_rows: Dict[str, Dict] = {}
+    rest = [i for i, lk in enumerate(looks) if not lk.decisive]
+    for i, lk in enumerate(looks):
+        if lk.decisive:
+            lexical.LEXICAL_RESULTS.inc(result="decisive")
+            scored[i] = lk.hits
+    if rest:
+        qvecs = _embed_queries([questions[i] for i in rest])
+        vec = retrieve_many_vec(qvecs, filters, topk=limit, sim_th=sim_th, fields=out_fields)
+        lex_only: Dict[str, List[int]] = {}
+        for j, i in enumerate(rest):
+            vhits = {h["product_id"]: h for h in vec[j]}
+            vec_rows.update(vhits)
+            if not looks[i].hits:
+                lexical.LEXICAL_RESULTS.inc(result="miss")
+                scored[i] = [(pk, h["score"]) for pk, h in vhits.items()]
+                continue
+            lexical.LEXICAL_RESULTS.inc(result="fused")
+            fused = lexical.rrf([list(vhits), [pk for pk, _ in looks[i].hits]], k=s.lexical_rrf_k)[:limit]
+            scored[i] = [(pk, vhits[pk]["score"] if pk in vhits else None) for pk, _ in fused]
+            for pk, sc in scored[i]:
+                if sc is None:
+                    lex_only.setdefault(pk, []).append(j)
+        exact: Dict[Tuple[str, int], float] = {}
+        if lex_only:
+            with stage("lexical_rescore"):
+                vecs = _float_vectors(list(lex_only))
+            exact = {(pk, j): float(vecs[pk] @ qvecs[j]) for pk, js in lex_only.items() if pk in vecs for j in js}
+        for j, i in enumerate(rest):
+            hits = [(pk, exact.get((pk, j)) if sc is None else sc) for pk, sc in scored[i]]
+            scored[i] = sorted(((pk, sc) for pk, sc in hits if sc is not None and sc >= sim_th), key=lambda h: -h[1])
+
+    need = list(dict.fromkeys(pk for hits in scored for pk, _ in hits if pk not in vec_rows))
+    rows = {r["product_id"]: r for r in fetch_by_ids(need, out_fields)}
+    rows.update({pk: {k: v for k, v in h.items() if k != "score"} for pk, h in vec_rows.items()})
+    out = []
+    for lk, hits in zip(looks, scored):
+        mark = {"match": "lexical"} if lk.decisive else {}
+        out.append([{"score": sc, **rows[pk], **mark} for pk, sc in hits if pk in rows])
+    return out
+
+def retrieve_many_vec(qvecs: np.ndarray, filters: Optional[Dict]=None, topk: int = TOPK, sim_th: float = SIM_TH,
+                      fields: Optional[List[str]]=None, two_stage: Optional[bool]=None,
+                      oversample: Optional[int]=None) -> List[List[Dict]]:
+    """
+    Búsqueda con vectores de consulta ya calculados [nq, dim].
+    two_stage (default: COARSE_SEARCH) => código compacto + re-rank exacto (ver coarse.py).
+    """
+    s = get_settings()
+    out_fields = check_fields(fields)
+    filters = _norm_filters(filters)
+    limit = max(1, int(topk))
+    kind = s.coarse_search if two_stage is None else ((s.coarse_search or "binary") if two_stage else "")
+    oversample = oversample or s.coarse_oversample
 
+    local = _get_local()
+    if local is not None:
+        with stage("local_search"):
+            res = local.search(qvecs, filters, limit, sim_th, out_fields, nprobe=s.local_index_nprobe,
+                               coarse=kind, oversample=oversample)
+        return [[_clean_row(h) for h in hits] for hits in res]
+
+    if kind == "sq8":  # sin tipo vectorial int8 en Milvus 2.3: sq8 solo existe en la réplica local
+        _warn_once("sq8", "[retrieve] COARSE_SEARCH=sq8 requiere SEARCH_BACKEND=local: búsqueda de una etapa")
+    elif kind and coarse.covers(filters):
+        ccol = _get_coarse()
+        if ccol is not None:
+            return _two_stage(ccol, qvecs, filters, limit, sim_th, out_fields, oversample)
+
+    col = _get_collection()
     expr = build_expr(filters)
-    qvec = _get_model().encode(["query: " + question], normalize_embeddings=True)
-
-    res = col.search(
-        data=qvec,
-        anns_field="vector",
-        param={"metric_type": "IP", "params": {"ef": 128}},  # HNSW/IP según tu create_collection.py
-        limit=topk,
-        expr=expr,
-        output_fields=[
-            "product_id","name","brand","category","store","country",
-            "price","unit","size","currency","url","canonical_text"
-        ],
-    )
+    MILVUS_CALLS.inc(op="search")
+    with stage("milvus_search"), deadline.guard("milvus_search"):
+        res = col.search(
+            data=qvecs,
+            anns_field=_spec[0],
+            # HNSW/IP según tu create_collection.py (ef >= limit); nprobe si la versión usa IVF
+            param={"metric_type": _spec[1], "params": {"ef": max(128, limit), "nprobe": 16, "radius": sim_th}},
+            limit=limit,
+            expr=expr,
+            output_fields=out_fields,
+            timeout=_milvus_timeout("milvus_search"),
+        )
 
-    hits: List[Dict] = []
-    for hit in res[0]:
-        # En IP (inner product) mayor = más similar. Filtramos por umbral.
-        if hit.distance < sim_th:
-            continue
-        e = hit.entity
-        hits.append({
-            "score": float(hit.distance),
-            "product_id": e.get("product_id"),
-            "name": e.get("name"),
-            "brand": e.get("brand"),
-            "category": e.get("category"),
-            "store": e.get("store"),
-            "country": e.get("country"),
-            "price": float(e.get("price")),
-            "unit": e.get("unit"),
-            "size": float(e.get("size")),
-            "currency": e.get("currency"),
-            "url": e.get("url"),
-            "canonical_text": sanitize(e.get("canonical_text")),
-        })
-    return hits
+    results: List[List[Dict]] = []
+    for hits_q in res:
+        hits: List[Dict] = []
+        for hit in hits_q:
+            # En IP (inner product) mayor = más similar. Milvus ya filtró por radius;
+            # se mantiene el chequeo por si el backend ignora los parámetros de rango.
+            if hit.distance < sim_th:
+                continue
+            e = hit.entity
+            row = _clean_row({f: e.get(f) for f in out_fields})
+            hits.append({"score": float(hit.distance), **row})
+        results.append(hits)
+    return results
 
 # --- LISTADOS DIRECTOS (para "dame todos los de Colombia/Éxito/...") ---
-def list_by_filter(filters: Optional[Dict]=None, limit: int=100) -> List[Dict]:
+def list_by_filter(filters: Optional[Dict]=None, limit: int=100,
+                   fields: Optional[List[str]]=None) -> List[Dict]:
     """
     Consulta estructurada (sin LLM) usando query por filtros exactos.
     OJO: expr vacío devuelve todo; deja un límite razonable.
     """
-    connections.connect(alias="default", host="127.0.0.1", port="19530")
-    col = Collection(COL)
-    col.load()
+    rows, _ = list_page(filters, limit=limit, fields=fields)
+    return rows
 
-    expr = build_expr(filters)
-    rows = col.query(
-        expr=expr or "",
-        output_fields=[
-            "product_id","name","brand","category","store","country",
-            "price","unit","size","currency","url","canonical_text"
-        ],
-        limit=max(1, min(limit, 1000)),  # tope sano
+def list_page(filters: Optional[Dict]=None, limit: int=100, cursor: Optional[str]=None,
+              fields: Optional[List[str]]=None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Paginación por cursor (keyset) ordenada por product_id.
+    En vez de offset (Milvus escanea y descarta filas), filtra `product_id > cursor`:
+    cada página cuesta lo mismo sin importar la profundidad.
+    Devuelve (filas, next_cursor); next_cursor es None en la última página.
+    """
+    out_fields = check_fields(fields)
+    filters = _norm_filters(filters)
+    lim = max(1, min(limit, PAGE_MAX))  # tope sano
+    local = _get_local()
+    if local is not None:
+        with stage("local_query"):
+            rows = [_clean_row(r) for r in local.query(filters, out_fields, lim, cursor)]
+        return rows, (rows[-1]["product_id"] if len(rows) == lim else None)
+
+    col = _get_collection()
+    key = f"product_id > {json.dumps(str(cursor))}" if cursor else None
+    expr = _and_expr(build_expr(filters), key)
+    # Milvus devuelve query() ordenado por PK (mismo supuesto que usa query_iterator)
+    MILVUS_CALLS.inc(op="query")
+    with stage("milvus_query"), deadline.guard("milvus_query"):
+        rows = col.query(expr=expr or "", output_fields=out_fields, limit=lim,
+                         timeout=_milvus_timeout("milvus_query"))
+    rows = [_clean_row(r) for r in rows]
+    next_cursor = rows[-1]["product_id"] if len(rows) == lim else None
+    return rows, next_cursor
+
+def iter_by_filter(filters: Optional[Dict]=None, fields: Optional[List[str]]=None,
+                   batch_size: int=1000) -> Iterator[List[Dict]]:
+    """
+    Recorre TODO el resultado filtrado por lotes con query_iterator (memoria constante).
+    Pensado para exportaciones completas (p.ej. volcado por país).
+    """
+    out_fields = check_fields(fields)
+    filters = _norm_filters(filters)
+    local = _get_local()
+    if local is not None:
+        for batch in local.iter_batches(filters, out_fields, max(1, min(batch_size, PAGE_MAX))):
+            yield [_clean_row(r) for r in batch]
+        return
+
+    col = _get_collection()
+    it = col.query_iterator(
+        batch_size=max(1, min(batch_size, PAGE_MAX)),
+        expr=build_expr(filters) or "",
+        output_fields=out_fields,
+        timeout=_milvus_timeout("milvus_iterator"),  # se aplica a cada lote
     )
-    # Normaliza algunos tipos/strings
-    for r in rows:
-        r["price"] = float(r["price"])
-        r["size"] = float(r["size"])
-        r["canonical_text"] = sanitize(r.get("canonical_text"))
-    return rows
+    try:
+        while True:
+            MILVUS_CALLS.inc(op="query_iterator")
+            deadline.budget(None, "milvus_iterator")  # no pedir otro lote con el deadline vencido
+            with deadline.guard("milvus_iterator"):
+                batch = it.next()
+            if not batch:
+                break
+            yield [_clean_row(r) for r in batch]
+    finally:
+        it.close()
+
+def iter_catalog(since: Optional[int] = None, batch_size: int = PAGE_MAX) -> Iterator[List[Dict]]:
+    """
+    Filas crudas (lexical.SOURCE_FIELDS) para índices en proceso: todo el catálogo, o solo
+    last_seen > since (lo que trajo la última ingesta). Sin deadline: corre en background.
+    """
+    local = _get_local()
+    if local is not None:
+        if since is not None and local.max_last_seen <= since:
+            return
+        for batch in local.iter_batches(None, lexical.SOURCE_FIELDS, batch_size):
+            rows = batch if since is None else [r for r in batch if int(r.get("last_seen") or 0) > since]
+            if rows:
+                yield rows
+        return
+
+    col = _get_collection()
+    it = col.query_iterator(batch_size=batch_size, expr="" if since is None else f"last_seen > {int(since)}",
+                            output_fields=lexical.SOURCE_FIELDS)
+    try:
+        while True:
+            MILVUS_CALLS.inc(op="query_iterator")
+            batch = it.next()
+            if not batch:
+                break
+            yield batch
+    finally:
+        it.close()
+
+# --- TOP-N POR PRECIO ("el más barato", "los 10 más caros por tienda") ---
+RANK_FIELDS = ("price", "unit_price")
+
+def fetch_by_ids(ids: List[str], fields: Optional[List[str]]=None) -> List[Dict]:
+    """Filas completas de una lista corta de product_id, en el mismo orden que `ids`."""
+    if not ids:
+        return []
+    out_fields = check_fields(fields)
+    local = _get_local()
+    if local is not None:
+        with stage("local_query"):
+            return [_clean_row(r) for r in local.by_pk(list(ids), out_fields)]
+    col = _get_collection()
+    MILVUS_CALLS.inc(op="query")
+    with stage("milvus_query"), deadline.guard("milvus_query"):
+        rows = col.query(expr=f"product_id in {json.dumps(list(ids))}", output_fields=out_fields, limit=len(ids),
+                         timeout=_milvus_timeout("milvus_query"))
+    by_id = {r["product_id"]: _clean_row(r) for r in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+class _Desc:
+    """Invierte el orden de product_id en el heap: a igual precio gana el id menor."""
+    __slots__ = ("value",)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def __lt__(self, other: "_Desc") -> bool:
+        return self.value > other.value
+
+    def __eq__(self, other) -> bool:
+        return self.value == other.value
+
+def rank_by_price(filters: Optional[Dict]=None, n: int=10, order: Literal["asc","desc"]="asc",
+                  by: Literal["price","unit_price"]="price", fields: Optional[List[str]]=None,
+                  batch_size: int=PAGE_MAX) -> List[Dict]:
+    """
+    Top-N más baratos (asc) o más caros (desc). Milvus 2.3 no tiene ORDER BY: se recorre el
+    resultado filtrado con query_iterator trayendo solo (product_id, `by`), se mantiene un heap
+    de N candidatos y al final se piden las filas completas de los N ganadores.
+    Memoria O(N + batch_size) sin importar el tamaño del catálogo. Valores <= 0 se ignoran
+    (precio faltante o presentación no convertible a kg/L/unidad).
+    """
+    if by not in RANK_FIELDS:
+        raise ValueError(f"Campo de ranking no soportado: {by}")
+    if not has_field(by):
+        raise ValueError(f"Campo de ranking no disponible en esta colección (requiere reindex): {by}")
+    n = max(1, min(int(n), PAGE_MAX))
+    desc = order == "desc"
+    local = _get_local()
+    if local is not None:
+        with stage("local_rank"):
+            return [_clean_row(r) for r in local.rank(_norm_filters(filters), by, n, desc, check_fields(fields))]
+
+    # heap de los N mejores: la raíz es el peor candidato vigente
+    heap: List[Tuple] = []
+    with stage("rank_scan"):
+        for batch in iter_by_filter(filters, fields=[by], batch_size=batch_size):
+            for r in batch:
+                v = float(r.get(by) or 0.0)
+                if v <= 0:
+                    continue
+                item = (v if desc else -v, _Desc(r["product_id"]))
+                if len(heap) < n:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+    winners = [pk.value for _, pk in sorted(heap, reverse=True)]
+    return fetch_by_ids(winners, fields)
 
 # --- AGREGACIONES SIMPLES (min/máx/promedio) ---
 def aggregate_prices(filters: Optional[Dict]=None, by: Optional[Literal["store","category","country"]]=None) -> Dict:
@@ -124,7 +743,7 @@ def aggregate_prices(filters: Optional[Dict]=None, by: Optional[Literal["store",
     Calcula min/máx/avg de price, global o agrupado por 'store'/'category'/'country'.
     Se hace en Python sobre el resultado de list_by_filter (hasta 1000 filas).
     """
-    items = list_by_filter(filters, limit=1000)
+    items = list_by_filter(filters, limit=1000, fields=["price"] + ([by] if by else []))
     if not items:
         return {"groups": [], "total": 0}
 
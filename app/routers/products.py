@@ -6,5 +6,7 @@ router = APIRouter(prefix="/products", tags=["products"])
 
 @router.post("/list", response_model=ListResponse)
 def list_products(payload: ListRequest):
-    items = query_rows(country=payload.country, offset=payload.offset, limit=payload.limit)
-    return ListResponse(items=items, total=None)
+    items = query_rows(country=payload.country, offset=payload.offset,
+                       limit=payload.limit, cursor=payload.cursor)
+    next_cursor = items[-1]["id"] if items and len(items) == payload.limit else None
+    return ListResponse(items=items, total=None, next_cursor=next_cursor)
@@ -3,7 +3,6 @@ from fastapi.responses import StreamingResponse
 from app.schemas import AskRequest, AskResponse
 from app.services import rag as RAG
 from app.settings import get_settings
-import requests, json
 
 router = APIRouter(tags=["rag"])
 
@@ -29,16 +28,7 @@ def ask_stream(payload: AskRequest):
     prompt = RAG.build_prompt(payload.query, hits)
 
     def stream():
-        r = requests.post(f"{s.ollama_host}/api/generate",
-                          json={"model": s.gen_model, "prompt": prompt, "stream": True},
-                          stream=True)
-        r.raise_for_status()
-        for line in r.iter_lines():
-            if not line:
-                continue
-            chunk = json.loads(line.decode("utf-8"))
+        for chunk in RAG.stream_answer(prompt):
             if "response" in chunk:
                 yield f"data: {chunk['response']}\n\n"
-            if chunk.get("done"):
-                break
     return StreamingResponse(stream(), media_type="text/event-stream")
@@ -12,9 +12,11 @@ class AskResponse(BaseModel):
 
 class ListRequest(BaseModel):
     country: str | None = None
-    offset: int = 0
+    offset: int = 0  # obsoleto: preferir cursor (offset obliga a Milvus a escanear y descartar)
     limit: int = 50
+    cursor: str | None = None  # next_cursor de la página anterior
 
 class ListResponse(BaseModel):
     items: List[dict]
     total: int | None = None  # opcional (Milvus no devuelve total exacto sin truco)
+    next_cursor: str | None = None
@@ -1,7 +1,7 @@
 from pymilvus import Collection
 from app.settings import get_settings
 from app.db.milvus_client import ensure_collection
-import requests
+from app.llm_pool import get_pool
 
 def search_similar(query: str, top_k: int | None = None):
     s = get_settings()
@@ -25,9 +25,8 @@ def search_similar(query: str, top_k: int | None = None):
 
 def _embed_one(text: str) -> list[float]:
     s = get_settings()
-    r = requests.post(f"{s.ollama_host}/api/embeddings", json={"model": s.embed_model, "prompt": text})
-    r.raise_for_status()
-    return r.json()["embedding"]
+    pool = get_pool(s.ollama_hosts, s.ollama_host)
+    return pool.post_json("/api/embeddings", {"model": s.embed_model, "prompt": text}, model=s.embed_model)["embedding"]
 
 def build_prompt(question: str, evidence: list[dict]) -> str:
     if not evidence:
@@ -40,7 +39,12 @@ def build_prompt(question: str, evidence: list[dict]) -> str:
 
 def generate_answer(prompt: str) -> str:
     s = get_settings()
-    r = requests.post(f"{s.ollama_host}/api/generate",
-                      json={"model": s.gen_model, "prompt": prompt, "stream": False})
-    r.raise_for_status()
-    return r.json()["response"]
+    pool = get_pool(s.ollama_hosts, s.ollama_host)
+    return pool.post_json("/api/generate", {"model": s.gen_model, "prompt": prompt, "stream": False},
+                          model=s.gen_model)["response"]
+
+def stream_answer(prompt: str):
+    s = get_settings()
+    pool = get_pool(s.ollama_hosts, s.ollama_host)
+    yield from pool.stream_lines("/api/generate", {"model": s.gen_model, "prompt": prompt, "stream": True},
+                                 model=s.gen_model)
@@ -17,19 +17,81 @@ class Settings(BaseSettings):
 
     # Operación
     enable_admin_routes: bool = Field(default=False, alias="ENABLE_ADMIN_ROUTES")
+    # Con rutas admin: requests más lentos que esto quedan en /admin/slow (ring buffer en memoria)
+    slow_request_ms: float = Field(default=2000.0, alias="SLOW_REQUEST_MS")
+    slow_request_buffer: int = Field(default=200, alias="SLOW_REQUEST_BUFFER")
+    # Precarga en arranque (embedder, Milvus, Ollama); /ready pasa a 200 cuando termina.
+    # Sin PRELOAD la misma precarga arranca con la primera sonda a /ready
+    preload: bool = Field(default=False, alias="PRELOAD")
+    # Log JSONL de requests (replay con loadgen.py); vacío = desactivado
+    request_log_path: str = Field(default="", alias="REQUEST_LOG_PATH")
+    # Deadline por request (deadline.py) si no viene X-Request-Deadline-Ms ni `deadline_ms`; 0 = sin límite
+    request_deadline_s: float = Field(default=30.0, alias="REQUEST_DEADLINE_S")
 
     # Milvus
     milvus_host: str = Field(default="127.0.0.1", alias="MILVUS_HOST")
     milvus_port: int = Field(default=19530, alias="MILVUS_PORT")
     milvus_collection: str = Field(default="retail_products", alias="MILVUS_COLLECTION")
     milvus_dim: int = Field(default=768, alias="MILVUS_DIM")
+    milvus_timeout_s: float = Field(default=10.0, alias="MILVUS_TIMEOUT_S")  # tope por llamada gRPC
+
+    # Backend de lectura: "milvus" (gRPC) o "local" (réplica NumPy mmap, ver local_index.py)
+    search_backend: str = Field(default="milvus", alias="SEARCH_BACKEND")
+    local_index_path: str = Field(default="data/local_index", alias="LOCAL_INDEX_PATH")
+    local_index_nprobe: int = Field(default=0, alias="LOCAL_INDEX_NPROBE")  # 0 = búsqueda exacta
+    local_index_check_s: float = Field(default=10.0, alias="LOCAL_INDEX_CHECK_S")
+    # Dos etapas (coarse.py): "" = desactivado | binary | sq8 (sq8 solo con la réplica local; sobre
+    # Milvus se avisa una vez y se busca en una etapa)
+    coarse_search: str = Field(default="", alias="COARSE_SEARCH")
+    coarse_oversample: int = Field(default=10, alias="COARSE_OVERSAMPLE")  # candidatos = top_k * esto
+    coarse_rerank: str = Field(default="milvus", alias="COARSE_RERANK")  # milvus | local (vectores mmap)
+    # Índice léxico en proceso (lexical.py): product_id literal / nombre+marca+presentación sin embedding
+    lexical_search: bool = Field(default=True, alias="LEXICAL_SEARCH")
+    lexical_refresh_s: float = Field(default=60.0, alias="LEXICAL_REFRESH_S")  # sondeo last_seen; 0 = solo admin
+    lexical_min_terms: int = Field(default=2, alias="LEXICAL_MIN_TERMS")  # términos mínimos para ser decisivo
+    lexical_max_exact: int = Field(default=20, alias="LEXICAL_MAX_EXACT")  # más coincidencias => fusión RRF
+    lexical_rrf_k: int = Field(default=60, alias="LEXICAL_RRF_K")
+    # Cachés en proceso (caches.py); tamaño 0 = desactivada
+    retrieval_cache_size: int = Field(default=4096, alias="RETRIEVAL_CACHE_SIZE")
+    retrieval_cache_ttl_s: float = Field(default=900.0, alias="RETRIEVAL_CACHE_TTL_S")
+    answer_cache_size: int = Field(default=2048, alias="ANSWER_CACHE_SIZE")
+    answer_cache_ttl_s: float = Field(default=3600.0, alias="ANSWER_CACHE_TTL_S")
+    # Sin índice léxico ni réplica local la versión de datos (max last_seen) se sondea en Milvus;
+    # 0 = sin sondeo => versión desconocida => la caché de retrieval no se usa
+    data_version_check_s: float = Field(default=30.0, alias="DATA_VERSION_CHECK_S")
+    # Calentamiento desde el log de requests (warm.py): vacío => REQUEST_LOG_PATH; WARM_TOP_N=0 lo apaga
+    warm_log_path: str = Field(default="", alias="WARM_LOG_PATH")
+    warm_top_n: int = Field(default=100, alias="WARM_TOP_N")
+    warm_max_lines: int = Field(default=200_000, alias="WARM_MAX_LINES")  # solo la cola del log
+    warm_budget_s: float = Field(default=120.0, alias="WARM_BUDGET_S")  # tope por pasada (acota /ready)
+    warm_check_s: float = Field(default=60.0, alias="WARM_CHECK_S")  # sondeo de cambios en el catálogo
 
     # Modelos (Ollama / Embeddings)
     ollama_host: str = Field(default="http://127.0.0.1:11434", alias="OLLAMA_HOST")
+    # Varios backends (llm_pool.py): "http://a:11434=phi3:mini|llama3,http://b:11434"; vacío => OLLAMA_HOST
+    ollama_hosts: str = Field(default="", alias="OLLAMA_HOSTS")
     embed_backend: str = Field(default="hf", alias="EMBED_BACKEND")
     embed_model: str = Field(default="intfloat/multilingual-e5-base", alias="EMBED_MODEL")
+    embed_runtime: str = Field(default="torch", alias="EMBED_RUNTIME")  # torch | int8 | onnx
+    embed_model_path: str = Field(default="", alias="EMBED_MODEL_PATH")  # copia/export local
+    # Unix socket del sidecar de embeddings (embed_server.py); vacío = modelo en cada proceso
+    embed_socket: str = Field(default="", alias="EMBED_SOCKET")
     gen_model: str = Field(default="phi3:mini", alias="GEN_MODEL")
     abstain_threshold: float = Field(default=0.35, alias="ABSTAIN_THRESHOLD")
+    # Scheduler del LLM (llm_sched.py): slots y presupuesto de espera por clase de request
+    llm_max_concurrency: int = Field(default=2, alias="LLM_MAX_CONCURRENCY")
+    llm_queue_budget_s: float = Field(default=15.0, alias="LLM_QUEUE_BUDGET_S")
+    llm_batch_queue_budget_s: float = Field(default=120.0, alias="LLM_BATCH_QUEUE_BUDGET_S")
+    # Estimación inicial de velocidad del LLM (se ajusta con eval_count/eval_duration de Ollama):
+    # num_predict se recorta a lo que alcanza a generar en el tiempo restante del deadline.
+    # Hasta la primera medición (warm() o una llamada) solo recorta; saltar el LLM requiere haber medido
+    llm_tokens_per_s: float = Field(default=10.0, alias="LLM_TOKENS_PER_S")
+    llm_ttft_s: float = Field(default=1.0, alias="LLM_TTFT_S")
+    llm_min_tokens: int = Field(default=24, alias="LLM_MIN_TOKENS")  # menos => no vale la pena llamar
+    # Respuesta por plantilla (sin LLM) cuando el top-1 es inequívoco
+    template_answers: bool = Field(default=True, alias="TEMPLATE_ANSWERS")
+    template_min_score: float = Field(default=0.55, alias="TEMPLATE_MIN_SCORE")
+    template_margin: float = Field(default=0.05, alias="TEMPLATE_MARGIN")  # top1 - top2 (top1 - SIM_TH con un solo hit)
     top_k: int = Field(default=5, alias="TOP_K")
 
     # Busca .env en app/.env y en la raíz ../.env
@@ -0,0 +1,282 @@
+# stubs.py — Backends falsos (Milvus, embeddings, Ollama) para correr la API offline
+# Uso típico: loadgen.py --offline  (capacidad/latencia reproducible en un portátil)
+#
+# - StubEncoder:    embeddings deterministas por hashing de palabras (sin torch)
+# - StubCollection: imita Collection.search/query/query_iterator sobre filas del CSV
+# - FakeOllama:     servidor HTTP local con /api/generate (stream y no-stream) y /api/embeddings
+
+import json, re, time, threading, unicodedata, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+def _norm(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", (s or "").lower())
+                   if unicodedata.category(c) != "Mn")
+
+_WORD = re.compile(r"\w+")
+_PREFIX = re.compile(r"^(query|passage):\s*")
+
+# -----------------------------------------------------------------------------
+# Embeddings
+# -----------------------------------------------------------------------------
+class StubEncoder:
+    """Bag-of-words con hashing a `dim` dimensiones. Misma interfaz que SentenceTransformer.encode()."""
+
+    def __init__(self, dim: int = 768, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+
+    def _vec(self, text: str) -> np.ndarray:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for w in _WORD.findall(_norm(_PREFIX.sub("", text))):
+            h = zlib.crc32(w.encode("utf-8"))
+            v[h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return v
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **_) -> np.ndarray:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        m = np.stack([self._vec(t) for t in texts]) if texts else np.zeros((0, self.dim), np.float32)
+        if normalize_embeddings:
+            n = np.linalg.norm(m, axis=1, keepdims=True)
+            m = m / np.where(n == 0, 1.0, n)
+        return m
+
+# -----------------------------------------------------------------------------
+# Milvus
+# -----------------------------------------------------------------------------
+class _Entity(dict):
+    pass
+
+class _Hit:
+    def __init__(self, pk, distance: float, entity: Dict):
+        self.id = pk
+        self.distance = distance
+        self.entity = _Entity(entity)
+
+def _compile_expr(expr: Optional[str]):
+    """Las expresiones que genera retrieve.py (==, >, in [...], and/or) son Python válido."""
+    if not expr:
+        return None
+    return compile(expr, "<expr>", "eval")
+
+class _StubQueryIterator:
+    def __init__(self, rows: List[Dict], batch_size: int):
+        self._rows = rows
+        self._bs = batch_size
+        self._pos = 0
+
+    def next(self) -> List[Dict]:
+        out = self._rows[self._pos:self._pos + self._bs]
+        self._pos += len(out)
+        return out
+
+    def close(self) -> None:
+        pass
+
+class StubCollection:
+    """Colección en memoria con la API mínima que usa retrieve.py."""
+
+    def __init__(self, rows: List[Dict], encoder: StubEncoder, search_ms: float = 0.0, query_ms: float = 0.0):
+        self.rows = sorted(rows, key=lambda r: r["product_id"])  # Milvus ordena query() por PK
+        self.search_ms = search_ms
+        self.query_ms = query_ms
+        # el stub indexa nombre/marca/categoría: las preguntas sintéticas se parecen a eso
+        self.vectors = encoder.encode(
+            [f"{r['name']} {r['brand']} {r['category']}" for r in self.rows], normalize_embeddings=True
+        )
+        for r, v in zip(self.rows, self.vectors):
+            r["vector"] = v  # query(output_fields=["vector"]) como en Milvus (re-rank exacto)
+
+    def load(self, *_, **__) -> None:
+        pass
+
+    def _match(self, expr: Optional[str]) -> List[int]:
+        code = _compile_expr(expr)
+        if code is None:
+            return list(range(len(self.rows)))
+        return [i for i, r in enumerate(self.rows) if eval(code, {"__builtins__": {}}, dict(r))]
+
+    @staticmethod
+    def _project(r: Dict, fields: Optional[Iterable[str]]) -> Dict:
+        keys = ["product_id", *(fields or [])]
+        return {k: r.get(k) for k in dict.fromkeys(keys)}
+
+    def search(self, data, anns_field: str, param: Dict, limit: int, expr: Optional[str] = None,
+               output_fields: Optional[List[str]] = None, **_) -> List[List[_Hit]]:
+        if self.search_ms:
+            time.sleep(self.search_ms / 1000.0)
+        idx = np.asarray(self._match(expr), dtype=np.int64)
+        params = (param or {}).get("params", {})
+        radius, range_filter = params.get("radius"), params.get("range_filter")
+        out = []
+        for q in np.asarray(data, dtype=np.float32):
+            if not len(idx):
+                out.append([])
+                continue
+            scores = self.vectors[idx] @ q
+            order = np.argsort(-scores)
+            hits = []
+            for j in order:
+                s = float(scores[j])
+                if radius is not None and s <= radius:
+                    break
+                if range_filter is not None and s > range_filter:
+                    continue
+                r = self.rows[int(idx[j])]
+                hits.append(_Hit(r["product_id"], s, self._project(r, output_fields)))
+                if len(hits) >= limit:
+                    break
+            out.append(hits)
+        return out
+
+    def query(self, expr: str = "", output_fields: Optional[List[str]] = None, limit: int = 16384,
+              offset: int = 0, **_) -> List[Dict]:
+        if self.query_ms:
+            time.sleep(self.query_ms / 1000.0)
+        idx = self._match(expr)[offset:offset + limit]
+        return [self._project(self.rows[i], output_fields) for i in idx]
+
+    def query_iterator(self, batch_size: int = 1000, limit: int = -1, expr: Optional[str] = None,
+                       output_fields: Optional[List[str]] = None, **_) -> _StubQueryIterator:
+        idx = self._match(expr)
+        if limit is not None and limit >= 0:
+            idx = idx[:limit]
+        return _StubQueryIterator([self._project(self.rows[i], output_fields) for i in idx], batch_size)
+
+def install(csv_paths: List[str], dim: int = 768, embed_ms: float = 0.0,
+            search_ms: float = 0.0, query_ms: float = 0.0) -> StubCollection:
+    """Reemplaza modelo y colección de retrieve.py por los stubs (mismo proceso)."""
+    import retrieve
+    from ingest import read_csv_rows
+
+    rows: List[Dict] = []
+    for p in csv_paths:
+        rows.extend(read_csv_rows(p))
+    encoder = StubEncoder(dim=dim, latency_ms=embed_ms)
+    col = StubCollection(rows, StubEncoder(dim=dim), search_ms=search_ms, query_ms=query_ms)
+    retrieve._model = encoder
+    retrieve._col = col
+    return col
+
+# -----------------------------------------------------------------------------
+# Ollama
+# -----------------------------------------------------------------------------
+_CTX_LINE = re.compile(r"^\[([^\]]+)\]\s*(.*)$", re.M)
+
+def fake_plan(message: str) -> Dict:
+    nt = _norm(message)
+    if " vs " in nt or "compara" in nt:
+        parts = re.split(r"\s+vs\s+", message, maxsplit=1)
+        a, b = (parts + [None])[:2]
+        return {"intent": "compare", "filters": {}, "product_name": a, "product_name_b": b}
+    if "mas barat" in nt:
+        return {"intent": "cheapest", "filters": {}}
+    if re.search(r"\bmas car[oa]s?\b", nt):
+        return {"intent": "priciest", "filters": {}}
+    if any(w in nt for w in ("promedio", "minimo", "maximo")):
+        return {"intent": "aggregate", "filters": {}}
+    if any(w in nt for w in ("cuantos", "cuantas", "cantidad")):
+        return {"intent": "count", "filters": {}}
+    if any(w in nt for w in ("lista", "muestra", "dame todos", "ensename")):
+        return {"intent": "list", "filters": {}}
+    return {"intent": "lookup", "filters": {}}
+
+def fake_answer(prompt: str) -> str:
+    if prompt.rstrip().endswith("Plan:"):  # prompt del planner
+        m = re.findall(r"Usuario: (.*)", prompt)
+        return json.dumps(fake_plan(m[-1] if m else ""), ensure_ascii=False)
+    ctx = prompt.split("CONTEXTO:", 1)[-1]
+    m = _CTX_LINE.search(ctx)
+    if not m:
+        return "No tengo esa información en la base"
+    return f"Según la base, {m.group(2).split('|')[0].strip()} está disponible [{m.group(1)}]."
+
+class _OllamaHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/0.1"
+    protocol_version = "HTTP/1.1"  # streaming con Transfer-Encoding: chunked, como Ollama
+
+    def log_message(self, *_):  # silencioso
+        pass
+
+    def _send_json(self, obj: Dict, code: int = 200) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            return self._send_json({"models": [{"name": m} for m in self.server.models]})
+        self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(n) or b"{}")
+        srv = self.server
+        if srv.fail_rate and np.random.random() < srv.fail_rate:
+            return self._send_json({"error": "fake failure"}, 500)
+        if self.path == "/api/embeddings":
+            vec = srv.encoder.encode([req.get("prompt", "")], normalize_embeddings=False)[0]
+            return self._send_json({"embedding": vec.tolist()})
+        if self.path != "/api/generate":
+            return self._send_json({"error": "not found"}, 404)
+
+        words = fake_answer(req.get("prompt", "")).split(" ")
+        limit = int((req.get("options") or {}).get("num_predict") or len(words))
+        words = words[:max(1, limit)]
+        per_token = 1.0 / srv.tokens_per_s if srv.tokens_per_s else 0.0
+        # mismas estadísticas (ns) que reporta Ollama al terminar: OllamaLLM estima velocidad con ellas
+        stats = {"eval_count": len(words), "eval_duration": int(per_token * len(words) * 1e9) or 1,
+                 "prompt_eval_duration": int(srv.ttft_ms * 1e6)}
+        time.sleep(srv.ttft_ms / 1000.0)
+        if not req.get("stream"):
+            time.sleep(per_token * len(words))
+            return self._send_json({"model": req.get("model"), "response": " ".join(words), "done": True, **stats})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, w in enumerate(words):
+            time.sleep(per_token)
+            tok = w if i == 0 else " " + w
+            self._chunk(json.dumps({"response": tok, "done": False}) + "\n")
+        self._chunk(json.dumps({"response": "", "done": True, **stats}) + "\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, line: str) -> None:
+        data = line.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+class FakeOllama:
+    """Servidor Ollama falso en un hilo. `url` queda listo para OLLAMA_HOST."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, ttft_ms: float = 200.0,
+                 tokens_per_s: float = 20.0, fail_rate: float = 0.0, models: Optional[List[str]] = None):
+        self.httpd = ThreadingHTTPServer((host, port), _OllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.ttft_ms = ttft_ms
+        self.httpd.tokens_per_s = tokens_per_s
+        self.httpd.fail_rate = fail_rate
+        self.httpd.models = models or ["phi3:mini"]
+        self.httpd.encoder = StubEncoder()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
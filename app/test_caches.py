@@ -0,0 +1,76 @@
+# test_caches.py — TTLCache: hit/miss, versión de datos (stale/retag), TTL y LRU
+#   cd app && python -m pytest -q test_caches.py
+
+import caches
+from caches import TTLCache
+
+def test_disabled_cache_never_stores():
+    c = TTLCache("t", 0, 60)
+    c.put("k", 1)
+    assert not c.enabled
+    assert c.get("k") is None
+
+def test_hit_and_miss():
+    c = TTLCache("t", 4, 60)
+    assert c.get("k", version=3) is None
+    c.put("k", "v", version=3)
+    assert c.get("k", version=3) == "v"
+    assert c.get("k", version=2) == "v"  # datos más nuevos que lo pedido: se sirve
+
+def test_stale_entry_kept_until_retag():
+    c = TTLCache("t", 4, 60)
+    c.put("k", "v", version=1)
+    assert c.get("k", version=2) is None
+    assert c.stale(2) == [("k", "v", 1)]
+    assert c.stale(1) == []
+    c.retag("k", 2)
+    assert c.get("k", version=2) == "v"
+    assert c.stale(2) == []
+
+def test_retag_keeps_original_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(caches.time, "monotonic", lambda: now[0])
+    c = TTLCache("t", 4, 10)
+    c.put("k", "v", version=1)
+    now[0] = 108.0
+    c.retag("k", 2)
+    now[0] = 111.0
+    assert c.get("k", version=2) is None
+    assert c.stats()["size"] == 0
+
+def test_ttl_expiry(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(caches.time, "monotonic", lambda: now[0])
+    c = TTLCache("t", 4, 5)
+    c.put("k", "v")
+    now[0] = 5.0
+    assert c.get("k") == "v"
+    now[0] = 5.1
+    assert c.get("k") is None
+
+def test_ttl_zero_never_expires(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(caches.time, "monotonic", lambda: now[0])
+    c = TTLCache("t", 4, 0)
+    c.put("k", "v")
+    now[0] = 1e9
+    assert c.get("k") == "v"
+
+def test_lru_evicts_least_recently_used():
+    c = TTLCache("t", 2, 60)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1  # "b" pasa a ser el menos usado
+    c.put("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+
+def test_discard_and_clear():
+    c = TTLCache("t", 4, 60)
+    c.put("a", 1)
+    c.put("b", 2)
+    c.discard("a")
+    c.discard("missing")
+    assert c.get("a") is None and c.get("b") == 2
+    c.clear()
+    assert c.stats() == {"size": 0, "capacity": 4, "ttl_s": 60}
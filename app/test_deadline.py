@@ -0,0 +1,101 @@
+# test_deadline.py — Reglas del deadline: header vs body (override), budget() y guard()
+#   cd app && python -m pytest -q test_deadline.py
+
+import contextvars
+
+import pytest
+
+import deadline
+from deadline import DeadlineExceeded
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(deadline.time, "monotonic", lambda: now[0])
+    return now
+
+def _in_ctx(fn):
+    # cada test en un contexto limpio, como un request nuevo
+    return contextvars.copy_context().run(fn)
+
+def test_no_deadline():
+    def run():
+        deadline._current.set(None)
+        assert deadline.remaining() is None
+        assert not deadline.expired()
+        assert deadline.budget(3.0, "milvus") == 3.0
+        assert deadline.budget(None, "milvus") is None
+    _in_ctx(run)
+
+def test_start_without_budget_is_unlimited(clock):
+    def run():
+        deadline.start(None)
+        assert deadline.remaining() is None
+        deadline.start(0)
+        assert deadline.remaining() is None
+    _in_ctx(run)
+
+def test_body_override_replaces_default(clock):
+    def run():
+        deadline.start(2.0)  # default REQUEST_DEADLINE_S
+        deadline.override(5.0)  # el body puede alargarlo
+        assert deadline.remaining() == pytest.approx(5.0)
+        deadline.override(1.0)  # ...y un segundo override (ya explícito) solo acortarlo
+        assert deadline.remaining() == pytest.approx(1.0)
+        deadline.override(4.0)
+        assert deadline.remaining() == pytest.approx(1.0)
+    _in_ctx(run)
+
+def test_body_override_only_shortens_header(clock):
+    def run():
+        deadline.start(2.0, explicit=True)  # X-Request-Deadline-Ms
+        deadline.override(5.0)
+        assert deadline.remaining() == pytest.approx(2.0)
+        deadline.override(0.5)
+        assert deadline.remaining() == pytest.approx(0.5)
+    _in_ctx(run)
+
+def test_override_counts_from_request_start(clock):
+    def run():
+        deadline.start(None)
+        clock[0] += 0.3
+        deadline.override(1.0)
+        assert deadline.remaining() == pytest.approx(0.7)
+    _in_ctx(run)
+
+def test_override_without_deadline_starts_one(clock):
+    def run():
+        deadline._current.set(None)
+        deadline.override(None)
+        assert deadline.remaining() is None
+        deadline.override(1.5)
+        assert deadline.remaining() == pytest.approx(1.5)
+        assert deadline._current.get().explicit
+    _in_ctx(run)
+
+def test_budget_caps_and_raises(clock):
+    def run():
+        deadline.start(1.0)
+        assert deadline.budget(5.0, "llm") == pytest.approx(1.0)
+        assert deadline.budget(0.2, "llm") == pytest.approx(0.2)
+        assert deadline.budget(None, "llm") == pytest.approx(1.0)
+        clock[0] += 1.0
+        assert deadline.expired()
+        with pytest.raises(DeadlineExceeded) as e:
+            deadline.budget(5.0, "milvus")
+        assert e.value.stage == "milvus"
+    _in_ctx(run)
+
+def test_guard_translates_only_when_expired(clock):
+    def run():
+        deadline.start(1.0)
+        with pytest.raises(TimeoutError):
+            with deadline.guard("milvus"):
+                raise TimeoutError("grpc")
+        clock[0] += 2.0
+        with pytest.raises(DeadlineExceeded) as e:
+            with deadline.guard("milvus"):
+                raise TimeoutError("grpc")
+        assert e.value.stage == "milvus"
+        assert isinstance(e.value.__cause__, TimeoutError)
+    _in_ctx(run)
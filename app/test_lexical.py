@@ -0,0 +1,104 @@
+# test_lexical.py — Índice BM25 en proceso: normalización de presentaciones y merge incremental
+#   cd app && python -m pytest -q test_lexical.py
+
+import lexical
+from lexical import LexicalIndex, size_token, tokenize
+
+def _row(pk, name, brand="", size=None, unit=None, store="Líder", last_seen=1, **kw):
+    return {"product_id": pk, "name": name, "brand": brand, "size": size, "unit": unit,
+            "country": "CL", "category": "Despensa", "store": store, "last_seen": last_seen, **kw}
+
+# ----------------------------------------------------------------------------
+# Presentación en unidad base
+# ----------------------------------------------------------------------------
+def test_size_token_base_units():
+    assert size_token(900, "g") == "0.9kg"
+    assert size_token(1, "lt") == "1l"
+    assert size_token("500", "ml") == "0.5l"
+    assert size_token(6, "Un.") == "6unit"
+
+def test_size_token_rejects_unknown_or_empty():
+    assert size_token(1, "caja") is None
+    assert size_token(None, "g") is None
+    assert size_token(0, "kg") is None
+    assert size_token("x", "kg") is None
+
+def test_tokenize_size_variants_match():
+    # "900 g" == "900g" == "0,9 kg" == "0.9kg"
+    for q in ("arroz 900 g", "arroz 900g", "arroz 0,9 kg", "Arroz 0.9KG"):
+        assert tokenize(q) == ["arroz", "0.9kg"], q
+
+def test_tokenize_drops_stopwords_and_accents():
+    assert tokenize("¿Cuánto cuesta el café Nescafé?") == ["cafe", "nescafe"]
+
+# ----------------------------------------------------------------------------
+# merge: altas, actualizaciones, duplicados en el lote
+# ----------------------------------------------------------------------------
+def test_merge_empty_batch_returns_same_index():
+    idx = LexicalIndex.empty()
+    assert idx.merge([[]]) is idx
+
+def test_merge_upsert_replaces_old_tokens():
+    idx = LexicalIndex.empty().merge([[_row("A1", "Arroz grado 1", "Tucapel", 1, "kg"),
+                                      _row("B1", "Fideos spaghetti", "Carozzi", 400, "g")]])
+    assert idx.n == 2
+    assert idx.lookup("arroz tucapel", None, 5).hits[0][0] == "A1"
+
+    # A1 cambia de nombre: los términos viejos ya no lo encuentran
+    idx2 = idx.merge([[_row("A1", "Arroz integral", "Miraflores", 1, "kg", last_seen=5)]])
+    assert idx2.n == 2
+    assert idx2.max_last_seen == 5
+    assert idx2.lookup("tucapel", None, 5).hits == []
+    assert [pk for pk, _ in idx2.lookup("arroz miraflores", None, 5).hits] == ["A1"]
+    assert [pk for pk, _ in idx2.lookup("carozzi", None, 5).hits] == ["B1"]
+    # el índice anterior es inmutable
+    assert idx.lookup("arroz tucapel", None, 5).hits[0][0] == "A1"
+
+def test_merge_duplicate_in_batch_keeps_last():
+    idx = LexicalIndex.empty().merge([[_row("A1", "Leche entera", "Colun")],
+                                      [_row("A1", "Leche descremada", "Soprole")]])
+    assert idx.n == 1
+    assert idx.lookup("colun", None, 5).hits == []
+    assert idx.lookup("soprole", None, 5).hits[0][0] == "A1"
+
+def test_lookup_decisive_and_literal_pk():
+    idx = LexicalIndex.empty().merge([[_row("A1", "Arroz grado 1", "Tucapel", 900, "g"),
+                                      _row("A2", "Arroz grado 2", "Tucapel", 1, "kg")]])
+    r = idx.lookup("precio arroz tucapel 900 g", None, 5)
+    assert r.decisive and [pk for pk, _ in r.hits] == ["A1"]
+    r = idx.lookup("A2", None, 5)
+    assert r.decisive and r.hits == [("A2", 1.0)]
+
+def test_lookup_filters_by_store():
+    idx = LexicalIndex.empty().merge([[_row("A1", "Aceite maravilla", "Chef", store="Líder"),
+                                      _row("A2", "Aceite maravilla", "Chef", store="Jumbo")]])
+    hits = idx.lookup("aceite chef", {"store_norm": "jumbo"}, 5).hits
+    assert [pk for pk, _ in hits] == ["A2"]
+    assert idx.lookup("aceite chef", {"store_norm": "unimarc"}, 5).hits == []
+
+# ----------------------------------------------------------------------------
+# refresh: incremental por last_seen; las bajas solo con full=True
+# ----------------------------------------------------------------------------
+def test_refresh_incremental_and_full_drops_deleted(monkeypatch):
+    monkeypatch.setattr(lexical, "_index", None)
+    catalog = {"A1": _row("A1", "Azúcar granulada", "Iansa", 1, "kg", last_seen=1),
+               "B1": _row("B1", "Sal de mar", "Lobos", 1, "kg", last_seen=1)}
+    calls = []
+
+    def source(since):
+        calls.append(since)
+        yield [r for r in catalog.values() if since is None or r["last_seen"] > since]
+
+    assert lexical.refresh(source).n == 2
+    catalog["C1"] = _row("C1", "Harina sin polvos", "Selecta", 1, "kg", last_seen=2)
+    del catalog["B1"]
+    idx = lexical.refresh(source)
+    assert calls == [None, 1]
+    assert idx.n == 3  # la baja de B1 no llega por last_seen
+    assert idx.lookup("lobos", None, 5).hits[0][0] == "B1"
+
+    idx = lexical.refresh(source, full=True)
+    assert calls[-1] is None
+    assert idx.n == 2
+    assert idx.lookup("lobos", None, 5).hits == []
+    assert idx.lookup("harina selecta", None, 5).hits[0][0] == "C1"
@@ -0,0 +1,45 @@
+# textnorm.py — Normalizaciones compartidas entre ingesta (se guardan como columnas) y lectura
+#   fold()        minúsculas + sin tildes  -> name_norm / brand_norm / store_norm
+#   sanitize()    limpia canonical_text (anti prompt-injection) una vez al escribir
+#   unit_price()  precio por kg / L / unidad a partir de price + size + unit
+#   add_derived() las columnas derivadas de una fila (ingesta, o réplica local de una colección antigua)
+
+import re, unicodedata
+from typing import Dict, Optional, Tuple
+
+# Columnas que se calculan en ingesta; las colecciones creadas antes no las tienen
+DERIVED_FIELDS = ("name_norm", "brand_norm", "store_norm", "unit_price", "unit_base")
+
+def fold(s: Optional[str]) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", (s or "").lower())
+                   if unicodedata.category(c) != "Mn")
+
+_INJECTION = re.compile(r"(?i)(ignore|override|disregard).*")
+
+def sanitize(text: Optional[str]) -> str:
+    text = text or ""
+    text = _INJECTION.sub("", text)
+    return text.replace("```", "").strip()
+
+# unidad del feed -> (unidad base, factor a la base)
+UNIT_FACTORS = {
+    "kg": ("kg", 1.0), "g": ("kg", 1e-3), "gr": ("kg", 1e-3), "mg": ("kg", 1e-6), "lb": ("kg", 0.45359237),
+    "l": ("L", 1.0), "lt": ("L", 1.0), "ml": ("L", 1e-3), "cl": ("L", 1e-2), "cc": ("L", 1e-3),
+    "un": ("unit", 1.0), "und": ("unit", 1.0), "unid": ("unit", 1.0), "unidad": ("unit", 1.0),
+    "unidades": ("unit", 1.0), "unit": ("unit", 1.0), "u": ("unit", 1.0), "pack": ("unit", 1.0),
+}
+
+def unit_price(price: float, size: float, unit: Optional[str]) -> Tuple[float, str]:
+    """(precio por unidad base, unidad base). 0.0 y "" si la presentación no es convertible."""
+    base = UNIT_FACTORS.get(fold(unit).strip().rstrip("."))
+    if not base or not size or size <= 0 or price is None:
+        return 0.0, ""
+    qty = size * base[1]
+    return round(float(price) / qty, 4), base[0]
+
+def add_derived(r: Dict) -> Dict:
+    """Columnas que la lectura usa directo: filtros sin tildes y precio por kg/L/unidad."""
+    for f in ("name", "brand", "store"):
+        r[f"{f}_norm"] = fold(r.get(f))
+    r["unit_price"], r["unit_base"] = unit_price(r.get("price"), r.get("size"), r.get("unit"))
+    return r
@@ -0,0 +1,140 @@
+# warm.py — Calentamiento de cachés desde el log de requests (REQUEST_LOG_PATH, formato de loadgen.py)
+# Tras un deploy, un reinicio o la ingesta nocturna las cachés están vacías (o viejas) y la primera
+# ola de preguntas populares paga embedding + Milvus + LLM a la vez. Aquí:
+#   1. mine(): las WARM_TOP_N preguntas más frecuentes (normalizadas con fold) con su combinación
+#      de filtros, de /ask, /chat y /search (las variantes stream cuentan como su versión JSON)
+#   2. revalidación: entradas de retrieval llenadas antes del último cambio del catálogo vuelven a
+#      servirse si el last_seen de su evidencia no cambió; si cambió, se descartan
+#   3. se re-ejecutan por el pipeline real (retrieve + plantilla/LLM) como clase batch: quedan en las
+#      cachés de embeddings, retrieval y respuestas
+# La primera pasada es un paso del warmup (/ready espera, acotada por WARM_BUDGET_S); después un hilo
+# repite 2-3 cuando avanza la versión de datos (nueva ingesta). POST /admin/warm lo fuerza.
+
+import json, os, threading, time
+from collections import Counter as _Counter, deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from llm_sched import request_class
+from metrics import Counter
+from textnorm import fold
+
+WARM_RUNS = Counter("rag_cache_warm_total", "Requests re-ejecutados por el calentamiento", labels=("kind", "result"))
+
+# endpoint del log -> tipo de runner
+KINDS = {"/ask": "ask", "/ask/stream": "ask", "/chat": "chat", "/chat/stream": "chat", "/search": "search"}
+
+class WarmItem(NamedTuple):
+    kind: str
+    payload: Dict
+    count: int
+
+def normalize(text: Optional[str]) -> str:
+    return " ".join(fold(text).split()).strip(" ?¿!¡.")
+
+def _items(endpoint: str, p: Dict) -> List[Tuple[Tuple, Dict]]:
+    """(clave de agrupación, payload representativo) por request del log."""
+    kind = KINDS.get(endpoint)
+    flt = json.dumps(p.get("filters") or {}, sort_keys=True, default=str)
+    if kind == "ask" and p.get("question"):
+        return [((kind, normalize(p["question"]), flt, p.get("top_k")),
+                 {"question": p["question"], "filters": p.get("filters"), "top_k": p.get("top_k")})]
+    if kind == "chat" and p.get("message"):
+        return [((kind, normalize(p["message"]), p.get("limit")), {"message": p["message"], "limit": p.get("limit", 100)})]
+    if kind == "search":
+        fields = tuple(p.get("fields") or ())
+        return [((kind, normalize(q), flt, p.get("top_k"), fields),
+                 {"queries": [q], "filters": p.get("filters"), "top_k": p.get("top_k"), "fields": p.get("fields")})
+                for q in p.get("queries") or [] if q]
+    return []
+
+def mine(path: str, top_n: int, max_lines: int = 200_000) -> List[WarmItem]:
+    """Top-N por frecuencia en la cola del log; solo requests que respondieron 200."""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        tail = deque(f, maxlen=max(1, max_lines))
+    counts: _Counter = _Counter()
+    sample: Dict[Tuple, Dict] = {}
+    for line in tail:
+        try:
+            d = json.loads(line)
+        except ValueError:
+            continue
+        if d.get("status", 200) != 200 or not isinstance(d.get("payload"), dict):
+            continue
+        for key, payload in _items(d.get("endpoint", ""), d["payload"]):
+            counts[key] += 1
+            sample[key] = payload  # la variante más reciente
+    return [WarmItem(key[0], sample[key], n) for key, n in counts.most_common(top_n)]
+
+class CacheWarmer:
+    def __init__(self, runners: Dict[str, Callable[[Dict], object]], version: Callable[[], Optional[int]],
+                 revalidate: Callable[[], Dict], log_path: str, top_n: int = 100,
+                 max_lines: int = 200_000, budget_s: float = 120.0, check_s: float = 60.0):
+        self.runners = runners
+        self.version = version
+        self.revalidate = revalidate
+        self.log_path = log_path
+        self.top_n = top_n
+        self.max_lines = max_lines
+        self.budget_s = budget_s
+        self.check_s = check_s
+        self.last_version: Optional[int] = None
+        self.last_report: Dict = {}
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict:
+        """Una pasada completa; nunca lanza por un request individual (cuenta errores)."""
+        with self._run_lock:
+            request_class.set("batch")  # hilo propio: no compite con el tráfico interactivo en la cola del LLM
+            t0 = time.perf_counter()
+            version = self.version()
+            report = {"version": version, "revalidated": {}, "mined": 0, "ok": 0, "errors": 0, "skipped": 0}
+            try:
+                report["revalidated"] = self.revalidate()
+            except Exception as e:
+                print(f"[warm] revalidación falló: {e!r}")
+            items = mine(self.log_path, self.top_n, self.max_lines)
+            report["mined"] = len(items)
+            for it in items:
+                if self.budget_s and time.perf_counter() - t0 > self.budget_s:
+                    report["skipped"] += 1
+                    continue
+                try:
+                    self.runners[it.kind](it.payload)
+                    report["ok"] += 1
+                    WARM_RUNS.inc(kind=it.kind, result="ok")
+                except Exception as e:
+                    report["errors"] += 1
+                    WARM_RUNS.inc(kind=it.kind, result="error")
+                    print(f"[warm] {it.kind} {it.payload!r} falló: {e!r}")
+            report["seconds"] = round(time.perf_counter() - t0, 3)
+            self.last_version, self.last_report = version, report
+            print(f"[warm] {report['ok']}/{report['mined']} requests en {report['seconds']}s "
+                  f"(errores={report['errors']}, fuera de presupuesto={report['skipped']}, "
+                  f"revalidación={report['revalidated']})")
+            return report
+
+    def _loop(self, initial: bool) -> None:
+        wait = 0.0 if initial else self.check_s
+        while not self._stop.wait(wait):
+            wait = self.check_s
+            try:
+                v = self.version()
+                if not self.last_report or (v is not None and (self.last_version is None or v > self.last_version)):
+                    self.run_once()
+            except Exception as e:
+                print(f"[warm] pasada falló: {e!r}")
+
+    def start(self, initial: bool = True) -> None:
+        """Hilo de fondo; initial=False si la primera pasada ya corre en el warmup."""
+        if self._thread is None and self.check_s > 0:
+            self._thread = threading.Thread(target=self._loop, args=(initial,), name="cache-warm", daemon=True)
+            self._thread.start()
+        elif self._thread is None and initial:
+            threading.Thread(target=self.run_once, name="cache-warm", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()